@@ -1,14 +1,34 @@
+import asyncio
 import json
 import logging
-from typing import List, Dict, Any
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import Deque, Dict, Any, Optional, Tuple, Union
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import uvicorn
 
-from llm_service import get_text_suggestions, cost_tracker
+from llm_service import (
+    get_text_suggestions, stream_text_suggestions, cost_tracker, close_llm,
+    suggestion_flights, upstream_scheduler, record_accepted_suggestion, usage_totals
+)
+from model_router import model_router
+from circuit_breaker import circuit_breaker, STATE_VALUES
+from semantic_cache import semantic_cache
+from usage_feed import usage_feed
+from speculation import speculative_prefetcher
+from ngram_model import local_completer
+from token_counter import token_counter
+from suggestion_cache import suggestion_cache
+from spell_checker import SpellCheckSession, spell_batcher
+from text_buffer import DocumentTooLargeError, GapBuffer, apply_edits
+from warmup import warmup
+from wire_codec import BINARY_PROTOCOL, negotiate, encode_frame, decode_frame, frame_bytes
+from metrics import metrics_registry, stage_timer, observe_stage, loop_lag_monitor, sampling_profiler
 import config
 
 # Configure logging
@@ -20,36 +40,321 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Real-Time Text Suggestions")
 
+# WebSocket transport settings for uvicorn: heartbeat pings drop dead peers, and frames
+# larger than the biggest message a client may send are refused before they are buffered
+UVICORN_WS_SETTINGS = {
+    "ws_ping_interval": config.WS_PING_INTERVAL,
+    "ws_ping_timeout": config.WS_PING_TIMEOUT,
+    "ws_max_size": config.WS_MAX_MESSAGE_BYTES,
+    "ws_per_message_deflate": config.WS_PER_MESSAGE_DEFLATE
+}
+
+# Close code sent to connections closed for inactivity; clients reconnect when the user types again
+IDLE_CLOSE_CODE = 4001
+
+class Connection:
+    """One WebSocket connection: its suggestion state and the frames waiting to be sent"""
+    
+    __slots__ = ("websocket", "client_ip", "protocol", "pending_task", "last_suggestion",
+                 "queue", "next_seq", "wakeup", "writer")
+    
+    def __init__(self, websocket: WebSocket, client_ip: str, protocol: Optional[str]):
+        self.websocket = websocket
+        self.client_ip = client_ip
+        # Negotiated subprotocol; None and JSON_PROTOCOL both mean JSON frames
+        self.protocol = protocol
+        # Latest in-flight suggestion task ("latest wins")
+        self.pending_task: Optional[asyncio.Task] = None
+        # Document length, the suggestion last sent for it and its source, to notice when the user accepts it
+        self.last_suggestion: Optional[Tuple[int, str, Optional[str]]] = None
+        # Frames for the writer task, and the seq the next streamed delta is sent with
+        self.queue: Deque[Dict] = deque()
+        self.next_seq = 0
+        self.wakeup = asyncio.Event()
+        self.writer: Optional[asyncio.Task] = None
+
 # WebSocket connection manager
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    """Registry of open connections, each with a bounded queue of outgoing frames
+    
+    Connections are kept in a dict keyed by socket, so registering and
+    removing one is O(1) however many are open, and removing one twice is
+    harmless. Beyond WS_MAX_CONNECTIONS, or WS_MAX_CONNECTIONS_PER_IP from
+    one address, new connections are refused.
+    
+    Suggestions are queued rather than sent by the task producing them, and
+    a writer task per connection sends them, so a client that reads slowly
+    never holds up suggestion generation. While frames wait, superseded ones
+    are dropped: frames of an older request when a newer request's frame
+    arrives, and consecutive streamed deltas are merged into one. A send
+    that blocks for WS_SEND_TIMEOUT disconnects the client.
+    """
+    
+    def __init__(self, max_connections: int = None, max_per_ip: int = None, queue_size: int = None,
+                 send_timeout: float = None):
+        """Initialize the manager
+        
+        Args:
+            max_connections: Open connections allowed
+            max_per_ip: Open connections allowed from one client address
+            queue_size: Frames queued per connection before the oldest is dropped
+            send_timeout: Seconds one send may block before the client is disconnected
+        """
+        self.max_connections = max_connections or config.WS_MAX_CONNECTIONS
+        self.max_per_ip = max_per_ip or config.WS_MAX_CONNECTIONS_PER_IP
+        self.queue_size = queue_size or config.WS_SEND_QUEUE_SIZE
+        self.send_timeout = send_timeout or config.WS_SEND_TIMEOUT
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.connections_per_ip: Dict[str, int] = {}
+        # source -> suggestions delivered and accepted, to compare how useful each source is
+        self.acceptance: Dict[str, Dict[str, int]] = {}
+        
+        self.refused = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.stalled = 0
+        self.idle_closed = 0
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"Client connected. Total connections: {len(self.active_connections)}")
+    async def connect(self, websocket: WebSocket) -> bool:
+        """Accept a connection, or refuse it if a connection cap is reached
+        
+        Returns:
+            Whether the connection was accepted
+        """
+        client_ip = websocket.client.host if websocket.client else "unknown"
+        if (len(self.connections) >= self.max_connections
+                or self.connections_per_ip.get(client_ip, 0) >= self.max_per_ip):
+            self.refused += 1
+            logger.warning(f"Refusing connection from {client_ip}: {len(self.connections)} open, "
+                           f"{self.connections_per_ip.get(client_ip, 0)} from this address")
+            # Closing before accepting refuses the handshake
+            await websocket.close(code=1013)
+            return False
+        
+        protocol = negotiate(websocket.scope.get("subprotocols", []))
+        # Registered before accepting, so connections accepted meanwhile count towards the caps
+        connection = Connection(websocket, client_ip, protocol)
+        self.connections[websocket] = connection
+        self.connections_per_ip[client_ip] = self.connections_per_ip.get(client_ip, 0) + 1
+        try:
+            await websocket.accept(subprotocol=protocol)
+        except Exception:
+            self.disconnect(websocket)
+            raise
+        connection.writer = asyncio.create_task(self._write(connection))
+        protocol_stats["binary_connections" if protocol == BINARY_PROTOCOL else "json_connections"] += 1
+        logger.info(f"Client connected. Total connections: {len(self.connections)}")
+        return True
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info(f"Client disconnected. Remaining connections: {len(self.active_connections)}")
+        """Forget a connection and stop its tasks; does nothing if it is already gone"""
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        self.cancel_pending(websocket, connection)
+        if connection.writer is not None:
+            connection.writer.cancel()
+        count = self.connections_per_ip[connection.client_ip] - 1
+        if count:
+            self.connections_per_ip[connection.client_ip] = count
+        else:
+            del self.connections_per_ip[connection.client_ip]
+        speculative_prefetcher.discard(id(websocket))
+        logger.info(f"Client disconnected. Remaining connections: {len(self.connections)}")
 
-    async def send_suggestion(self, websocket: WebSocket, response):
+    def send_suggestion(self, websocket: WebSocket, response):
+        """Queue a frame for the connection's writer task"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return
         # If response is a string (for backward compatibility), convert to dict
         if isinstance(response, str):
             response = {"suggestion": response}
-        await websocket.send_text(json.dumps(response))
+        queue = connection.queue
+        request_id = response.get("request_id")
+        # Frames of an older request are stale once a newer request answers: the client drops them
+        if request_id is not None and any(frame.get("request_id") not in (None, request_id) for frame in queue):
+            current = deque(frame for frame in queue if frame.get("request_id") in (None, request_id))
+            self.dropped += len(queue) - len(current)
+            connection.queue = queue = current
+        
+        # Streamed deltas are renumbered as sent, so merging them leaves no gap in seq
+        if "delta" in response:
+            if response.get("seq") == 0:
+                connection.next_seq = 0
+            last = queue[-1] if queue else None
+            if last is not None and "delta" in last and last.get("request_id") == request_id:
+                # The previous delta has not gone out yet: send both as one
+                last["delta"] += response["delta"]
+                self.coalesced += 1
+                return
+            response = {**response, "seq": connection.next_seq}
+            connection.next_seq += 1
+        elif response.get("done") and "seq" in response:
+            response = {**response, "seq": connection.next_seq}
+        
+        queue.append(response)
+        if len(queue) > self.queue_size:
+            queue.popleft()
+            self.dropped += 1
+        connection.wakeup.set()
+
+    def cancel_pending(self, websocket: WebSocket, connection: Optional[Connection] = None):
+        """Cancel the in-flight suggestion task for a connection, if any"""
+        connection = connection or self.connections.get(websocket)
+        if connection is None:
+            return
+        task, connection.pending_task = connection.pending_task, None
+        if task and not task.done():
+            task.cancel()
+
+    def schedule(self, websocket: WebSocket, coro) -> asyncio.Task:
+        """Run a suggestion task for a connection, cancelling the one it supersedes"""
+        connection = self.connections[websocket]
+        self.cancel_pending(websocket, connection)
+        task = asyncio.create_task(coro)
+        connection.pending_task = task
+        task.add_done_callback(lambda t: self._task_done(connection, t))
+        return task
+
+    def remember_suggestion(self, websocket: WebSocket, document_length: int, suggestion: str,
+                            source: Optional[str] = None):
+        """Remember the suggestion sent for a document of the given length"""
+        connection = self.connections.get(websocket)
+        if suggestion and connection is not None:
+            connection.last_suggestion = (document_length, suggestion, source)
+            counts = self.acceptance.setdefault(source or "unknown", {"delivered": 0, "accepted": 0})
+            counts["delivered"] += 1
+
+    def check_accepted(self, websocket: WebSocket, document: GapBuffer):
+        """Learn from the last suggestion if the document shows the user accepted it"""
+        connection = self.connections.get(websocket)
+        if connection is None or connection.last_suggestion is None:
+            return
+        length, suggestion, source = connection.last_suggestion
+        # Compare without whitespace: accepting appends the suggestion verbatim
+        accepted = "".join(suggestion.split())
+        added = document[length:length + 2 * len(suggestion) + 2]
+        if "".join(added.split()).startswith(accepted):
+            connection.last_suggestion = None
+            previous_text = document[max(0, length - config.CONTEXT_WINDOW_CHARS):length]
+            self.acceptance[source or "unknown"]["accepted"] += 1
+            record_accepted_suggestion(previous_text, suggestion, source)
+
+    def stats(self) -> Dict:
+        """Get connection, cap and send queue counters"""
+        return {
+            "connections": len(self.connections),
+            "client_addresses": len(self.connections_per_ip),
+            "max_connections": self.max_connections,
+            "max_per_ip": self.max_per_ip,
+            "refused": self.refused,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "stalled": self.stalled,
+            "idle_closed": self.idle_closed
+        }
+
+    def _task_done(self, connection: Connection, task: asyncio.Task):
+        if connection.pending_task is task:
+            connection.pending_task = None
+
+    async def _write(self, connection: Connection):
+        """Send a connection's queued frames in order, until it closes"""
+        websocket = connection.websocket
+        binary = connection.protocol == BINARY_PROTOCOL
+        try:
+            while True:
+                if not connection.queue:
+                    connection.wakeup.clear()
+                    await connection.wakeup.wait()
+                    continue
+                frame = connection.queue.popleft()
+                with stage_timer("send"):
+                    data = encode_frame(frame) if binary else json.dumps(frame)
+                    send = websocket.send_bytes(data) if binary else websocket.send_text(data)
+                    await asyncio.wait_for(send, self.send_timeout)
+                protocol_stats["bytes_sent"] += len(data)
+        except asyncio.TimeoutError:
+            self.stalled += 1
+            logger.warning(f"Disconnecting {connection.client_ip}: a send blocked for {self.send_timeout}s")
+            self.disconnect(websocket)
+            try:
+                await asyncio.wait_for(websocket.close(code=1013), 1.0)
+            except Exception:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The connection closed; the receive loop sees it too and disconnects
+            logger.debug(f"Stopped sending to {connection.client_ip}: {str(e)}")
 
 manager = ConnectionManager()
+metrics_registry.gauge("websocket_active_connections", "Open WebSocket connections",
+                       lambda: len(manager.connections))
+metrics_registry.gauge("worker_ready", "1 once warm-up has finished and the worker reports ready",
+                       lambda: int(warmup.ready))
+metrics_registry.gauge("usage_feed_subscribers", "Dashboards subscribed to the usage feed",
+                       lambda: usage_feed.subscribers)
+metrics_registry.gauge("upstream_circuit_state", "Upstream circuit breaker state: 0 closed, 1 half-open, 2 open",
+                       lambda: STATE_VALUES[circuit_breaker.state])
+metrics_registry.gauge("upstream_circuit_degraded", "1 while upstream calls are degraded or not made",
+                       lambda: int(circuit_breaker.degraded))
+metrics_registry.gauge("upstream_circuit_trips", "Times the upstream circuit opened",
+                       lambda: circuit_breaker.trips)
+metrics_registry.gauge("upstream_circuit_rejected", "Upstream calls not made because the circuit was open",
+                       lambda: circuit_breaker.rejected)
+
+# Client message counters; bytes_saved is how much less was received than with full-text messages.
+# bytes_sent is counted before any permessage-deflate compression
+protocol_stats = {
+    "full_messages": 0,
+    "delta_messages": 0,
+    "resyncs": 0,
+    "bytes_received": 0,
+    "bytes_saved": 0,
+    "bytes_sent": 0,
+    "binary_connections": 0,
+    "json_connections": 0
+}
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
+@app.on_event("startup")
+async def startup_event():
+    """Start the spell check worker pool, the event loop lag monitor, the usage feed and warm-up"""
+    spell_batcher.start()
+    loop_lag_monitor.start()
+    usage_feed.start()
+    warmup.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled upstream HTTP connections and spell check workers, and flush the usage and accepted suggestion logs"""
+    await warmup.stop()
+    await loop_lag_monitor.stop()
+    await usage_feed.stop()
+    sampling_profiler.stop()
+    await close_llm()
+    spell_batcher.shutdown()
+    cost_tracker.close()
+    local_completer.close()
+
 @app.get("/", response_class=HTMLResponse)
 async def get_home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+@app.get("/ready")
+async def get_ready():
+    """Readiness probe: 503 until warm-up has finished, then 200
+    
+    Both report how long each warm-up step took and whether it failed.
+    """
+    status = warmup.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 @app.get("/dashboard", response_class=HTMLResponse)
 async def get_dashboard(request: Request):
     """Serve the API usage dashboard page"""
@@ -58,32 +363,265 @@ async def get_dashboard(request: Request):
 @app.get("/api/usage")
 async def get_api_usage():
     """API endpoint to get usage data for the dashboard"""
-    # Get complete usage data for dashboard
     usage_data = cost_tracker.usage_data
     
-    # Ensure the API calls are sorted by timestamp (newest first)
-    usage_data["api_calls"] = sorted(
-        usage_data["api_calls"], 
-        key=lambda x: x["timestamp"], 
-        reverse=True
+    # Return the data as JSON, newest calls first, with suggestion cache and coalescing counters alongside
+    return JSONResponse(content={
+        **usage_data,
+        "api_calls": usage_data["api_calls"][::-1],
+        "today_usage": cost_tracker.get_usage_summary()["today_usage"],
+        "suggestion_cache": suggestion_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "single_flight": suggestion_flights.stats(),
+        "upstream_scheduler": upstream_scheduler.stats(),
+        "local_completion": local_completer.stats()
+    })
+
+@app.get("/api/usage/summary")
+async def get_api_usage_summary():
+    """API endpoint to get usage totals without the call history"""
+    return JSONResponse(content={
+        **usage_totals(),
+        "usage_store": cost_tracker.usage_store is not None,
+        "suggestion_cache": suggestion_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "single_flight": suggestion_flights.stats(),
+        "upstream_scheduler": upstream_scheduler.stats(),
+        "local_completion": local_completer.stats(),
+        "acceptance": manager.acceptance,
+        "connections": manager.stats(),
+        "usage_feed": usage_feed.stats(),
+        "protocol": protocol_stats,
+        "token_counter": token_counter.stats(),
+        "model_router": model_router.stats(),
+        "speculation": speculative_prefetcher.stats()
+    })
+
+@app.get("/api/usage/stream")
+async def stream_api_usage():
+    """Server-Sent Events feed of usage for live dashboards
+    
+    Sends a "snapshot" event with the totals, the last hour and day of
+    usage in time buckets and the recent calls, then a "delta" event about
+    once a second while calls are being made, carrying only what changed.
+    """
+    return StreamingResponse(usage_feed.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics")
+async def get_metrics():
+    """Per-stage latency histograms and server gauges in the Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/profiler")
+async def get_profiler_report(limit: int = Query(200, ge=1)):
+    """Stacks sampled by the profiler, in the collapsed format read by flame graph tools"""
+    if not config.ENABLE_PROFILER_ENDPOINTS:
+        return JSONResponse(status_code=404, content={"error": "Profiler endpoints are disabled"})
+    return PlainTextResponse(sampling_profiler.report(limit))
+
+@app.post("/api/profiler")
+async def set_profiler(enabled: bool):
+    """Start or stop sampling the event loop thread"""
+    if not config.ENABLE_PROFILER_ENDPOINTS:
+        return JSONResponse(status_code=404, content={"error": "Profiler endpoints are disabled"})
+    if enabled:
+        # Handlers run on the event loop thread, so this is the thread that gets sampled
+        sampling_profiler.start()
+    else:
+        sampling_profiler.stop()
+    return JSONResponse(content={"running": sampling_profiler.running, "samples": sampling_profiler.sample_count})
+
+@app.get("/api/usage/calls")
+async def get_api_usage_calls(start: Optional[float] = None, end: Optional[float] = None,
+                              model: Optional[str] = None, success: Optional[bool] = None,
+                              limit: int = Query(50, ge=1, le=config.USAGE_QUERY_MAX_LIMIT),
+                              before_id: Optional[int] = None):
+    """API endpoint to page through API calls, newest first
+    
+    start and end are Unix times; pass the returned next_before_id as
+    before_id to get the next page.
+    """
+    if cost_tracker.usage_store is None:
+        return JSONResponse(status_code=503, content={"error": "Usage store is disabled"})
+    page = await asyncio.to_thread(
+        cost_tracker.usage_store.query_calls, start, end, model, success, limit, before_id
     )
+    return JSONResponse(content=page)
+
+@app.get("/api/usage/aggregates")
+async def get_api_usage_aggregates(start: Optional[float] = None, end: Optional[float] = None,
+                                   model: Optional[str] = None, bucket: str = "hour"):
+    """API endpoint to get per-minute/hour/day usage and latency percentiles for a time window"""
+    if cost_tracker.usage_store is None:
+        return JSONResponse(status_code=503, content={"error": "Usage store is disabled"})
+    try:
+        aggregates = await asyncio.to_thread(
+            cost_tracker.usage_store.aggregate, start, end, model, bucket
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return JSONResponse(content=aggregates)
+
+def parse_client_message(data: Union[str, bytes], default_request_id: int) -> Dict[str, Any]:
+    """Parse a client message into a dict with "request_id", "max_wait" and the text or its edits
     
-    # Return the data as JSON
-    return JSONResponse(content=usage_data)
+    Clients send either the full text, {"text": ..., "request_id": ...},
+    or the edits since their previous message, {"edits": [[offset,
+    delete_count, insert_text], ...], "length": ..., "request_id": ...},
+    where length is the text's length after the edits. Either may carry a
+    "deadline_ms" bounding how long the request may queue for an upstream
+    call; plain text from older clients is accepted and given a
+    server-side request id. Binary frames (see wire_codec) carry the same
+    messages.
+    """
+    try:
+        message = decode_frame(data) if isinstance(data, bytes) else json.loads(data)
+    except ValueError:
+        message = None
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    if not isinstance(message, dict):
+        return {"text": data, "request_id": default_request_id, "max_wait": None}
+    
+    max_wait = None
+    deadline_ms = message.get("deadline_ms")
+    if isinstance(deadline_ms, (int, float)) and deadline_ms >= 0:
+        max_wait = min(deadline_ms / 1000, config.UPSTREAM_QUEUE_TIMEOUT)
+    parsed = {"request_id": message.get("request_id", default_request_id), "max_wait": max_wait}
+    if isinstance(message.get("text"), str):
+        parsed["text"] = message["text"]
+    elif config.ENABLE_DELTA_PROTOCOL and isinstance(message.get("edits"), list):
+        parsed["edits"] = message["edits"]
+        parsed["length"] = message.get("length")
+    # Otherwise neither is usable (e.g. edits with the delta protocol off): update_document asks for a resync
+    return parsed
+
+def update_document(document: GapBuffer, message: Dict[str, Any], message_bytes: int) -> Dict[str, int]:
+    """Apply a parsed client message to the connection's document
+    
+    Returns:
+        Wire usage for the message: bytes received, and bytes saved compared
+        with sending the full text
+    
+    Raises:
+        DocumentTooLargeError: If a full text exceeds MAX_DOCUMENT_CHARS; the document is left as it was
+        ValueError: If the edits do not apply, or the message has neither text nor
+            usable edits, so the client must resync
+    """
+    if "edits" in message:
+        apply_edits(document, message["edits"], message["length"])
+        protocol_stats["delta_messages"] += 1
+    elif "text" in message:
+        # Truncating would keep the head and drop the tail the prompt is built from
+        if len(message["text"]) > config.MAX_DOCUMENT_CHARS:
+            raise DocumentTooLargeError(f"Text exceeds {config.MAX_DOCUMENT_CHARS} characters")
+        document.set_text(message["text"])
+        protocol_stats["full_messages"] += 1
+    else:
+        raise ValueError("Message has neither text nor usable edits")
+    # Measured against the document's length in characters, close to its UTF-8 size for most text
+    bytes_saved = max(0, len(document) - message_bytes) if "edits" in message else 0
+    protocol_stats["bytes_received"] += message_bytes
+    protocol_stats["bytes_saved"] += bytes_saved
+    return {"bytes_received": message_bytes, "bytes_saved": bytes_saved}
+
+async def process_message(websocket: WebSocket, document: GapBuffer, request_id: int,
+                          spell_session: SpellCheckSession, max_wait: Optional[float] = None,
+                          wire_usage: Optional[Dict[str, int]] = None, received_at: Optional[float] = None):
+    """Generate a suggestion for the connection's document and send it, tagged with its request id"""
+    # Upstream calls are shared fairly between connections
+    client_id = id(websocket)
+    # Any edit after this point supersedes the task, so the length stays current
+    document_length = len(document)
+    try:
+        if config.ENABLE_STREAMING:
+            # Forward each delta frame as soon as the LLM produces it
+            frames = stream_text_suggestions(document, spell_session, client_id, max_wait)
+            async with aclosing(frames):
+                async for frame in frames:
+                    frame["request_id"] = request_id
+                    if frame.get("done") and "usage" in frame and wire_usage:
+                        frame["usage"].update(wire_usage)
+                    if frame.get("done") and circuit_breaker.degraded:
+                        # Ask the client to wait for longer typing pauses, so it sends fewer requests
+                        frame["debounce_ms"] = config.CIRCUIT_DEGRADED_DEBOUNCE_MS
+                    manager.send_suggestion(websocket, frame)
+                    if frame.get("done"):
+                        manager.remember_suggestion(websocket, document_length, frame.get("suggestion"),
+                                                    frame.get("source"))
+                        speculative_prefetcher.schedule(client_id, document, frame.get("suggestion"))
+                        if received_at is not None:
+                            observe_stage("total", time.perf_counter() - received_at)
+        else:
+            # Process the text and get suggestions
+            response = await get_text_suggestions(document, spell_session, client_id, max_wait)
+            response["request_id"] = request_id
+            if "usage" in response and wire_usage:
+                response["usage"].update(wire_usage)
+            if circuit_breaker.degraded:
+                response["debounce_ms"] = config.CIRCUIT_DEGRADED_DEBOUNCE_MS
+            
+            # Send response back to the client
+            manager.send_suggestion(websocket, response)
+            manager.remember_suggestion(websocket, document_length, response.get("suggestion"),
+                                        response.get("source"))
+            speculative_prefetcher.schedule(client_id, document, response.get("suggestion"))
+            if received_at is not None:
+                observe_stage("total", time.perf_counter() - received_at)
+    except Exception as e:
+        logger.error(f"Error sending suggestion: {str(e)}")
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    if not await manager.connect(websocket):
+        return
+    message_count = 0
+    # Remembers this connection's text so only edited words are re-checked
+    spell_session = SpellCheckSession()
+    # The connection's full text, kept up to date from full-text and edit messages
+    document = GapBuffer()
     try:
         while True:
-            data = await websocket.receive_text()
-            logger.info(f"Received text: {data[:20]}..." if len(data) > 20 else f"Received text: {data}")
+            # Text frames carry JSON or plain text, binary frames the negotiated compact encoding
+            try:
+                frame = await asyncio.wait_for(websocket.receive(), config.WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Nothing typed for a long while: free the connection; the client reconnects on its next edit
+                manager.idle_closed += 1
+                manager.disconnect(websocket)
+                await websocket.close(code=IDLE_CLOSE_CODE, reason="idle")
+                return
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            data = frame["bytes"] if frame.get("bytes") is not None else frame["text"]
+            received_at = time.perf_counter()
+            message_count += 1
+            message = parse_client_message(data, message_count)
+            request_id = message["request_id"]
+            try:
+                wire_usage = update_document(document, message, frame_bytes(data))
+            except DocumentTooLargeError as e:
+                logger.warning(f"Rejecting message: {str(e)}")
+                manager.cancel_pending(websocket)
+                manager.send_suggestion(websocket, {"suggestion": "", "error": str(e), "request_id": request_id})
+                continue
+            except ValueError as e:
+                # The client's text and ours diverged; it answers with the full text
+                logger.warning(f"Requesting resync: {str(e)}")
+                protocol_stats["resyncs"] += 1
+                manager.cancel_pending(websocket)
+                manager.send_suggestion(websocket, {"resync": True, "request_id": request_id})
+                continue
+            logger.info(f"Received {len(data)} bytes, document is {len(document)} characters")
+            manager.check_accepted(websocket, document)
+            speculative_prefetcher.observe(id(websocket), document)
+            # Parsing the message and applying it to the document
+            observe_stage("ws_receive", time.perf_counter() - received_at)
             
-            # Process the text and get suggestions
-            response = await get_text_suggestions(data)
-            
-            # Send response back to the client
-            await manager.send_suggestion(websocket, response)
+            # A newer message supersedes any suggestion still being generated
+            manager.schedule(websocket, process_message(websocket, document, request_id, spell_session,
+                                                        message["max_wait"], wire_usage, received_at))
     except WebSocketDisconnect:
         manager.disconnect(websocket)
     except Exception as e:
@@ -95,5 +633,6 @@ if __name__ == "__main__":
         "app:app",
         host=config.HOST,
         port=config.PORT,
-        reload=config.DEBUG_MODE
+        reload=config.DEBUG_MODE,
+        **UVICORN_WS_SETTINGS
     )
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""Benchmark: per-request ChatGroq + thread pool vs. shared pooled async client
+
+Runs the same number of concurrent suggestion calls against the local mock
+endpoint in benchmarks/mock_groq.py and reports p50/p99 latency and
+requests per second for both approaches.
+
+Usage:
+    python benchmarks/bench_llm_client.py [--requests 500] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_groq  # noqa: E402
+
+os.environ["GROQ_API_BASE"] = f"http://{mock_groq.MOCK_HOST}:{mock_groq.MOCK_PORT}"
+os.environ.setdefault("GROQ_API_KEY", "mock-key")
+
+from langchain_groq import ChatGroq  # noqa: E402
+
+import config  # noqa: E402
+import llm_service  # noqa: E402
+
+MESSAGES = [
+    {"role": "system", "content": llm_service.SYSTEM_PROMPT},
+    {"role": "user", "content": "Based on this text, suggest a natural continuation:\n\nThank you for"}
+]
+
+async def call_before():
+    """Previous behaviour: build a new client and run the blocking call in a thread"""
+    handler = llm_service.token_counting_handler()
+    llm = ChatGroq(
+        groq_api_key=config.GROQ_API_KEY,
+        groq_api_base=config.GROQ_API_BASE,
+        model_name=config.DEFAULT_MODEL,
+        temperature=config.TEMPERATURE,
+        max_tokens=config.MAX_TOKENS,
+        callbacks=[handler]
+    )
+    await asyncio.to_thread(lambda: llm.invoke(MESSAGES))
+
+async def call_after():
+    """Current behaviour: shared client with pooled connections and native async"""
+    handler = llm_service.token_counting_handler()
+    await llm_service.get_llm().ainvoke(MESSAGES, config={"callbacks": [handler]})
+
+async def run(call, total: int, concurrency: int) -> dict:
+    """Issue `total` calls with at most `concurrency` in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "rps": total / elapsed
+    }
+
+async def main(args):
+    for name, call in (("before", call_before), ("after", call_after)):
+        # Warm up once so import and pool creation costs are not measured
+        await call()
+        result = await run(call, args.requests, args.concurrency)
+        print(f"{name:>6}: p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms rps={result['rps']:.1f}")
+    await llm_service.close_llm()
+
+if __name__ == "__main__":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock upstream latency in seconds")
+    args = parser.parse_args()
+    mock_groq.start_in_thread(latency=args.latency)
+    asyncio.run(main(args))
@@ -0,0 +1,90 @@
+"""Benchmark: local n-gram completion latency and hit rate
+
+Trains an n-gram model on a corpus (by default a synthetic one built from
+sentence templates), then measures how long completions take and how often
+the router would serve them locally at the configured confidence thresholds.
+
+Usage:
+    python benchmarks/bench_ngram.py [--corpus corpus.txt] [--queries 20000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from ngram_model import NGramModel  # noqa: E402
+
+TEMPLATES = [
+    "Thank you for your {noun}.",
+    "Thank you for your {noun} with the {thing}.",
+    "I look forward to hearing from you {when}.",
+    "Please let me know if you have any {question}.",
+    "I hope this email finds you {state}.",
+    "Let me know if you need {thing} else.",
+    "We will send the {thing} {when}.",
+]
+WORDS = {
+    "noun": ["help", "time", "support", "patience", "feedback"],
+    "thing": ["report", "project", "invoice", "update", "anything"],
+    "when": ["soon", "tomorrow", "next week", "today"],
+    "question": ["questions", "concerns", "feedback"],
+    "state": ["well", "in good health", "well and rested"],
+}
+
+def synthetic_corpus(size: int, rng: random.Random):
+    """Sentences filled in from the templates"""
+    for _ in range(size):
+        template = rng.choice(TEMPLATES)
+        yield template.format(**{k: rng.choice(v) for k, v in WORDS.items()})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="text file with one document per line")
+    parser.add_argument("--sentences", type=int, default=20000, help="synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(13)
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8", errors="ignore") as f:
+            lines = [line for line in f if line.strip()]
+    else:
+        lines = list(synthetic_corpus(args.sentences, rng))
+
+    model = NGramModel()
+    start = time.perf_counter()
+    model.train(lines)
+    train_time = time.perf_counter() - start
+
+    # Query with random prefixes of corpus lines
+    queries = []
+    for _ in range(args.queries):
+        tokens = rng.choice(lines).split()
+        queries.append(" ".join(tokens[:rng.randint(1, max(1, len(tokens) - 1))]))
+
+    latencies = []
+    confident = fallback = 0
+    for query in queries:
+        t0 = time.perf_counter()
+        result = model.complete(query, config.NGRAM_CONFIDENCE)
+        latencies.append(time.perf_counter() - t0)
+        if result:
+            confident += 1
+        elif model.complete(query, config.NGRAM_FALLBACK_CONFIDENCE):
+            fallback += 1
+
+    latencies.sort()
+    print(f"Trained on {len(lines)} lines in {train_time:.2f}s: {model.stats()}")
+    print(f"Completion latency: p50 {statistics.median(latencies) * 1e6:.1f} us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.1f} us")
+    print(f"Served locally at confidence >= {config.NGRAM_CONFIDENCE}: {confident / len(queries):.1%}")
+    print(f"Available as fallback at >= {config.NGRAM_FALLBACK_CONFIDENCE}: "
+          f"{(confident + fallback) / len(queries):.1%}")
+
+if __name__ == "__main__":
+    main()
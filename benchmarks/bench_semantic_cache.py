@@ -0,0 +1,138 @@
+"""Benchmark: near-duplicate cache lookup latency, hit rate and precision
+
+Fills the semantic cache with random texts (words drawn from
+requests.jsonl) and queries it with near-duplicates of cached texts and
+with texts that must miss, at growing index sizes:
+
+- near-duplicates: a cached text with its case or whitespace changed,
+  punctuation added, or one word replaced away from the end; the exact-key
+  cache misses all of these
+- must-miss: unseen texts, and cached texts with their last word replaced
+  or their last few words dropped (a different ending wants a different
+  continuation)
+
+Each cached text has its own suggestion, so a hit is correct only if it
+returns the suggestion of the text the query was derived from. Precision
+is correct hits over all hits.
+
+Usage:
+    python benchmarks/bench_semantic_cache.py [--sizes 1000,5000,20000,50000] [--queries 2000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from collections import Counter
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from semantic_cache import SemanticCache  # noqa: E402
+
+PARAMS = ("llama3-8b-8192", 0.7, 1)
+
+def load_vocabulary(path: str) -> List[str]:
+    words = Counter()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                words.update(re.findall(r"[A-Za-z]+", f"{entry['title']} {entry['body']}".lower()))
+    return [word for word, _ in words.most_common()]
+
+def random_text(vocabulary: List[str], rng: random.Random) -> str:
+    # Zipf-like word choice, so common words repeat across texts as in real writing
+    return " ".join(vocabulary[min(int(rng.paretovariate(1.2)) - 1, len(vocabulary) - 1)]
+                    if rng.random() < 0.5 else rng.choice(vocabulary)
+                    for _ in range(rng.randint(20, 40))).capitalize()
+
+def near_duplicate(text: str, vocabulary: List[str], rng: random.Random):
+    words = text.split()
+    kind = rng.choice(["case", "whitespace", "punctuation", "word"])
+    if kind == "case":
+        return kind, text.lower() if rng.random() < 0.5 else text.upper()
+    if kind == "whitespace":
+        return kind, "  ".join(words) + " "
+    if kind == "punctuation":
+        i = rng.randrange(1, len(words) - 2)
+        return kind, " ".join(words[:i] + [words[i] + rng.choice([",", ";", " -"])] + words[i + 1:]) + "."
+    i = rng.randrange(len(words) // 2, len(words) - 3)
+    return kind, " ".join(words[:i] + [rng.choice(vocabulary)] + words[i + 1:])
+
+def must_miss(text: str, vocabulary: List[str], rng: random.Random):
+    words = text.split()
+    kind = rng.choice(["unseen", "last_word", "truncated"])
+    if kind == "unseen":
+        return kind, random_text(vocabulary, rng)
+    if kind == "last_word":
+        replacement = rng.choice([w for w in vocabulary[:200] if w != words[-1].lower()])
+        return kind, " ".join(words[:-1] + [replacement])
+    return kind, " ".join(words[:-rng.randint(2, 4)])
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000,20000,50000", help="index sizes (entries)")
+    parser.add_argument("--queries", type=int, default=2000, help="queries of each kind per size")
+    parser.add_argument("--documents", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                            "requests.jsonl"))
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    vocabulary = load_vocabulary(args.documents)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    texts = [random_text(vocabulary, rng) for _ in range(max(sizes))]
+    print(f"{len(vocabulary)} words of vocabulary, {args.queries} near-duplicate and {args.queries} "
+          f"must-miss queries per size")
+
+    for size in sizes:
+        cache = SemanticCache(max_entries=size, ttl=3600)
+        start = time.perf_counter()
+        for i, text in enumerate(texts[:size]):
+            cache.put(text, *PARAMS, f"suggestion {i}")
+        insert_time = (time.perf_counter() - start) / size
+
+        hit_kinds, hit_timings, correct, hits = Counter(), [], 0, 0
+        for _ in range(args.queries):
+            source = rng.randrange(size)
+            kind, query = near_duplicate(texts[source], vocabulary, rng)
+            t0 = time.perf_counter()
+            match = cache.get(query, *PARAMS)
+            hit_timings.append(time.perf_counter() - t0)
+            if match:
+                hits += 1
+                hit_kinds[kind] += 1
+                correct += match[0] == f"suggestion {source}"
+
+        false_kinds, miss_timings = Counter(), []
+        for _ in range(args.queries):
+            kind, query = must_miss(texts[rng.randrange(size)], vocabulary, rng)
+            t0 = time.perf_counter()
+            match = cache.get(query, *PARAMS)
+            miss_timings.append(time.perf_counter() - t0)
+            if match:
+                hits += 1
+                false_kinds[kind] += 1
+
+        stats = cache.stats()
+        print(f"\n{size} entries ({stats['buckets']} LSH buckets), insert {insert_time * 1e6:.1f} us/entry")
+        print(f"  lookup, near-duplicates: p50 {statistics.median(hit_timings) * 1e6:.1f} us, "
+              f"p99 {percentile(hit_timings, 0.99) * 1e6:.1f} us")
+        print(f"  lookup, must-miss:       p50 {statistics.median(miss_timings) * 1e6:.1f} us, "
+              f"p99 {percentile(miss_timings, 0.99) * 1e6:.1f} us")
+        print(f"  candidates compared per lookup: {stats['avg_candidates']:.2f}")
+        print(f"  near-duplicate hit rate: {sum(hit_kinds.values()) / args.queries:.1%} "
+              f"({', '.join(f'{k} {v}' for k, v in sorted(hit_kinds.items()))}); exact-key cache: 0.0%")
+        print(f"  false hits on must-miss: {sum(false_kinds.values()) / args.queries:.1%} "
+              f"({', '.join(f'{k} {v}' for k, v in sorted(false_kinds.items())) or 'none'})")
+        print(f"  precision: {correct / hits:.1%}" if hits else "  precision: no hits")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Benchmark: pyspellchecker vs. the SymSpell delete index
+
+Builds a seeded golden corpus of sentences with typos, checks that
+SpellChecker.correct_text gives identical output with both engines, then
+reports corrected words per second for each engine.
+
+Usage:
+    python benchmarks/bench_spell_checker.py [--sentences 300] [--seed 7]
+"""
+import argparse
+import logging
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spell_checker import SpellChecker  # noqa: E402
+
+def make_typo(word: str, rng: random.Random) -> str:
+    """Apply one or two random deletes, transposes, replaces or inserts"""
+    for _ in range(rng.choice((1, 1, 2))):
+        i = rng.randrange(len(word))
+        op = rng.choice(("delete", "transpose", "replace", "insert"))
+        if op == "delete" and len(word) > 3:
+            word = word[:i] + word[i + 1:]
+        elif op == "transpose" and i < len(word) - 1:
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        elif op == "replace":
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+        else:
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+    return word
+
+def golden_corpus(vocabulary, sentences: int, seed: int):
+    """Sentences of dictionary words where roughly one word in three has a typo"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(sentences):
+        words = []
+        for _ in range(rng.randint(6, 14)):
+            word = rng.choice(vocabulary)
+            words.append(make_typo(word, rng) if rng.random() < 0.35 else word)
+        corpus.append(" ".join(words) + ".")
+    return corpus
+
+def main(args):
+    reference = SpellChecker(engine="pyspellchecker")
+    candidate = SpellChecker(engine="symspell")
+
+    vocabulary = sorted(w for w in candidate.checker.words if w.isalpha() and w.isascii() and len(w) >= 3)
+    corpus = golden_corpus(vocabulary, args.sentences, args.seed)
+    word_count = sum(len(s.split()) for s in corpus)
+
+    results = {}
+    for name, checker in (("pyspellchecker", reference), ("symspell", candidate)):
+        start = time.perf_counter()
+        results[name] = [checker.correct_text(s) for s in corpus]
+        elapsed = time.perf_counter() - start
+        print(f"{name:>14}: {word_count / elapsed:,.0f} words/s ({elapsed * 1000 / len(corpus):.2f} ms/sentence)")
+
+    mismatches = [
+        (s, a, b) for s, a, b in zip(corpus, results["pyspellchecker"], results["symspell"]) if a != b
+    ]
+    print(f"golden corpus: {len(corpus)} sentences, {word_count} words, {len(mismatches)} mismatches")
+    for source, expected, actual in mismatches[:10]:
+        print(f"  input:    {source}\n  expected: {expected}\n  actual:   {actual}")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sentences", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,93 @@
+"""Load test: event-loop lag from spell checking as connections grow
+
+Simulates N connections that each send text with fresh typos every
+--interval seconds through correct_spelling_async, while a monitor task
+measures how late the event loop wakes up. Runs once with corrections on
+the event loop (0 workers) and once with the worker pool.
+
+Usage:
+    python benchmarks/bench_spell_event_loop.py [--connections 10 50 200] [--workers 2] [--engine pyspellchecker]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spell_checker  # noqa: E402
+from bench_spell_checker import make_typo  # noqa: E402
+
+async def monitor_lag(samples: list, stop: asyncio.Event, tick: float = 0.01):
+    """Record how late each tick fires"""
+    while not stop.is_set():
+        expected = time.perf_counter() + tick
+        await asyncio.sleep(tick)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+async def connection(vocabulary, rng: random.Random, stop: asyncio.Event, interval: float, counter: list):
+    """Type a growing paragraph, re-sending it after every few words"""
+    session = spell_checker.SpellCheckSession()
+    text = ""
+    await asyncio.sleep(rng.random() * interval)
+    while not stop.is_set():
+        words = [make_typo(rng.choice(vocabulary), rng) for _ in range(3)]
+        text = (text + " " + " ".join(words))[-2000:]
+        await spell_checker.correct_spelling_async(text, session)
+        counter[0] += 1
+        await asyncio.sleep(interval)
+
+async def run(connections: int, workers: int, duration: float, interval: float, vocabulary) -> dict:
+    batcher = spell_checker.SpellCheckBatcher(workers=workers)
+    spell_checker.spell_batcher = batcher
+    spell_checker.spell_checker._memo.clear()
+    batcher.start()
+
+    stop = asyncio.Event()
+    samples, counter = [], [0]
+    rng = random.Random(connections)
+    tasks = [asyncio.create_task(monitor_lag(samples, stop))]
+    tasks += [
+        asyncio.create_task(connection(vocabulary, random.Random(rng.random()), stop, interval, counter))
+        for _ in range(connections)
+    ]
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    batcher.shutdown()
+
+    samples.sort()
+    return {
+        "p50_ms": statistics.median(samples) * 1000,
+        "p99_ms": samples[int(len(samples) * 0.99)] * 1000,
+        "max_ms": samples[-1] * 1000,
+        "checks_per_s": counter[0] / duration
+    }
+
+def main(args):
+    vocabulary = sorted(
+        w for w in spell_checker.spell_checker.checker.words if w.isalpha() and w.isascii() and len(w) >= 4
+    )
+    if args.engine:
+        # Worker processes are forked after this, so they inherit the same engine
+        spell_checker.spell_checker = spell_checker.SpellChecker(engine=args.engine)
+    for workers in (0, args.workers):
+        label = "event loop" if workers == 0 else f"{workers} workers"
+        for connections in args.connections:
+            result = asyncio.run(run(connections, workers, args.duration, args.interval, vocabulary))
+            print(f"{label:>10} | {connections:4d} connections | loop lag p50={result['p50_ms']:.2f}ms "
+                  f"p99={result['p99_ms']:.2f}ms max={result['max_ms']:.2f}ms | {result['checks_per_s']:.0f} checks/s")
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--engine", choices=["symspell", "pyspellchecker"], help="Override config.SPELL_CHECK_ENGINE")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between messages per connection")
+    main(parser.parse_args())
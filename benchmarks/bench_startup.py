@@ -0,0 +1,162 @@
+"""Benchmark: worker cold start, checked against the import and readiness budgets
+
+Measures, in fresh processes:
+
+- import time: how long `import app` takes, the median of several runs,
+  with the slowest modules it imports (from python -X importtime)
+- time to ready: from starting a worker (against the mock Groq server in
+  benchmarks/mock_groq.py) until it first answers, and until /ready
+  reports 200 after warm-up, with the time each warm-up step took
+
+Exits non-zero if the median import time exceeds IMPORT_TIME_BUDGET or
+the time to ready exceeds READY_TIME_BUDGET (see config.py), so it can
+fail a build that makes startup slower.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5] [--import-budget 0.8] [--ready-budget 5]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import config  # noqa: E402
+import mock_groq  # noqa: E402
+
+APP_PORT = 8791
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+LAUNCHER = """
+import sys
+import uvicorn
+import app
+uvicorn.run(app.app, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+# Heavy modules whose import is deferred to warm-up or first use
+DEFERRED_MODULES = ("langchain", "langchain_core", "langchain_groq", "spellchecker")
+
+def measure_import(env: Dict[str, str]) -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def slowest_imports(env: Dict[str, str], count: int) -> Tuple[List[Tuple[int, str]], List[str]]:
+    """The top-level modules imported by app with the most cumulative import time, and deferred modules imported"""
+    snippet = f"import sys, app; print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", snippet], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( +)(\S+)$", line)
+        # Direct imports of app are indented by three spaces
+        if match and len(match.group(2)) == 3:
+            modules.append((int(match.group(1)), match.group(3)))
+    deferred = json.loads(result.stdout.strip().splitlines()[-1].replace("'", '"'))
+    return sorted(modules, reverse=True)[:count], deferred
+
+def get(url: str) -> Optional[Tuple[int, Dict]]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+    except OSError:
+        return None
+
+def measure_ready(env: Dict[str, str], scratch: Path, timeout: float) -> Dict:
+    """Start a worker and time it until it answers and until /ready returns 200"""
+    # The app reads static files, templates and data relative to its working directory
+    for name in ("static", "templates"):
+        os.symlink(ROOT / name, scratch / name)
+    (scratch / "data").mkdir()
+    for artifact in (ROOT / "data").glob("*"):
+        if artifact.is_file() and artifact.name != "accepted_suggestions.txt":
+            os.symlink(artifact, scratch / "data" / artifact.name)
+    (scratch / "logs").mkdir()
+
+    log = open(scratch / "server.log", "w")
+    start = time.perf_counter()
+    worker = subprocess.Popen([sys.executable, "-c", LAUNCHER, str(APP_PORT)], cwd=scratch,
+                              env=dict(env, PYTHONPATH=str(ROOT)), stdout=log, stderr=subprocess.STDOUT)
+    result = {"listening": None, "ready": None, "steps": {}}
+    try:
+        while time.perf_counter() - start < timeout:
+            if worker.poll() is not None:
+                raise RuntimeError(f"The worker exited; see {scratch / 'server.log'}")
+            response = get(f"http://127.0.0.1:{APP_PORT}/ready")
+            if response is not None:
+                result["listening"] = result["listening"] or time.perf_counter() - start
+                status, body = response
+                if status == 200:
+                    result["ready"] = time.perf_counter() - start
+                    result["steps"] = body["steps"]
+                    break
+            time.sleep(0.01)
+    finally:
+        worker.terminate()
+        worker.wait(10)
+        log.close()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes to time the import in")
+    parser.add_argument("--import-budget", type=float, default=config.IMPORT_TIME_BUDGET, help="seconds")
+    parser.add_argument("--ready-budget", type=float, default=config.READY_TIME_BUDGET, help="seconds")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    args = parser.parse_args()
+
+    env = dict(os.environ, GROQ_API_KEY=os.environ.get("GROQ_API_KEY") or "mock-key",
+               GROQ_API_BASE=f"http://{mock_groq.MOCK_HOST}:{mock_groq.MOCK_PORT}")
+    failures = []
+
+    # Warm the OS file cache first, as a rolling deploy on an existing host would
+    measure_import(env)
+    timings = [measure_import(env) for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"import app: median {median * 1000:.0f} ms, min {min(timings) * 1000:.0f} ms, "
+          f"max {max(timings) * 1000:.0f} ms over {args.runs} runs (budget {args.import_budget * 1000:.0f} ms)")
+    modules, deferred = slowest_imports(env, args.top)
+    for microseconds, module in modules:
+        print(f"  {microseconds / 1000:7.1f} ms  {module}")
+    if deferred:
+        print(f"  imported at startup but meant to be deferred: {', '.join(deferred)}")
+    if median > args.import_budget:
+        failures.append(f"import time {median * 1000:.0f} ms is over the {args.import_budget * 1000:.0f} ms budget")
+
+    mock_groq.start_in_thread(latency=0.01)
+    scratch = Path(tempfile.mkdtemp(prefix="bench_startup_"))
+    try:
+        result = measure_ready(env, scratch, timeout=max(30.0, 3 * args.ready_budget))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if result["ready"] is None:
+        failures.append("the worker never reported ready")
+    else:
+        print(f"\nworker listening after {result['listening']:.2f}s, ready after {result['ready']:.2f}s "
+              f"(budget {args.ready_budget:.2f}s)")
+        for name, step in result["steps"].items():
+            outcome = "ok" if step["ok"] else f"failed: {step['error']}"
+            print(f"  {step['seconds'] * 1000:7.1f} ms  {name} ({outcome})")
+        if result["ready"] > args.ready_budget:
+            failures.append(f"time to ready {result['ready']:.2f}s is over the {args.ready_budget:.2f}s budget")
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK: within the startup budgets")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Benchmark: token counting overhead per suggestion request
+
+Replays typing sessions (every prefix of a document, as successive
+keystrokes would send them) and measures the time spent counting the
+prompt's tokens per request:
+
+- heuristic: len(prompt) // 4, the previous estimate
+- uncached:  the BPE tokenizer on the whole prompt, system prompt included
+- cached:    precomputed fixed prompt tokens plus the user text, with the
+             piece and text LRU caches (what llm_service does)
+
+Uses the tokenizer at TOKENIZER_FILE (e.g. Llama 3's tokenizer.model) when
+it exists; otherwise a small vocabulary is trained on the documents so the
+same code path can be measured.
+
+Usage:
+    python benchmarks/bench_tokenizer.py [--tokenizer data/tokenizer.model] [--documents requests.jsonl]
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import config  # noqa: E402
+from token_counter import BPETokenCounter, HeuristicTokenCounter, PRE_TOKENIZE_PATTERN  # noqa: E402
+from llm_service import _build_messages  # noqa: E402
+
+def load_documents(path: Path) -> List[str]:
+    documents = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                documents.append(f"{entry['title']}. {entry['body']}")
+    return documents
+
+def train_ranks(texts: List[str], merges: int, output: Path):
+    """Write a byte-level BPE rank file learned from the texts (tiktoken format)"""
+    words = Counter(piece.encode("utf-8") for text in texts for piece in PRE_TOKENIZE_PATTERN.findall(text))
+    splits = {word: [word[i:i + 1] for i in range(len(word))] for word in words}
+    vocabulary = [bytes([b]) for b in range(256)]
+    for _ in range(merges):
+        pairs = Counter()
+        for word, parts in splits.items():
+            for pair in zip(parts, parts[1:]):
+                pairs[pair] += words[word]
+        if not pairs:
+            break
+        (left, right), _ = pairs.most_common(1)[0]
+        vocabulary.append(left + right)
+        for parts in splits.values():
+            i = 0
+            while i < len(parts) - 1:
+                if parts[i] == left and parts[i + 1] == right:
+                    parts[i:i + 2] = [left + right]
+                i += 1
+    with open(output, "w") as f:
+        for rank, token in enumerate(vocabulary):
+            f.write(f"{base64.b64encode(token).decode()} {rank}\n")
+
+def time_per_request(count, prompts) -> List[float]:
+    timings = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        count(prompt)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokenizer", type=Path, default=ROOT / config.TOKENIZER_FILE)
+    parser.add_argument("--documents", type=Path, default=ROOT / "requests.jsonl")
+    parser.add_argument("--merges", type=int, default=2000, help="vocabulary size to train without a tokenizer")
+    args = parser.parse_args()
+
+    documents = load_documents(args.documents)
+    tokenizer = args.tokenizer
+    if not tokenizer.exists():
+        tokenizer = Path(tempfile.mkstemp(suffix=".model")[1])
+        train_ranks(documents, args.merges, tokenizer)
+        print(f"No tokenizer at {args.tokenizer}; trained {args.merges} merges on the documents")
+
+    # Each keystroke of each document, as the client sends them
+    texts = [document[:end] for document in documents for end in range(1, len(document) + 1, 3)]
+    heuristic = HeuristicTokenCounter()
+    uncached = BPETokenCounter(tokenizer, cache_size=1)
+    cached = BPETokenCounter(tokenizer)
+    fixed = cached.count_messages(_build_messages(""))
+
+    results = {
+        "heuristic": time_per_request(lambda text: heuristic.count_messages(_build_messages(text)), texts),
+        "uncached": time_per_request(lambda text: uncached.count_messages(_build_messages(text)), texts),
+        "cached": time_per_request(lambda text: fixed + cached.count(text), texts),
+    }
+    print(f"{len(texts)} requests, prompts of {min(map(len, texts))}-{max(map(len, texts))} characters of user text")
+    for name, timings in results.items():
+        timings.sort()
+        print(f"{name:>9}: mean {statistics.mean(timings) * 1e6:.1f} us, p50 {statistics.median(timings) * 1e6:.1f} us, "
+              f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f} us per request")
+
+    # How far off the old estimate is, relative to the tokenizer
+    errors = [abs(heuristic.count_messages(_build_messages(text)) - (fixed + cached.count(text))) / (fixed + cached.count(text))
+              for text in texts]
+    print(f"len // 4 differs from the tokenizer by {statistics.mean(errors):.1%} on average "
+          f"({max(errors):.1%} at worst)")
+    print(f"Cache: {cached.stats()}")
+    if tokenizer != args.tokenizer:
+        os.unlink(tokenizer)
+
+if __name__ == "__main__":
+    main()
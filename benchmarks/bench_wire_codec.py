@@ -0,0 +1,169 @@
+"""Benchmark: WebSocket frame size and serialization CPU, JSON vs. binary frames, with and without deflate
+
+Replays suggestion exchanges across many sockets at once, as the server
+sees them: each suggestion is one client edit message, a streamed delta
+frame per token and a final frame with the suggestion and its usage.
+Frames are encoded with json.dumps or wire_codec, optionally compressed
+the way permessage-deflate does it (one zlib stream per socket and
+direction, kept across messages, with uvicorn's default settings), and
+reported as:
+
+- CPU time per frame to encode (and compress) what the server sends, and
+  to (decompress and) decode what it receives
+- bytes on the wire per suggestion, WebSocket frame headers included
+- memory held per socket by the deflate contexts
+
+Usage:
+    python benchmarks/bench_wire_codec.py [--sockets 10000] [--suggestions 3] [--tokens 8]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+import zlib
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wire_codec import encode_frame, decode_frame  # noqa: E402
+
+# What permessage-deflate strips from the end of each compressed message
+SYNC_TAIL = b"\x00\x00\xff\xff"
+
+def load_words(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return re.findall(r"[A-Za-z']+", " ".join(json.loads(line)["body"] for line in f if line.strip()))
+
+def exchange(words: List[str], rng: random.Random, request_id: int, offset: int, tokens: int) -> Tuple[Dict, List[Dict]]:
+    """One client edit message and the frames streamed back for it, shaped like the app's"""
+    typed = " ".join(rng.choice(words) for _ in range(rng.randint(1, 3))) + " "
+    client = {"edits": [[offset, 0, typed]], "length": offset + len(typed), "request_id": request_id}
+    deltas = [(" " if i else "") + rng.choice(words) for i in range(tokens)]
+    frames = [{"delta": delta, "seq": seq, "request_id": request_id} for seq, delta in enumerate(deltas)]
+    frames.append({
+        "suggestion": "".join(deltas),
+        "usage": {
+            "model": "llama3-8b-8192",
+            "hedged": False,
+            "input_tokens": rng.randint(100, 600),
+            "output_tokens": tokens,
+            "token_count_source": "provider",
+            "cost": rng.randint(5, 60) * 1e-6 + rng.random() * 1e-7,
+            "duration": rng.uniform(0.2, 1.5),
+            "time_to_first_token": rng.uniform(0.05, 0.4),
+            "queue_wait": rng.uniform(0, 0.01),
+            "queue_depth": rng.randint(0, 3),
+            "context_chars_omitted": 0,
+            "input_tokens_saved": 0,
+            "bytes_received": 60,
+            "bytes_saved": offset
+        },
+        "source": "llm",
+        "done": True,
+        "seq": tokens,
+        "request_id": request_id
+    })
+    return client, frames
+
+def frame_header(length: int, masked: bool) -> int:
+    """WebSocket frame header bytes for a payload; client frames carry a 4 byte mask"""
+    size = 2 if length < 126 else 4 if length < 65536 else 10
+    return size + (4 if masked else 0)
+
+def run(variant: str, sockets: int, traffic: List[List[Tuple[Dict, List[Dict]]]]) -> Dict:
+    binary, deflate = variant.startswith("binary"), variant.endswith("deflate")
+    encode = encode_frame if binary else lambda m: json.dumps(m).encode("utf-8")
+    decode = decode_frame if binary else json.loads
+
+    # Client frames are encoded (and compressed) ahead of time: that is the browser's work
+    client_frames = [[encode(client) for client, _ in suggestions] for suggestions in traffic]
+    if deflate:
+        for frames in client_frames:
+            client_zlib = zlib.compressobj(wbits=-15)
+            frames[:] = [client_zlib.compress(frame) + client_zlib.flush(zlib.Z_SYNC_FLUSH)[:-4] for frame in frames]
+    contexts = []
+    gc.collect()
+    tracemalloc.start()
+    if deflate:
+        # The server's side of each socket: a compressor for what it sends, a decompressor for what it receives
+        contexts = [(zlib.compressobj(wbits=-15), zlib.decompressobj(wbits=-15)) for _ in range(sockets)]
+    context_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    send_time = receive_time = 0.0
+    wire_bytes = sent_frames = received_frames = 0
+    for round_index in range(len(traffic[0])):
+        # Interleave sockets, so each deflate context is cold in cache as it would be under load
+        for socket, suggestions in enumerate(traffic):
+            _, frames = suggestions[round_index]
+            raw = client_frames[socket][round_index]
+            start = time.process_time()
+            if deflate:
+                raw = contexts[socket][1].decompress(raw + SYNC_TAIL)
+            decode(raw)
+            receive_time += time.process_time() - start
+            received = len(client_frames[socket][round_index])
+            wire_bytes += received + frame_header(received, True)
+            received_frames += 1
+
+            start = time.process_time()
+            payloads = []
+            for frame in frames:
+                payload = encode(frame)
+                if deflate:
+                    compressor = contexts[socket][0]
+                    payload = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)[:-4]
+                payloads.append(payload)
+            send_time += time.process_time() - start
+            wire_bytes += sum(len(p) + frame_header(len(p), False) for p in payloads)
+            sent_frames += len(frames)
+
+    suggestions = sockets * len(traffic[0])
+    del contexts
+    gc.collect()
+    return {
+        "send_us": send_time / sent_frames * 1e6,
+        "receive_us": receive_time / received_frames * 1e6,
+        "bytes_per_suggestion": wire_bytes / suggestions,
+        "memory_per_socket": context_memory / sockets,
+        "cpu_per_suggestion_us": (send_time + receive_time) / suggestions * 1e6
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sockets", type=int, default=10000, help="concurrent sockets")
+    parser.add_argument("--suggestions", type=int, default=3, help="suggestions per socket")
+    parser.add_argument("--tokens", type=int, default=8, help="streamed tokens per suggestion")
+    parser.add_argument("--documents", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                            "requests.jsonl"))
+    parser.add_argument("--variants", default="json,binary,json+deflate,binary+deflate")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    words = load_words(args.documents)
+    traffic = []
+    for socket in range(args.sockets):
+        offset, suggestions = rng.randint(0, 2000), []
+        for request_id in range(1, args.suggestions + 1):
+            client, frames = exchange(words, rng, request_id, offset, args.tokens)
+            offset = client["length"]
+            suggestions.append((client, frames))
+        traffic.append(suggestions)
+
+    print(f"{args.sockets} sockets x {args.suggestions} suggestions, {args.tokens} streamed tokens each "
+          f"({args.tokens + 1} frames out, 1 in)\n")
+    print(f"{'variant':<16}{'encode us/frame':>17}{'decode us/frame':>17}{'CPU us/sugg.':>14}"
+          f"{'bytes/sugg.':>13}{'deflate KB/socket':>19}")
+    for variant in args.variants.split(","):
+        result = run(variant, args.sockets, traffic)
+        print(f"{variant:<16}{result['send_us']:>17.2f}{result['receive_us']:>17.2f}"
+              f"{result['cpu_per_suggestion_us']:>14.1f}{result['bytes_per_suggestion']:>13.0f}"
+              f"{result['memory_per_socket'] / 1024:>19.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Check: the upstream circuit breaker against a failing and a slow mock Groq server
+
+Runs llm_service.get_text_suggestions in-process against the mock server
+(benchmarks/mock_groq.py), changing the mock's injected error rate and
+latency between phases through /mock/config:
+
+1. healthy: every call succeeds and the circuit stays closed
+2. failing: every call fails; the circuit must open, after which requests
+   are answered at once without reaching the mock
+3. recovered: the mock is healthy again; after the open period probe calls
+   must close the circuit
+4. slow: calls succeed but slower than CIRCUIT_SLOW_CALL_SECONDS; the
+   circuit must open on latency alone
+5. failing without the breaker, for comparison: every request waits out
+   its retries and is logged as a failed call
+
+For each phase it reports the upstream requests the mock received, failed
+calls logged, how requests were answered, their latency, and the circuit's
+state and mode afterwards. Exits non-zero if the circuit does not open,
+reach the mock while open, or close again as expected.
+
+Timings are shortened so the check runs in under a minute: the circuit
+opens for --open-seconds and calls slower than --slow-seconds count as slow.
+
+Usage:
+    python benchmarks/check_circuit_breaker.py [--requests 40] [--concurrency 4] [--pause 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import config  # noqa: E402
+import mock_groq  # noqa: E402
+
+def mock_request(path: str, body: Dict = None) -> Dict:
+    url = f"http://{mock_groq.MOCK_HOST}:{mock_groq.MOCK_PORT}{path}"
+    data = json.dumps(body).encode() if body is not None else None
+    with urllib.request.urlopen(urllib.request.Request(url, data=data), timeout=5) as response:
+        return json.load(response)
+
+def outcome(result: Dict) -> str:
+    """How a request was answered"""
+    if result.get("error"):
+        if result.get("circuit_open"):
+            return "circuit open"
+        return "shed" if result.get("shed") else "error"
+    if result.get("fallback"):
+        return "local fallback"
+    return result.get("source", "none")
+
+async def run_phase(llm_service, name: str, requests: int, concurrency: int, pause: float,
+                    rng: random.Random, words: List[str]) -> Dict:
+    """Send unique texts, so no request is answered from a cache, and report how they went
+    
+    Each client pauses between requests, as users do between typing bursts.
+    """
+    upstream_before = mock_request("/mock/stats")["requests"]
+    failures_before = failed_calls(llm_service)
+    latencies, outcomes = [], Counter()
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(f"{name} {i} " + " ".join(rng.choice(words) for _ in range(12)))
+
+    async def client(client_id: int):
+        while not queue.empty():
+            text = queue.get_nowait()
+            start = time.perf_counter()
+            result = await llm_service.get_text_suggestions(text, client_id=client_id)
+            latencies.append(time.perf_counter() - start)
+            outcomes[outcome(result)] += 1
+            await asyncio.sleep(pause)
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    breaker = llm_service.circuit_breaker.stats()
+    return {
+        "phase": name,
+        "upstream_requests": mock_request("/mock/stats")["requests"] - upstream_before,
+        "failed_calls_logged": failed_calls(llm_service) - failures_before,
+        "outcomes": dict(outcomes),
+        "p50": statistics.median(latencies),
+        "max": max(latencies),
+        "state": breaker["state"],
+        "mode": breaker["mode"],
+        "trips": breaker["trips"],
+        "rejected": breaker["rejected"]
+    }
+
+def failed_calls(llm_service) -> int:
+    """Failed calls logged in the last hour"""
+    return sum(bucket["failures"] for bucket in llm_service.usage_feed.series["hour"].buckets(time.time()))
+
+async def check(args) -> List[str]:
+    import llm_service
+    rng = random.Random(args.seed)
+    with open(ROOT / "requests.jsonl", "r", encoding="utf-8") as f:
+        words = " ".join(json.loads(line)["body"] for line in f if line.strip()).split()
+    failures = []
+    results = []
+
+    async def phase(name: str, **mock_settings):
+        mock_request("/mock/config", mock_settings)
+        result = await run_phase(llm_service, name, args.requests, args.concurrency, args.pause, rng, words)
+        results.append(result)
+        print(f"{result['phase']:<22}{result['upstream_requests']:>9}{result['failed_calls_logged']:>8}"
+              f"{result['p50'] * 1000:>9.0f}{result['max'] * 1000:>9.0f}  {result['state']:<10}{result['mode']:<12}"
+              f"{', '.join(f'{k} {v}' for k, v in sorted(result['outcomes'].items()))}")
+        return result
+
+    print(f"{'phase':<22}{'upstream':>9}{'failed':>8}{'p50 ms':>9}{'max ms':>9}  {'state':<10}{'mode':<12}answers")
+    healthy = await phase("healthy", error_rate=0.0, latency=0.02)
+    if healthy["state"] != "closed" or healthy["trips"]:
+        failures.append("the circuit opened while the upstream was healthy")
+
+    failing = await phase("failing", error_rate=1.0, latency=0.02)
+    if failing["trips"] == healthy["trips"] or failing["state"] != "open":
+        failures.append("the circuit did not open while every call failed")
+    # Once open, more requests must not reach the upstream
+    before = mock_request("/mock/stats")["requests"]
+    await run_phase(llm_service, "while open", args.requests, args.concurrency, 0.0, rng, words)
+    if mock_request("/mock/stats")["requests"] != before:
+        failures.append("requests reached the upstream while the circuit was open")
+
+    await asyncio.sleep(args.open_seconds)
+    recovered = await phase("recovered", error_rate=0.0, latency=0.02)
+    if recovered["state"] != "closed":
+        failures.append("probe calls did not close the circuit after the upstream recovered")
+
+    slow = await phase("slow", error_rate=0.0, latency=args.slow_seconds * 2)
+    if slow["trips"] == recovered["trips"] or slow["state"] != "open":
+        failures.append("the circuit did not open while every call was slow")
+
+    config.ENABLE_CIRCUIT_BREAKER = False
+    await phase("failing, no breaker", error_rate=1.0, latency=0.02)
+    config.ENABLE_CIRCUIT_BREAKER = True
+    await llm_service.close_llm()
+    llm_service.cost_tracker.close()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="requests per phase")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at once")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds each client waits between requests")
+    parser.add_argument("--open-seconds", type=float, default=3.0, help="CIRCUIT_OPEN_SECONDS for the check")
+    parser.add_argument("--slow-seconds", type=float, default=0.3, help="CIRCUIT_SLOW_CALL_SECONDS for the check")
+    parser.add_argument("--seed", type=int, default=25)
+    args = parser.parse_args()
+
+    os.environ["GROQ_API_KEY"] = os.environ.get("GROQ_API_KEY") or "mock-key"
+    config.GROQ_API_KEY = os.environ["GROQ_API_KEY"]
+    config.GROQ_API_BASE = f"http://{mock_groq.MOCK_HOST}:{mock_groq.MOCK_PORT}"
+    config.CIRCUIT_OPEN_SECONDS = args.open_seconds
+    config.CIRCUIT_SLOW_CALL_SECONDS = args.slow_seconds
+    config.CIRCUIT_DEGRADED_TIMEOUT = 4 * args.slow_seconds
+    config.GROQ_RATE_LIMITS = {model: 10 ** 9 for model in config.GROQ_RATE_LIMITS}
+    config.DAILY_COST_LIMIT = float("inf")
+    # Hedged calls would double the upstream requests counted per phase
+    config.ENABLE_HEDGING = False
+    mock_groq.start_in_thread()
+
+    # Usage logs and rate limit state go to a scratch directory; data/ is read from the repository
+    scratch = Path(tempfile.mkdtemp(prefix="check-circuit-"))
+    os.symlink(ROOT / "data", scratch / "data")
+    cwd = os.getcwd()
+    os.chdir(scratch)
+    try:
+        failures = asyncio.run(check(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if failures:
+        print("\nFAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("\nOK: the circuit opened on errors and on latency, stopped upstream calls while open, and closed on recovery")
+
+if __name__ == "__main__":
+    main()
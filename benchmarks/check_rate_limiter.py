@@ -0,0 +1,88 @@
+"""Multiprocess check: the shared rate limiter holds one global cap across workers
+
+Starts N processes that each hammer SharedRateLimiter.acquire on the same
+state file, the way N uvicorn workers would, and verifies that together
+they were granted no more than the limit within one window. Also checks
+that daily cost added by every process is metered once, globally, and
+reports the per-call latency of acquire.
+
+Usage:
+    python benchmarks/check_rate_limiter.py [--processes 8] [--limit 400] [--duration 2]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import SharedRateLimiter  # noqa: E402
+
+MODEL = "llama3-8b-8192"
+COST_PER_CALL = 0.001
+
+def worker(path: str, limit: int, duration: float, window: float, start_at: float, results):
+    """Acquire as fast as possible until the deadline, recording grants and latency"""
+    limiter = SharedRateLimiter(path, window=window)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    granted = 0
+    latencies = []
+    deadline = start_at + duration
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        if limiter.acquire(MODEL, limit):
+            granted += 1
+            limiter.add_cost(COST_PER_CALL)
+        latencies.append(time.perf_counter() - t0)
+    limiter.close()
+    results.put((granted, statistics.median(latencies), len(latencies)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=400)
+    parser.add_argument("--duration", type=float, default=2.0, help="seconds, must be shorter than the window")
+    parser.add_argument("--window", type=float, default=60.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rate_limit.bin")
+        # Create the state file before the workers race to open it
+        SharedRateLimiter(path, window=args.window).close()
+
+        results = multiprocessing.Queue()
+        start_at = time.time() + 0.5
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, args.limit, args.duration, args.window, start_at, results))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        granted = [g for g, _, _ in outcomes]
+        calls = sum(n for _, _, n in outcomes)
+        latency = statistics.median(m for _, m, _ in outcomes)
+        limiter = SharedRateLimiter(path, window=args.window)
+        daily_cost = limiter.daily_cost()
+        limiter.close()
+
+    total = sum(granted)
+    print(f"{args.processes} processes, limit {args.limit} per {args.window:.0f}s window")
+    print(f"  granted per process: {granted}")
+    print(f"  granted in total:    {total}")
+    print(f"  acquire calls:       {calls} (median {latency * 1e6:.1f} us per call)")
+    print(f"  shared daily cost:   ${daily_cost:.3f} (expected ${total * COST_PER_CALL:.3f})")
+
+    ok = total <= args.limit and abs(daily_cost - total * COST_PER_CALL) < 1e-9
+    print("OK: global cap held" if ok else "FAIL: global cap exceeded or cost mismatch")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+"""Load test: many WebSocket clients typing against app.py
+
+Starts the mock Groq server and the app, each in its own process (the app
+in a scratch directory, so its usage logs and rate limit state are thrown
+away afterwards), then opens N WebSocket clients that replay typing
+traces the way static/js/app.js sends them: after each pause longer than
+the debounce interval, as full text or as edits.
+
+Traces are generated from a seed, so runs are reproducible: documents
+are the request texts in requests.jsonl, typing pauses are drawn from the
+gaps between calls recorded in logs/api_usage.json, and the mock replays
+that file's call durations as upstream latency. --save-trace writes the
+generated traces and --trace replays a saved file instead.
+
+Reports suggestions per second, end-to-end latency (message sent to final
+frame received) percentiles, time to first streamed token, the share of
+stale frames (replies to requests a newer message had superseded) and the
+server's CPU and RSS, summed over its worker processes.
+
+Usage:
+    python benchmarks/load_ws.py [--clients 50] [--duration 60] [--protocol delta|full]
+                                 [--latency-model trace] [--unthrottled]
+    python benchmarks/load_ws.py --url ws://host:8000/ws [--server-pid PID]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import mock_groq  # noqa: E402
+
+APP_PORT = 8790
+# Runs the app with config overrides, without uvicorn's reloader
+APP_LAUNCHER = """
+import sys
+import config
+if sys.argv[2] == "unthrottled":
+    config.GROQ_RATE_LIMITS = {model: 10 ** 9 for model in config.GROQ_RATE_LIMITS}
+    config.DAILY_COST_LIMIT = float("inf")
+import uvicorn
+import app
+uvicorn.run(app.app, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+# A trace is a list of (seconds from the session start, text sent) per session
+Trace = List[Tuple[float, str]]
+
+def load_documents(path: Path) -> List[str]:
+    """Texts to type: the title and body of each request in a JSONL file, or each line of a text file"""
+    documents = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                documents.append(line)
+                continue
+            documents.append(f"{entry.get('title', '')}. {entry.get('body', '')}".strip(". "))
+    return documents
+
+def load_pauses(usage_file: Path) -> List[float]:
+    """Gaps between consecutive recorded calls that look like pauses within a session"""
+    try:
+        with open(usage_file, "r") as f:
+            calls = json.load(f).get("api_calls", [])
+    except (OSError, ValueError):
+        return []
+    times = sorted(datetime.fromisoformat(call["timestamp"]).timestamp() for call in calls if "timestamp" in call)
+    return [b - a for a, b in zip(times, times[1:]) if 0.5 <= b - a <= 10.0]
+
+def generate_trace(document: str, rng: random.Random, duration: float, debounce: float,
+                   keystroke: float, pauses: List[float], typo_rate: float = 0.03) -> Trace:
+    """Simulate typing a document and return the messages app.js would send
+
+    Keystroke intervals are lognormal around `keystroke` seconds, sentence
+    ends add a pause, and occasional typos are deleted again with a
+    backspace. A message is sent whenever the gap before the next keystroke
+    exceeds the debounce interval.
+    """
+    events: Trace = []
+    text = ""
+    t = 0.0
+    keys = []
+    for char in document:
+        if char.isalpha() and rng.random() < typo_rate:
+            keys.extend([rng.choice("asdfghjkl"), "\b"])
+        keys.append(char)
+
+    for i, key in enumerate(keys):
+        interval = rng.lognormvariate(math.log(keystroke), 0.5)
+        if i and keys[i - 1] in ".!?" and key == " ":
+            interval += rng.choice(pauses) if pauses else rng.uniform(1.0, 4.0)
+        if interval > debounce and text.strip():
+            events.append((t + debounce, text.strip()))
+        t += interval
+        if t > duration:
+            break
+        text = text[:-1] if key == "\b" else text + key
+    if text.strip() and (not events or events[-1][1] != text.strip()) and t <= duration:
+        events.append((t + debounce, text.strip()))
+    return events
+
+def diff_text(old: str, new: str) -> List[list]:
+    """Edit operations turning old into new, as diffText() in static/js/app.js"""
+    if old == new:
+        return []
+    prefix = 0
+    max_prefix = min(len(old), len(new))
+    while prefix < max_prefix and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < max_prefix - prefix and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]:
+        suffix += 1
+    return [[prefix, len(old) - prefix - suffix, new[prefix:len(new) - suffix]]]
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+class Results:
+    """Counters shared by all simulated clients"""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.frames = 0
+        self.stale_frames = 0
+        self.answered = 0
+        self.suggestions = 0
+        self.resyncs = 0
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.sources: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.disconnects = 0
+        self.wall = 0.0
+        self.cpu = float("nan")
+        self.peak_rss = 0
+
+class Client:
+    """One simulated browser tab"""
+
+    def __init__(self, url: str, trace: Trace, protocol: str, results: Results):
+        self.url = url
+        self.trace = trace
+        self.protocol = protocol
+        self.results = results
+        self.request_id = 0
+        self.sent_at: Dict[int, float] = {}
+        self.synced: Optional[str] = None
+        self.text = ""
+
+    async def run(self, start: float, grace: float):
+        loop = asyncio.get_running_loop()
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                receiver = asyncio.create_task(self._receive(ws))
+                for t, text in self.trace:
+                    await asyncio.sleep(max(0.0, start + t - loop.time()))
+                    self.text = text
+                    await self._send(ws)
+                # Give the last request time to be answered
+                await asyncio.sleep(grace)
+                receiver.cancel()
+        except (OSError, websockets.WebSocketException):
+            self.results.disconnects += 1
+
+    async def _send(self, ws):
+        self.request_id += 1
+        if self.protocol == "delta" and self.synced is not None:
+            message = {"edits": diff_text(self.synced, self.text), "length": len(self.text)}
+        else:
+            message = {"text": self.text}
+        message["request_id"] = self.request_id
+        data = json.dumps(message)
+        self.synced = self.text
+        self.sent_at[self.request_id] = time.perf_counter()
+        self.results.requests += 1
+        self.results.bytes_sent += len(data.encode("utf-8"))
+        await ws.send(data)
+
+    async def _receive(self, ws):
+        async for data in ws:
+            now = time.perf_counter()
+            frame = json.loads(data)
+            self.results.frames += 1
+            request_id = frame.get("request_id")
+            if request_id != self.request_id:
+                # A newer message has been sent; the page would drop this frame
+                self.results.stale_frames += 1
+                continue
+            if frame.get("resync"):
+                self.results.resyncs += 1
+                self.synced = None
+                await self._send(ws)
+                continue
+            if "delta" in frame:
+                if frame.get("seq") == 0:
+                    self.results.first_token.append(now - self.sent_at[request_id])
+                continue
+            self.results.answered += 1
+            self.results.latencies.append(now - self.sent_at[request_id])
+            if frame.get("suggestion"):
+                self.results.suggestions += 1
+                self.results.sources[frame.get("source", "unknown")] += 1
+            if frame.get("error"):
+                self.results.errors[frame["error"][:60]] += 1
+
+def process_tree(pid: int) -> List[int]:
+    """The process and all its descendants (Linux /proc)"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+def process_usage(pid: int) -> Tuple[float, int]:
+    """(CPU seconds, RSS bytes) of a process tree, or (nan, 0) where /proc is unavailable"""
+    if not os.path.isdir("/proc"):
+        return float("nan"), 0
+    ticks = os.sysconf("SC_CLK_TCK")
+    page = os.sysconf("SC_PAGE_SIZE")
+    cpu, rss = 0.0, 0
+    for member in process_tree(pid):
+        try:
+            with open(f"/proc/{member}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{member}/statm") as f:
+                resident = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / ticks
+        rss += resident * page
+    return cpu, rss
+
+async def sample_rss(pid: int, peak: List[int]):
+    while True:
+        peak[0] = max(peak[0], process_usage(pid)[1])
+        await asyncio.sleep(1.0)
+
+def start_servers(args, scratch: Path) -> Tuple[subprocess.Popen, Optional[subprocess.Popen]]:
+    """Start the mock Groq server and the app, and wait until the app answers"""
+    log = open(scratch / "server.log", "w")
+    mock = None
+    env = dict(os.environ, PYTHONPATH=str(ROOT), GROQ_API_KEY=os.environ.get("GROQ_API_KEY") or "mock-key")
+    if not args.real_upstream:
+        mock = subprocess.Popen([
+            sys.executable, str(ROOT / "benchmarks" / "mock_groq.py"), "--port", str(args.mock_port),
+            "--latency-model", args.latency_model, "--latency", str(args.latency),
+            "--trace-file", str(args.usage_file), "--tokens-per-second", str(args.tokens_per_second),
+            "--rate-limit-rate", str(args.rate_limit_rate), "--error-rate", str(args.error_rate),
+            "--seed", str(args.seed)
+        ], stdout=log, stderr=subprocess.STDOUT)
+        env["GROQ_API_BASE"] = f"http://{mock_groq.MOCK_HOST}:{args.mock_port}"
+
+    # The app reads static files, templates and data relative to its working directory
+    for name in ("static", "templates"):
+        os.symlink(ROOT / name, scratch / name)
+    (scratch / "data").mkdir()
+    for artifact in (ROOT / "data").glob("*"):
+        if artifact.is_file() and artifact.name != "accepted_suggestions.txt":
+            os.symlink(artifact, scratch / "data" / artifact.name)
+    (scratch / "logs").mkdir()
+
+    app = subprocess.Popen(
+        [sys.executable, "-c", APP_LAUNCHER, str(args.port), "unthrottled" if args.unthrottled else "default"],
+        cwd=scratch, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + 60
+    while True:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{args.port}/", timeout=1)
+            return app, mock
+        except OSError:
+            if app.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"The app did not start; see {scratch / 'server.log'}")
+            time.sleep(0.2)
+
+async def run_load(args, url: str, traces: List[Trace], server_pid: Optional[int]) -> Results:
+    results = Results()
+    loop = asyncio.get_running_loop()
+    start = loop.time() + 1.0
+    clients = [Client(url, trace, args.protocol, results) for trace in traces]
+
+    peak_rss = [0]
+    sampler = asyncio.create_task(sample_rss(server_pid, peak_rss)) if server_pid else None
+    cpu_before = process_usage(server_pid)[0] if server_pid else float("nan")
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(client.run(start, args.grace) for client in clients))
+    results.wall = time.perf_counter() - wall_start
+    if sampler:
+        sampler.cancel()
+        results.cpu = process_usage(server_pid)[0] - cpu_before
+    results.peak_rss = peak_rss[0]
+    return results
+
+def report(args, results: Results, mock_stats: Optional[Dict]) -> Dict:
+    elapsed = results.wall
+    summary = {
+        "clients": args.clients,
+        "protocol": args.protocol,
+        "seconds": elapsed,
+        "requests": results.requests,
+        "requests_per_second": results.requests / elapsed,
+        "bytes_sent": results.bytes_sent,
+        "suggestions": results.suggestions,
+        "suggestions_per_second": results.suggestions / elapsed,
+        "answered": results.answered,
+        "latency_p50": percentile(results.latencies, 50),
+        "latency_p95": percentile(results.latencies, 95),
+        "latency_p99": percentile(results.latencies, 99),
+        "first_token_p50": percentile(results.first_token, 50),
+        "first_token_p99": percentile(results.first_token, 99),
+        "frames": results.frames,
+        "stale_frames": results.stale_frames,
+        "stale_rate": results.stale_frames / results.frames if results.frames else 0.0,
+        "resyncs": results.resyncs,
+        "disconnects": results.disconnects,
+        "sources": dict(results.sources),
+        "errors": dict(results.errors),
+        "server_cpu_percent": 100 * results.cpu / elapsed,
+        "server_peak_rss_mb": results.peak_rss / 2 ** 20,
+        "upstream": mock_stats
+    }
+    print(f"{args.clients} clients for {elapsed:.1f}s ({args.protocol} protocol)")
+    print(f"Requests: {results.requests} ({summary['requests_per_second']:.1f}/s, "
+          f"{results.bytes_sent / 1024:.1f} KiB sent)")
+    print(f"Suggestions: {results.suggestions} ({summary['suggestions_per_second']:.1f}/s); "
+          f"sources {dict(results.sources)}")
+    print(f"End-to-end latency: p50 {summary['latency_p50'] * 1000:.1f}ms, p95 {summary['latency_p95'] * 1000:.1f}ms, "
+          f"p99 {summary['latency_p99'] * 1000:.1f}ms ({results.answered} answered)")
+    print(f"Time to first token: p50 {summary['first_token_p50'] * 1000:.1f}ms, "
+          f"p99 {summary['first_token_p99'] * 1000:.1f}ms")
+    print(f"Stale frames: {results.stale_frames} of {results.frames} ({summary['stale_rate']:.1%}); "
+          f"resyncs {results.resyncs}; disconnects {results.disconnects}")
+    if results.errors:
+        print(f"Errors: {dict(results.errors)}")
+    print(f"Server: {summary['server_cpu_percent']:.0f}% CPU, peak RSS {summary['server_peak_rss_mb']:.0f} MB")
+    if mock_stats:
+        print(f"Upstream (mock): {mock_stats}")
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of typing per client")
+    parser.add_argument("--protocol", choices=("delta", "full"), default="delta")
+    parser.add_argument("--debounce", type=float, default=0.5, help="seconds, as doneTypingInterval in app.js")
+    parser.add_argument("--keystroke", type=float, default=0.2, help="median seconds between keystrokes")
+    parser.add_argument("--grace", type=float, default=3.0, help="seconds to wait for the last replies")
+    parser.add_argument("--seed", type=int, default=16)
+    parser.add_argument("--documents", type=Path, default=ROOT / "requests.jsonl")
+    parser.add_argument("--usage-file", type=Path, default=ROOT / "logs" / "api_usage.json")
+    parser.add_argument("--trace", type=Path, help="replay traces saved with --save-trace")
+    parser.add_argument("--save-trace", type=Path)
+    parser.add_argument("--output", type=Path, help="also write the results as JSON")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="with --url, measure this process tree's CPU and RSS")
+    parser.add_argument("--port", type=int, default=APP_PORT)
+    parser.add_argument("--unthrottled", action="store_true", help="lift the app's rate and daily cost limits")
+    parser.add_argument("--real-upstream", action="store_true", help="use GROQ_API_BASE/the real API, not the mock")
+    parser.add_argument("--mock-port", type=int, default=mock_groq.MOCK_PORT)
+    parser.add_argument("--latency-model", choices=mock_groq.LATENCY_MODELS, default="trace")
+    parser.add_argument("--latency", type=float, default=0.3, help="mock seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of mock responses that are 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of mock responses that are 500")
+    args = parser.parse_args()
+
+    if args.trace:
+        sessions: Dict[int, Trace] = {}
+        with open(args.trace) as f:
+            for line in f:
+                event = json.loads(line)
+                sessions.setdefault(event["session"], []).append((event["t"], event["text"]))
+        traces = list(sessions.values())
+        args.clients = len(traces)
+    else:
+        rng = random.Random(args.seed)
+        documents = load_documents(args.documents)
+        pauses = load_pauses(args.usage_file)
+        traces = [generate_trace(rng.choice(documents), rng, args.duration, args.debounce, args.keystroke, pauses)
+                  for _ in range(args.clients)]
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            for session, trace in enumerate(traces):
+                for t, text in trace:
+                    f.write(json.dumps({"session": session, "t": t, "text": text}) + "\n")
+
+    scratch = None
+    app = mock = None
+    try:
+        if args.url:
+            url, server_pid = args.url, args.server_pid
+        else:
+            scratch = Path(tempfile.mkdtemp(prefix="load-ws-"))
+            app, mock = start_servers(args, scratch)
+            url, server_pid = f"ws://127.0.0.1:{args.port}/ws", app.pid
+        results = asyncio.run(run_load(args, url, traces, server_pid))
+        mock_stats = None
+        if mock:
+            with urllib.request.urlopen(f"http://{mock_groq.MOCK_HOST}:{args.mock_port}/mock/stats") as response:
+                mock_stats = json.load(response)
+        summary = report(args, results, mock_stats)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(summary, f, indent=2)
+    except Exception:
+        if scratch:
+            print(f"Server log kept in {scratch / 'server.log'}", file=sys.stderr)
+            scratch = None
+        raise
+    finally:
+        for process in (app, mock):
+            if process:
+                process.terminate()
+                process.wait()
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
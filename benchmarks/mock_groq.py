@@ -0,0 +1,255 @@
+"""Local stand-in for the Groq (OpenAI-compatible) chat-completions endpoint
+
+Used by the benchmark scripts so throughput and latency can be measured
+without a real API key or network access. Time to first token follows a
+configurable distribution, streamed responses are paced at a token rate,
+and a share of requests can be answered with 429 (rate limited) or 500
+errors. Settings can be changed while the server runs:
+
+    curl -X POST localhost:8765/mock/config -d '{"error_rate": 0.5}'
+    curl localhost:8765/mock/stats
+
+Usage:
+    python benchmarks/mock_groq.py [--latency-model lognormal] [--latency 0.2]
+                                   [--tokens-per-second 800] [--rate-limit-rate 0.05]
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+MOCK_HOST = "127.0.0.1"
+MOCK_PORT = 8765
+LATENCY_MODELS = ("fixed", "uniform", "lognormal", "trace")
+
+class MockSettings:
+    """Behaviour of the mock server; every attribute can be changed at runtime"""
+
+    def __init__(self, latency: float = 0.05, latency_model: str = "fixed", spread: float = 0.5,
+                 tokens_per_second: float = 0.0, rate_limit_rate: float = 0.0, error_rate: float = 0.0,
+                 completion: str = " and then we went home.", trace: Optional[List[float]] = None,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency: Seconds to first token (the median for lognormal, the mean for uniform)
+            latency_model: "fixed", "uniform" (latency +/- spread), "lognormal" (sigma = spread)
+                or "trace" (drawn from recorded latencies)
+            spread: Width of the uniform and lognormal distributions
+            tokens_per_second: Pace of streamed tokens, also added to non-streamed responses (0 for instant)
+            rate_limit_rate: Share of requests answered with 429
+            error_rate: Share of requests answered with 500
+            completion: Text returned as the assistant message
+            trace: Recorded time-to-first-token samples for the "trace" model
+            seed: Seed for reproducible latencies and injected errors
+        """
+        if latency_model not in LATENCY_MODELS:
+            raise ValueError(f"latency_model must be one of {', '.join(LATENCY_MODELS)}")
+        if latency_model == "trace" and not trace:
+            raise ValueError("The trace latency model needs recorded latencies")
+        self.latency = latency
+        self.latency_model = latency_model
+        self.spread = spread
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.completion = completion
+        self.trace = trace or []
+        self.rng = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        """Seconds to wait before the first token"""
+        if self.latency_model == "uniform":
+            return max(0.0, self.rng.uniform(self.latency * (1 - self.spread), self.latency * (1 + self.spread)))
+        if self.latency_model == "lognormal":
+            return self.rng.lognormvariate(math.log(self.latency), self.spread) if self.latency > 0 else 0.0
+        if self.latency_model == "trace":
+            return self.rng.choice(self.trace)
+        return self.latency
+
+    def update(self, changes: Dict):
+        """Apply settings from the /mock/config endpoint"""
+        for key, value in changes.items():
+            if key == "rng" or not hasattr(self, key):
+                raise ValueError(f"Unknown setting: {key}")
+            setattr(self, key, value)
+
+    def public(self) -> Dict:
+        return {key: value for key, value in vars(self).items() if key not in ("rng", "trace")}
+
+def load_trace(usage_file: Path, tokens_per_second: float = 0.0) -> List[float]:
+    """Time-to-first-token samples from successful calls in a usage file (logs/api_usage.json)
+
+    Recorded durations include generating the output, so with a token rate
+    the generation time is subtracted to avoid counting it twice.
+    """
+    with open(usage_file, "r") as f:
+        calls = json.load(f).get("api_calls", [])
+    samples = []
+    for call in calls:
+        if not call.get("success") or not call.get("duration"):
+            continue
+        ttft = call.get("time_to_first_token")
+        if ttft is None:
+            generation = call.get("output_tokens", 0) / tokens_per_second if tokens_per_second else 0.0
+            ttft = max(0.0, call["duration"] - generation)
+        samples.append(ttft)
+    return samples
+
+def create_app(latency: float = 0.05, completion: str = " and then we went home.",
+               settings: Optional[MockSettings] = None) -> FastAPI:
+    """Create the mock server application
+
+    Args:
+        latency: Seconds to wait before answering each request (ignored if settings is given)
+        completion: Text returned as the assistant message (ignored if settings is given)
+        settings: Full mock behaviour
+
+    Returns:
+        FastAPI application serving /openai/v1/chat/completions, /mock/config and /mock/stats
+    """
+    settings = settings or MockSettings(latency=latency, completion=completion)
+    stats = {"requests": 0, "streamed": 0, "rate_limited": 0, "errors": 0, "in_flight": 0}
+    mock_app = FastAPI(title="Mock Groq")
+
+    @mock_app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+
+        # Injected failures are answered straight away, as the real API does
+        roll = settings.rng.random()
+        if roll < settings.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(status_code=429, headers={"retry-after": "1"}, content={"error": {
+                "message": "Rate limit reached for requests. Please try again in 1s.",
+                "type": "requests",
+                "code": "rate_limit_exceeded"
+            }})
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(status_code=500, content={"error": {
+                "message": "Internal server error",
+                "type": "internal_server_error"
+            }})
+
+        model = body.get("model", "mock")
+        completion = settings.completion
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        completion_tokens = max(1, len(completion) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+        latency = settings.sample_latency()
+
+        if body.get("stream"):
+            stats["streamed"] += 1
+            return StreamingResponse(_stream(model, completion, usage, latency), media_type="text/event-stream")
+
+        stats["in_flight"] += 1
+        try:
+            generation = completion_tokens / settings.tokens_per_second if settings.tokens_per_second else 0.0
+            await asyncio.sleep(latency + generation)
+        finally:
+            stats["in_flight"] -= 1
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": completion},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+
+    @mock_app.get("/mock/stats")
+    async def get_stats():
+        return stats
+
+    @mock_app.get("/mock/config")
+    async def get_config():
+        return settings.public()
+
+    @mock_app.post("/mock/config")
+    async def set_config(request: Request):
+        try:
+            settings.update(await request.json())
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        return settings.public()
+
+    async def _stream(model: str, completion: str, usage: Dict, latency: float):
+        # One chunk per word, with the final chunk carrying Groq's x_groq usage block
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(latency)
+            words = completion.split(" ")
+            for i, word in enumerate(words):
+                if i and settings.tokens_per_second:
+                    await asyncio.sleep(1 / settings.tokens_per_second)
+                last = i == len(words) - 1
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": word if i == 0 else " " + word},
+                        "finish_reason": "stop" if last else None
+                    }]
+                }
+                if last:
+                    chunk["x_groq"] = {"id": "req_mock", "usage": usage}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["in_flight"] -= 1
+
+    return mock_app
+
+def start_in_thread(host: str = MOCK_HOST, port: int = MOCK_PORT, **kwargs) -> uvicorn.Server:
+    """Start the mock server in a daemon thread and wait until it is accepting requests"""
+    server = uvicorn.Server(uvicorn.Config(create_app(**kwargs), host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=MOCK_HOST)
+    parser.add_argument("--port", type=int, default=MOCK_PORT)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds to first token")
+    parser.add_argument("--latency-model", choices=LATENCY_MODELS, default="fixed")
+    parser.add_argument("--spread", type=float, default=0.5, help="uniform +/- fraction or lognormal sigma")
+    parser.add_argument("--trace-file", default="logs/api_usage.json",
+                        help="usage file whose call durations the trace model replays")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="0 streams instantly")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    trace = load_trace(Path(args.trace_file), args.tokens_per_second) if args.latency_model == "trace" else None
+    settings = MockSettings(latency=args.latency, latency_model=args.latency_model, spread=args.spread,
+                            tokens_per_second=args.tokens_per_second, rate_limit_rate=args.rate_limit_rate,
+                            error_rate=args.error_rate, trace=trace, seed=args.seed)
+    uvicorn.run(create_app(settings=settings), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
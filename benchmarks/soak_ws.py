@@ -0,0 +1,234 @@
+"""Soak test: thousands of idle and active WebSocket connections held against app.py
+
+Starts the mock Groq server and the app, each in its own process (the app
+in a scratch directory, as in load_ws.py), then:
+
+1. opens --clients connections in batches, recording the server's RSS per
+   open connection
+2. holds them for --duration seconds: every --edit-interval seconds a
+   random share of clients sends an edit, and --slow-clients of them
+   never read what the server sends, so their send queues fill up
+3. samples the server's RSS during the soak; it should level off rather
+   than keep growing
+4. closes every client and checks that the server's connection count
+   returns to zero
+
+Reports the server's connection counters (/api/usage/summary): refused,
+coalesced and dropped frames, and stalled clients disconnected.
+
+Usage:
+    python benchmarks/soak_ws.py [--clients 5000] [--duration 120] [--slow-clients 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import mock_groq  # noqa: E402
+from load_ws import load_documents, process_usage  # noqa: E402
+
+APP_PORT = 8792
+# Every client connects from 127.0.0.1, so the per-address cap is lifted
+APP_LAUNCHER = """
+import sys
+import config
+config.WS_MAX_CONNECTIONS_PER_IP = config.WS_MAX_CONNECTIONS
+config.GROQ_RATE_LIMITS = {model: 10 ** 9 for model in config.GROQ_RATE_LIMITS}
+config.DAILY_COST_LIMIT = float("inf")
+import uvicorn
+import app
+uvicorn.run(app.app, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning", **app.UVICORN_WS_SETTINGS)
+"""
+
+def get_json(url: str) -> Dict:
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.load(response)
+
+def start_servers(args, scratch: Path) -> List[subprocess.Popen]:
+    """Start the mock Groq server and the app, and wait until the app answers"""
+    log = open(scratch / "server.log", "w")
+    env = dict(os.environ, PYTHONPATH=str(ROOT), GROQ_API_KEY=os.environ.get("GROQ_API_KEY") or "mock-key",
+               GROQ_API_BASE=f"http://{mock_groq.MOCK_HOST}:{args.mock_port}")
+    mock = subprocess.Popen([
+        sys.executable, str(ROOT / "benchmarks" / "mock_groq.py"), "--port", str(args.mock_port),
+        "--latency-model", "fixed", "--latency", str(args.latency)
+    ], stdout=log, stderr=subprocess.STDOUT)
+
+    # The app reads static files, templates and data relative to its working directory
+    for name in ("static", "templates"):
+        os.symlink(ROOT / name, scratch / name)
+    (scratch / "data").mkdir()
+    for artifact in (ROOT / "data").glob("*"):
+        if artifact.is_file() and artifact.name != "accepted_suggestions.txt":
+            os.symlink(artifact, scratch / "data" / artifact.name)
+    (scratch / "logs").mkdir()
+
+    app = subprocess.Popen([sys.executable, "-c", APP_LAUNCHER, str(args.port)],
+                           cwd=scratch, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while True:
+        try:
+            get_json(f"http://127.0.0.1:{args.port}/api/usage/summary")
+            return [app, mock]
+        except OSError:
+            if app.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"The app did not start; see {scratch / 'server.log'}")
+            time.sleep(0.2)
+
+class SoakClient:
+    """One connection that sends a text, then edits when told to"""
+
+    def __init__(self, url: str, text: str, slow: bool):
+        self.url = url
+        self.text = text
+        self.slow = slow
+        self.ws = None
+        self.request_id = 0
+        self.frames = 0
+        self.reader: Optional[asyncio.Task] = None
+
+    async def open(self):
+        # A slow client buffers one message and stops reading, so the server's sends back up
+        self.ws = await websockets.connect(self.url, max_queue=1 if self.slow else 32, ping_interval=None,
+                                           open_timeout=60)
+        if not self.slow:
+            self.reader = asyncio.create_task(self._read())
+
+    async def edit(self, rng: random.Random):
+        self.request_id += 1
+        if self.request_id == 1:
+            message = {"text": self.text, "request_id": self.request_id}
+        else:
+            word = " " + rng.choice(self.text.split() or ["word"])
+            message = {"edits": [[len(self.text), 0, word]], "length": len(self.text) + len(word),
+                       "request_id": self.request_id}
+            self.text += word
+        try:
+            await self.ws.send(json.dumps(message))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+        await self.ws.close()
+
+    async def _read(self):
+        try:
+            async for _ in self.ws:
+                self.frames += 1
+        except websockets.ConnectionClosed:
+            pass
+
+async def soak(args, url: str, server_pid: int) -> Dict:
+    rng = random.Random(args.seed)
+    documents = [document[:rng.randint(40, 400)] for document in load_documents(args.documents)]
+    clients = [SoakClient(url, rng.choice(documents), slow=i < args.slow_clients) for i in range(args.clients)]
+    summary_url = url.replace("ws://", "http://").replace("/ws", "/api/usage/summary")
+
+    _, baseline_rss = process_usage(server_pid)
+    print(f"server RSS before connecting: {baseline_rss / 2 ** 20:.1f} MB")
+    opened = 0
+    for start in range(0, len(clients), args.batch):
+        await asyncio.gather(*(client.open() for client in clients[start:start + args.batch]))
+        opened = start + len(clients[start:start + args.batch])
+    await asyncio.sleep(1.0)
+    _, open_rss = process_usage(server_pid)
+    per_connection = (open_rss - baseline_rss) / max(opened, 1)
+    print(f"{opened} connections open: RSS {open_rss / 2 ** 20:.1f} MB, "
+          f"{per_connection / 1024:.1f} KB per idle connection")
+
+    samples = []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + args.duration
+    while loop.time() < deadline:
+        # Slow clients edit every round, so frames keep piling up behind them
+        editing = [client for client in clients if client.slow or rng.random() < args.edit_share]
+        await asyncio.gather(*(client.edit(rng) for client in editing))
+        await asyncio.sleep(args.edit_interval)
+        samples.append(process_usage(server_pid)[1])
+        print(f"  t={args.duration - (deadline - loop.time()):6.1f}s  {len(editing):5d} edits  "
+              f"RSS {samples[-1] / 2 ** 20:.1f} MB")
+
+    # Growth is judged on the second half of the soak, after caches and pools have filled
+    half = samples[len(samples) // 2:] or samples
+    growth = (half[-1] - half[0]) / max(half[0], 1)
+    stats = get_json(summary_url)["connections"]
+
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+    remaining = None
+    for _ in range(50):
+        remaining = get_json(summary_url)["connections"]["connections"]
+        if remaining == 0:
+            break
+        await asyncio.sleep(0.2)
+    _, closed_rss = process_usage(server_pid)
+    return {
+        "clients": args.clients,
+        "rss_per_connection": per_connection,
+        "rss_open": open_rss,
+        "rss_peak": max(samples or [open_rss]),
+        "rss_growth_second_half": growth,
+        "rss_after_close": closed_rss,
+        "frames_received": sum(client.frames for client in clients),
+        "remaining_connections": remaining,
+        "server": stats
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=250, help="connections opened at once")
+    parser.add_argument("--duration", type=float, default=120.0, help="seconds to hold the connections")
+    parser.add_argument("--edit-interval", type=float, default=2.0, help="seconds between rounds of edits")
+    parser.add_argument("--edit-share", type=float, default=0.05, help="share of clients editing each round")
+    parser.add_argument("--slow-clients", type=int, default=50, help="clients that never read")
+    parser.add_argument("--latency", type=float, default=0.1, help="mock seconds to first token")
+    parser.add_argument("--seed", type=int, default=24)
+    parser.add_argument("--documents", type=Path, default=ROOT / "requests.jsonl")
+    parser.add_argument("--port", type=int, default=APP_PORT)
+    parser.add_argument("--mock-port", type=int, default=mock_groq.MOCK_PORT)
+    args = parser.parse_args()
+
+    scratch = Path(tempfile.mkdtemp(prefix="soak-ws-"))
+    processes = []
+    try:
+        processes = start_servers(args, scratch)
+        result = asyncio.run(soak(args, f"ws://127.0.0.1:{args.port}/ws", processes[0].pid))
+    except Exception:
+        print(f"Server log kept in {scratch / 'server.log'}", file=sys.stderr)
+        scratch = None
+        raise
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    server = result["server"]
+    print(f"\nRSS peak {result['rss_peak'] / 2 ** 20:.1f} MB, growth over the second half of the soak "
+          f"{result['rss_growth_second_half'] * 100:+.1f}%, after closing {result['rss_after_close'] / 2 ** 20:.1f} MB")
+    print(f"frames received {result['frames_received']}, coalesced {server['coalesced']}, "
+          f"dropped {server['dropped']}, stalled clients disconnected {server['stalled']}, refused {server['refused']}")
+    if result["remaining_connections"] != 0:
+        print(f"FAIL: {result['remaining_connections']} connections still registered after every client closed")
+        sys.exit(1)
+    print("OK: every connection was released")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Gauge values of the states
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitBreaker:
+    """Stops upstream LLM calls while the upstream is failing or slow
+
+    Closed: calls go through, and the outcomes (failed, slow or fine) of
+    the last CIRCUIT_WINDOW_CALLS calls within CIRCUIT_WINDOW seconds are
+    kept. Once the window holds at least
+    CIRCUIT_MIN_CALLS calls and the share that failed reaches
+    CIRCUIT_ERROR_THRESHOLD, or the share that was slow reaches
+    CIRCUIT_SLOW_CALL_THRESHOLD, the circuit opens.
+
+    Open: no calls are made, so requests are answered from the caches and
+    the local model at once instead of each waiting out a request timeout.
+    After the open period the circuit is half-open.
+
+    Half-open: up to CIRCUIT_HALF_OPEN_PROBES calls at a time go through as
+    probes. CIRCUIT_CLOSE_SUCCESSES good probes close the circuit; a failed
+    or slow one opens it again for twice as long, up to
+    CIRCUIT_MAX_OPEN_SECONDS.
+
+    Calls are degraded (shorter, not retried, with a longer client debounce)
+    while half-open, and while closed once CIRCUIT_DEGRADED_RATE of the
+    window's calls failed or were slow.
+
+    Each admitted call is tagged with the breaker's epoch, which changes on
+    every transition, so a call started before the circuit opened does not
+    count against the probes that follow.
+    """
+
+    def __init__(self, window: float = None, window_calls: int = None, min_calls: int = None,
+                 error_threshold: float = None,
+                 slow_call_seconds: float = None, slow_call_threshold: float = None,
+                 open_seconds: float = None, max_open_seconds: float = None,
+                 half_open_probes: int = None, close_successes: int = None, degraded_rate: float = None):
+        """Initialize the breaker
+
+        Args:
+            window: Seconds of call outcomes kept
+            window_calls: Most call outcomes kept
+            min_calls: Calls in the window before the circuit may open
+            error_threshold: Share of failed calls that opens the circuit
+            slow_call_seconds: Latency above which a call counts as slow
+            slow_call_threshold: Share of slow calls that opens the circuit
+            open_seconds: Seconds the circuit first stays open
+            max_open_seconds: Longest the circuit stays open
+            half_open_probes: Probe calls in flight at once while half-open
+            close_successes: Successful probes that close the circuit
+            degraded_rate: Share of failed or slow calls at which calls are degraded
+        """
+        self.window = window or config.CIRCUIT_WINDOW
+        self.window_calls = window_calls or config.CIRCUIT_WINDOW_CALLS
+        self.min_calls = min_calls or config.CIRCUIT_MIN_CALLS
+        self.error_threshold = error_threshold or config.CIRCUIT_ERROR_THRESHOLD
+        self.slow_call_seconds = slow_call_seconds or config.CIRCUIT_SLOW_CALL_SECONDS
+        self.slow_call_threshold = slow_call_threshold or config.CIRCUIT_SLOW_CALL_THRESHOLD
+        self.base_open_seconds = open_seconds or config.CIRCUIT_OPEN_SECONDS
+        self.max_open_seconds = max_open_seconds or config.CIRCUIT_MAX_OPEN_SECONDS
+        self.half_open_probes = half_open_probes or config.CIRCUIT_HALF_OPEN_PROBES
+        self.close_successes = close_successes or config.CIRCUIT_CLOSE_SUCCESSES
+        self.degraded_rate = degraded_rate or config.CIRCUIT_DEGRADED_RATE
+
+        self._state = CLOSED
+        self._epoch = 0
+        # (time.monotonic(), failed, slow) of the calls in the window, and running counts of those
+        # that failed, were slow, and either
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()
+        self._failed = 0
+        self._slow = 0
+        self._unhealthy = 0
+        self.open_seconds = self.base_open_seconds
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._on_transition: Optional[Callable[[str, str], None]] = None
+
+        self.trips = 0
+        self.rejected = 0
+        self.last_transition: Optional[float] = None
+
+    def attach(self, on_transition: Callable[[str, str], None]):
+        """Set a function called with the old and new state on every transition"""
+        self._on_transition = on_transition
+
+    @property
+    def state(self) -> str:
+        """The current state; an open circuit whose open period is over reports half-open"""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """Whether a call would be refused right now"""
+        if not config.ENABLE_CIRCUIT_BREAKER:
+            return False
+        state = self.state
+        return state == OPEN or (state == HALF_OPEN and self._probes >= self.half_open_probes)
+
+    @property
+    def degraded(self) -> bool:
+        """Whether calls should be degraded"""
+        if not config.ENABLE_CIRCUIT_BREAKER:
+            return False
+        state = self.state
+        if state != CLOSED:
+            return True
+        self._expire(time.monotonic())
+        calls = len(self._outcomes)
+        return calls >= self.min_calls and self._unhealthy / calls >= self.degraded_rate
+
+    def acquire(self) -> Optional[int]:
+        """Ask to make an upstream call
+
+        Returns:
+            The epoch to pass to record() or record_cancelled() when the call
+            ends, or None if the call must not be made
+        """
+        if not config.ENABLE_CIRCUIT_BREAKER:
+            return self._epoch
+        state = self.state
+        if state == CLOSED:
+            return self._epoch
+        if state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return self._epoch
+        self.rejected += 1
+        return None
+
+    def record(self, epoch: int, latency: float, success: bool):
+        """Record the outcome of a call admitted by acquire()
+
+        Args:
+            epoch: What acquire() returned
+            latency: Time to first token for streamed calls, otherwise the call duration
+            success: Whether the call succeeded
+        """
+        if epoch != self._epoch:
+            # Started before the last transition: it says nothing about the current state
+            return
+        slow = latency > self.slow_call_seconds
+        if self._state == HALF_OPEN:
+            self._probes -= 1
+            if not success or slow:
+                # Still unhealthy: wait longer before probing again
+                self._open(min(self.open_seconds * 2, self.max_open_seconds))
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.close_successes:
+                self.open_seconds = self.base_open_seconds
+                self._transition(CLOSED)
+            return
+        if self._state != CLOSED:
+            return
+        now = time.monotonic()
+        self._expire(now)
+        self._outcomes.append((now, not success, slow))
+        self._failed += not success
+        self._slow += slow
+        self._unhealthy += not success or slow
+        if len(self._outcomes) > self.window_calls:
+            self._drop_oldest()
+        calls = len(self._outcomes)
+        if calls >= self.min_calls and (self._failed / calls >= self.error_threshold
+                                        or self._slow / calls >= self.slow_call_threshold):
+            logger.warning(f"Opening the upstream circuit: {self._failed} of {calls} calls failed, "
+                           f"{self._slow} slow in the last {self.window:.0f}s")
+            self._open(self.base_open_seconds)
+
+    def record_cancelled(self, epoch: int, elapsed: float):
+        """Record a call cancelled before it finished
+
+        A call cancelled after slow_call_seconds counts as slow; one
+        cancelled sooner says nothing about the upstream, but a probe frees
+        its place for the next.
+        """
+        if elapsed > self.slow_call_seconds:
+            self.record(epoch, elapsed, success=True)
+        elif epoch == self._epoch and self._state == HALF_OPEN:
+            self._probes -= 1
+
+    def stats(self) -> Dict:
+        """Get the state, the window's failure and slow call shares, and counters"""
+        state = self.state
+        self._expire(time.monotonic())
+        calls = len(self._outcomes)
+        if not config.ENABLE_CIRCUIT_BREAKER:
+            mode = "disabled"
+        elif self.is_open:
+            mode = "local_only"
+        else:
+            mode = "degraded" if self.degraded else "normal"
+        return {
+            "state": state,
+            "mode": mode,
+            "calls": calls,
+            "error_rate": self._failed / calls if calls else 0.0,
+            "slow_rate": self._slow / calls if calls else 0.0,
+            "open_seconds": self.open_seconds,
+            "trips": self.trips,
+            "rejected": self.rejected
+        }
+
+    def _expire(self, now: float):
+        outcomes = self._outcomes
+        while outcomes and now - outcomes[0][0] > self.window:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, failed, slow = self._outcomes.popleft()
+        self._failed -= failed
+        self._slow -= slow
+        self._unhealthy -= failed or slow
+
+    def _open(self, seconds: float):
+        self.open_seconds = seconds
+        self._opened_at = time.monotonic()
+        self.trips += 1
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        previous, self._state = self._state, state
+        self._epoch += 1
+        self._probes = 0
+        self._probe_successes = 0
+        # Every state starts from a clean window
+        self._outcomes.clear()
+        self._failed = self._slow = self._unhealthy = 0
+        self.last_transition = time.time()
+        logger.info(f"Upstream circuit {previous} -> {state}")
+        if self._on_transition is not None:
+            try:
+                self._on_transition(previous, state)
+            except Exception as e:
+                logger.error(f"Error in circuit transition callback: {str(e)}")
+
+# Create a singleton instance
+circuit_breaker = CircuitBreaker()
@@ -17,29 +17,160 @@ DEFAULT_MODEL = "llama3-8b-8192"
 MAX_TOKENS = 100
 TEMPERATURE = 0.7
 
+# LLM HTTP Client Configuration
+GROQ_API_BASE = os.getenv("GROQ_API_BASE") or None  # Override to point at a proxy or local mock server
+LLM_REQUEST_TIMEOUT = 10.0  # seconds
+LLM_MAX_RETRIES = 2
+LLM_MAX_CONNECTIONS = 100  # Maximum concurrent connections in the HTTP pool
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20  # Idle connections kept open for reuse
+LLM_KEEPALIVE_EXPIRY = 30.0  # seconds before an idle pooled connection is closed
+
+# Upstream Scheduler Configuration
+UPSTREAM_MAX_CONCURRENCY = 16  # Maximum concurrent LLM calls per worker
+UPSTREAM_MAX_PER_CLIENT = 2  # Maximum concurrent LLM calls per connection
+UPSTREAM_QUEUE_TIMEOUT = 2.0  # seconds a request may wait for a slot or rate limit room (clients may send a shorter deadline_ms)
+
+# Model Routing Configuration
+ENABLE_MODEL_ROUTING = False  # Route each call to the best model in GROQ_PRICING/GROQ_RATE_LIMITS (False: always DEFAULT_MODEL)
+ENABLE_HEDGING = False  # Send a second call to another model when the first is slower than its recent p95
+ROUTER_COST_BUDGET = 0.50  # USD per 1M tokens; maximum estimated cost per token of a call (prompt and completion) for a model to be chosen
+ROUTER_EWMA_ALPHA = 0.2  # Weight of the newest call in the latency and error rate averages
+ROUTER_LATENCY_WINDOW = 100  # Recent latencies kept per model for the hedging deadline
+ROUTER_PRIOR_LATENCY = 0.5  # seconds; assumed latency of a model without recent calls
+ROUTER_PRIOR_OUTPUT_TOKENS = 20  # Assumed completion length for cost estimates
+ROUTER_STATS_DECAY = 120.0  # seconds for an unused model's averages to drift most of the way back to the priors
+ROUTER_ERROR_PENALTY = 5.0  # seconds of expected latency added per unit of error rate
+ROUTER_HEDGE_MIN_SAMPLES = 20  # Calls a model needs before its calls are hedged
+ROUTER_HEDGE_MULTIPLIER = 1.0  # Hedge after this multiple of the model's p95 latency
+ROUTER_HEDGE_MIN_DELAY = 0.05  # seconds; never hedge sooner than this
+
+# Circuit Breaker Configuration
+ENABLE_CIRCUIT_BREAKER = True  # Stop calling the LLM while it is failing or slow and answer from caches and the local model
+CIRCUIT_WINDOW = 30.0  # seconds of upstream call outcomes the breaker judges the upstream on
+CIRCUIT_WINDOW_CALLS = 20  # ...and at most this many of the latest calls, so a busy worker reacts as fast as a quiet one
+CIRCUIT_MIN_CALLS = 10  # Calls in the window before the circuit may open
+CIRCUIT_ERROR_THRESHOLD = 0.5  # Share of failed calls in the window that opens the circuit
+CIRCUIT_SLOW_CALL_SECONDS = 3.0  # A call taking longer than this (to its first token when streamed) counts as slow
+CIRCUIT_SLOW_CALL_THRESHOLD = 0.8  # Share of slow calls in the window that opens the circuit
+CIRCUIT_OPEN_SECONDS = 5.0  # seconds the circuit stays open before probe calls are let through; doubles after a failed probe
+CIRCUIT_MAX_OPEN_SECONDS = 60.0  # Longest the circuit stays open between probes
+CIRCUIT_HALF_OPEN_PROBES = 2  # Probe calls in flight at once while half-open
+CIRCUIT_CLOSE_SUCCESSES = 3  # Successful probes that close the circuit again
+CIRCUIT_DEGRADED_RATE = 0.2  # Share of failed or slow calls at which calls are degraded while the circuit is closed
+CIRCUIT_DEGRADED_MAX_TOKENS = 40  # MAX_TOKENS of degraded calls
+CIRCUIT_DEGRADED_TIMEOUT = 4.0  # seconds; request timeout of degraded calls, which are not retried
+CIRCUIT_DEGRADED_DEBOUNCE_MS = 1500  # Typing pause clients wait for before asking for a suggestion while degraded
+
 # WebSocket Configuration
-WS_PING_INTERVAL = 30  # seconds
+WS_PING_INTERVAL = 30  # seconds between server heartbeat pings
+WS_PING_TIMEOUT = 20  # seconds to answer a ping before the connection is closed as dead
+WS_IDLE_TIMEOUT = 600  # seconds without a client message before the server closes the connection
+WS_MAX_CONNECTIONS = 10000  # Open connections per worker; more are refused
+WS_MAX_CONNECTIONS_PER_IP = 50  # Open connections per client address per worker; more are refused
+WS_SEND_QUEUE_SIZE = 32  # Frames waiting to be sent per connection; the oldest are dropped beyond it
+WS_SEND_TIMEOUT = 10.0  # seconds one send may wait on a client that does not read before it is disconnected
+ENABLE_STREAMING = True  # Stream suggestion tokens to the client as they are generated
+ENABLE_DELTA_PROTOCOL = True  # Accept edit operations against the connection's text instead of the full text
+MAX_DOCUMENT_CHARS = 1000000  # Longest text kept per connection
+WS_MAX_MESSAGE_BYTES = 4 * MAX_DOCUMENT_CHARS  # Largest client message accepted (UTF-8 is at most 4 bytes a character)
+ENABLE_BINARY_PROTOCOL = True  # Use compact binary frames with clients that offer the suggest.bin.v1 subprotocol
+WS_PER_MESSAGE_DEFLATE = False  # Negotiate permessage-deflate; costs each connection about 270 KB of zlib state
+
+# Prompt Context Configuration
+CONTEXT_WINDOW_CHARS = 2000  # Only this many trailing characters go into the prompt, starting at a sentence
+CONTEXT_SUMMARY_CHARS = 0  # Also include up to this many characters of opening sentences (0 to disable)
 DEBUG_MODE = True
 
 # Server Configuration
 HOST = "0.0.0.0"
 PORT = 8000
 
+# Startup Configuration
+WARMUP_CONNECTIONS = 2  # Upstream connections opened before the worker reports ready
+WARMUP_STEP_TIMEOUT = 10.0  # seconds each warm-up step may take before it is given up
+IMPORT_TIME_BUDGET = 0.8  # seconds to import the app; benchmarks/bench_startup.py fails above it
+READY_TIME_BUDGET = 5.0  # seconds from process start until /ready; benchmarks/bench_startup.py fails above it
+
+# Usage Feed Configuration
+USAGE_FEED_INTERVAL = 1.0  # seconds between usage deltas pushed to dashboards
+USAGE_FEED_BACKLOG = 64  # Deltas kept for dashboards that fall behind; further behind gets a new snapshot
+USAGE_FEED_RECENT_CALLS = 20  # Calls sent in a snapshot, and at most in one delta
+USAGE_FEED_KEEPALIVE = 15.0  # seconds of silence before a keepalive comment is sent
+
+# Metrics Configuration
+LOOP_LAG_INTERVAL = 0.5  # seconds between event loop lag measurements
+PROFILER_INTERVAL = 0.005  # seconds between sampling profiler samples
+ENABLE_PROFILER_ENDPOINTS = DEBUG_MODE  # Allow starting/stopping the sampling profiler over HTTP
+
 # Spell Checker Configuration
 ENABLE_SPELL_CHECK = True  # Set to False to disable spell checking
 SPELL_CHECK_MIN_WORD_LENGTH = 3  # Minimum word length to check for spelling errors
 SPELL_CHECK_IGNORE_CAPITALIZED = True  # Ignore words that start with a capital letter (proper nouns)
+SPELL_CHECK_ENGINE = "symspell"  # "symspell" (precomputed delete index) or "pyspellchecker"
+SPELL_INDEX_FILE = "data/spell_index.bin"  # Built from pyspellchecker's dictionary on first use
+SPELL_CHECK_MEMO_SIZE = 50000  # Word -> correction results remembered per process
+SPELL_CHECK_WORKERS = 2  # Worker processes for spell correction (0 = correct on the event loop)
+SPELL_CHECK_BATCH_WINDOW = 0.005  # seconds to collect words from all connections into one batch
+SPELL_CHECK_MAX_BATCH_WORDS = 512  # Flush a batch early once it holds this many unique words
+
+# Suggestion Cache Configuration
+ENABLE_SUGGESTION_CACHE = True  # Set to False to always call the LLM
+SUGGESTION_CACHE_MAX_ENTRIES = 5000  # Least recently used entries are evicted beyond this
+SUGGESTION_CACHE_TTL = 600  # seconds a cached suggestion stays valid
+SUGGESTION_CACHE_PREFIX_WINDOW = 400  # Max characters of a cached suggestion the user can have typed
+SUGGESTION_CACHE_MAX_TEXT_LENGTH = 4000  # Longer texts are not cached
+
+# Semantic Cache Configuration
+ENABLE_SEMANTIC_CACHE = True  # Serve near-duplicate texts (case, punctuation, a word or two apart) from cached suggestions
+SEMANTIC_CACHE_MAX_ENTRIES = 5000  # Least recently used entries are evicted beyond this
+SEMANTIC_CACHE_THRESHOLD = 0.8  # Minimum estimated Jaccard similarity of the compared text tails
+SEMANTIC_CACHE_TAIL_CHARS = 200  # Characters at the end of the text that are compared
+SEMANTIC_CACHE_GUARD_WORDS = 2  # The last words must match exactly, since the continuation depends on them
+SEMANTIC_CACHE_SIGNATURE_SIZE = 64  # MinHash bins per text (a power of two)
+SEMANTIC_CACHE_BAND_SIZE = 4  # Bins per locality-sensitive hashing band
+
+# Local Completion Configuration
+ENABLE_LOCAL_COMPLETION = True  # Serve confident short completions from the local n-gram model
+NGRAM_MODEL_FILE = "data/ngram_model.json"  # Trained offline with: python ngram_model.py corpus.txt
+NGRAM_ACCEPTED_FILE = "data/accepted_suggestions.txt"  # Accepted suggestions, included in the next training run
+NGRAM_ACCEPTED_FLUSH_INTERVAL = 1.0  # seconds between background appends of accepted suggestions to that file
+NGRAM_ORDER = 3  # Longest n-gram (contexts of up to 2 words)
+NGRAM_MIN_COUNT = 3  # Contexts seen fewer times are not used
+NGRAM_MAX_WORDS = 4  # Longest local completion in words
+NGRAM_CONFIDENCE = 0.6  # Serve locally instead of calling the LLM at or above this probability
+NGRAM_FALLBACK_CONFIDENCE = 0.05  # Serve locally when the LLM is throttled at or above this probability
+
+# Speculative Prefetch Configuration
+ENABLE_SPECULATION = False  # Precompute the suggestion that follows a delivered one, so accepting it gets an instant follow-up
+SPECULATION_IDLE_DELAY = 0.3  # seconds without new input after a suggestion before prefetching the next one
+SPECULATION_SESSION_BUDGET = 0.002  # USD each connection may spend on speculative calls
 
 # Cost Tracking Configuration
 ENABLE_COST_TRACKING = True  # Set to False to disable cost tracking
-COST_LOG_FILE = "api_usage.json"  # File to store API usage data
+COST_LOG_FILE = "api_usage.json"  # Legacy usage file, migrated into the usage log on first start
+USAGE_LOG_NAME = "api_usage"  # Usage log files are logs/<name>.snapshot.json and logs/<name>.<generation>.<pid>.jsonl
+USAGE_LOG_FLUSH_INTERVAL = 0.5  # seconds between background flushes of buffered usage records
+USAGE_LOG_BATCH_SIZE = 256  # Flush early once this many records are buffered
+USAGE_LOG_FSYNC = "interval"  # "always" (every batch), "interval" or "never" (leave it to the OS)
+USAGE_LOG_FSYNC_INTERVAL = 5.0  # seconds between fsyncs with the "interval" policy
+USAGE_LOG_COMPACT_RECORDS = 10000  # Fold the log into a new snapshot after this many records
+ENABLE_USAGE_STORE = True  # Keep the full call history in a queryable SQLite database
+USAGE_STORE_FILE = "logs/api_usage.db"  # SQLite usage history database
+USAGE_QUERY_MAX_LIMIT = 500  # Maximum page size of /api/usage/calls
+TOKEN_COUNTER = "bpe"  # "bpe" (the model's tokenizer, when TOKENIZER_FILE exists) or "heuristic" (4 characters per token)
+TOKENIZER_FILE = "data/tokenizer.model"  # tiktoken-format rank file, e.g. Llama 3's tokenizer.model
+TOKEN_COUNT_CACHE_SIZE = 4096  # Cached token counts of texts and of words
 DAILY_COST_LIMIT = 5.0  # Maximum cost allowed per day in USD
 RATE_LIMIT_THRESHOLD = 0.8  # Percentage of rate limit at which to start throttling (0.0-1.0)
+RATE_LIMIT_WINDOW = 60  # seconds; GROQ_RATE_LIMITS are requests per window
+RATE_LIMIT_STATE_FILE = "logs/rate_limit.bin"  # Rate limit and daily cost state shared by all worker processes
 
 # Groq API Rate Limits (as of implementation date)
 # These values may change based on Groq's policies
 GROQ_RATE_LIMITS = {
     "llama3-8b-8192": 500,  # 500 requests per minute
+    "gemma2-9b-it": 500,  # 500 requests per minute
+    "llama3-70b-8192": 100,  # 100 requests per minute
 }
 
 # Groq API Pricing (as of implementation date)
@@ -48,5 +179,13 @@ GROQ_PRICING = {
     "llama3-8b-8192": {
         "input": 0.20,  # $0.20 per 1M input tokens
         "output": 0.70,  # $0.70 per 1M output tokens
+    },
+    "gemma2-9b-it": {
+        "input": 0.20,  # $0.20 per 1M input tokens
+        "output": 0.20,  # $0.20 per 1M output tokens
+    },
+    "llama3-70b-8192": {
+        "input": 0.59,  # $0.59 per 1M input tokens
+        "output": 0.79,  # $0.79 per 1M output tokens
     }
 }
\ No newline at end of file
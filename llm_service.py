@@ -1,19 +1,33 @@
 import logging
 import asyncio
 import time
-import json
-import os
+from contextlib import aclosing
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import TYPE_CHECKING, Dict, Optional, List, AsyncIterator, Hashable, Union
 from pathlib import Path
 
-from langchain_groq import ChatGroq
-from langchain.schema import HumanMessage, SystemMessage
-from langchain.prompts import ChatPromptTemplate
-from langchain.callbacks.base import BaseCallbackHandler, BaseCallbackManager
+import httpx
 
 import config
-from spell_checker import correct_spelling
+from spell_checker import correct_spelling_async, SpellCheckSession
+from suggestion_cache import suggestion_cache
+from semantic_cache import semantic_cache
+from single_flight import SingleFlight
+from usage_log import UsageLog, apply_usage_record
+from usage_store import UsageStore
+from usage_feed import usage_feed
+from rate_limiter import SharedRateLimiter
+from upstream_scheduler import UpstreamScheduler, UpstreamBusy, SlotTicket
+from ngram_model import local_completer
+from text_buffer import GapBuffer, build_context
+from metrics import stage_timer, observe_stage
+from token_counter import token_counter
+from model_router import model_router
+from circuit_breaker import circuit_breaker, CLOSED
+
+# LangChain takes most of a cold start to import, so it is only imported on first use (see warmup)
+if TYPE_CHECKING:
+    from langchain_groq import ChatGroq
 
 # Configure logging
 logging.basicConfig(
@@ -50,47 +64,51 @@ class CostTracker:
     
     def __init__(self, log_file=None):
         self.log_file = LOGS_DIR / (log_file or config.COST_LOG_FILE)
+        # Full, queryable call history; the in-memory usage data only keeps recent calls
+        self.usage_store = UsageStore() if config.ENABLE_USAGE_STORE else None
+        sinks = [self.usage_store.insert_records] if self.usage_store else []
+        self.usage_log = UsageLog(LOGS_DIR, legacy_file=self.log_file, sinks=sinks)
         self.usage_data = self._load_usage_data()
-        self.request_timestamps = []
+        if self.usage_store:
+            # Seed a new store with the call history kept so far (once, whichever worker starts first)
+            self.usage_store.seed(self.usage_data["api_calls"])
+        # Request and daily cost budgets shared with every worker process on this host
+        self.rate_limiter = SharedRateLimiter()
+        self.rate_limiter.seed_daily_cost(self.get_usage_summary()["today_usage"]["cost"])
         self.daily_cost_limit = config.DAILY_COST_LIMIT
         self.rate_limit_threshold = config.RATE_LIMIT_THRESHOLD
         
     def _load_usage_data(self) -> Dict:
-        """Load existing usage data or create new structure"""
-        if self.log_file.exists():
-            try:
-                with open(self.log_file, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                logger.error(f"Error loading usage data from {self.log_file}. Creating new data.")
-        
-        # Initialize new usage data structure
-        return {
-            "total_requests": 0,
-            "total_input_tokens": 0,
-            "total_output_tokens": 0,
-            "total_cost": 0.0,
-            "requests_by_date": {},
-            "api_calls": []
-        }
+        """Rebuild usage data from the usage log, migrating the legacy file if needed"""
+        return self.usage_log.load()
+    
+    def _record(self, record: Dict):
+        """Apply a usage record in memory and queue it for the usage log"""
+        with stage_timer("cost_logging"):
+            apply_usage_record(self.usage_data, record)
+            self.usage_log.append(record)
+            usage_feed.record(record)
     
-    def _save_usage_data(self):
-        """Save usage data to log file"""
-        with open(self.log_file, 'w') as f:
-            json.dump(self.usage_data, f, indent=2)
+    def close(self):
+        """Flush pending usage records to disk"""
+        self.usage_log.close()
     
     def log_api_call(self, model: str, input_tokens: int, output_tokens: int, 
-                    duration: float, success: bool, error: Optional[str] = None):
-        """Log details of an API call"""
+                    duration: float, success: bool, error: Optional[str] = None,
+                    time_to_first_token: Optional[float] = None, hedge: Optional[str] = None,
+                    speculative: bool = False):
+        """Log details of an API call
+        
+        hedge is "won" or "lost" for the attempts of a hedged call (see _hedged).
+        Speculative calls (see prefetch_suggestion) count towards the daily cost
+        limit but are totalled apart from the calls that served a request.
+        """
         # Calculate cost based on token usage and model pricing
         pricing = GroqPricing.get_pricing(model)
         input_cost = (input_tokens / 1_000_000) * pricing["input"]
         output_cost = (output_tokens / 1_000_000) * pricing["output"]
         total_cost = input_cost + output_cost
         
-        # Get current date for grouping
-        today = datetime.now().strftime("%Y-%m-%d")
-        
         # Create API call record
         api_call = {
             "timestamp": datetime.now().isoformat(),
@@ -104,74 +122,122 @@ class CostTracker:
             "success": success
         }
         
+        if time_to_first_token is not None:
+            api_call["time_to_first_token"] = time_to_first_token
+        
+        if hedge:
+            api_call["hedge"] = hedge
+        
+        if speculative:
+            api_call["speculative"] = True
+        
         if error:
             api_call["error"] = error
         
-        # Update usage statistics
-        self.usage_data["total_requests"] += 1
-        self.usage_data["total_input_tokens"] += input_tokens
-        self.usage_data["total_output_tokens"] += output_tokens
-        self.usage_data["total_cost"] += total_cost
-        
-        # Update date-based statistics
-        if today not in self.usage_data["requests_by_date"]:
-            self.usage_data["requests_by_date"][today] = {
-                "requests": 0,
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "cost": 0.0
-            }
-        
-        self.usage_data["requests_by_date"][today]["requests"] += 1
-        self.usage_data["requests_by_date"][today]["input_tokens"] += input_tokens
-        self.usage_data["requests_by_date"][today]["output_tokens"] += output_tokens
-        self.usage_data["requests_by_date"][today]["cost"] += total_cost
-        
-        # Add API call to history (limit to last 1000 calls to prevent file growth)
-        self.usage_data["api_calls"].append(api_call)
-        if len(self.usage_data["api_calls"]) > 1000:
-            self.usage_data["api_calls"] = self.usage_data["api_calls"][-1000:]
-        
-        # Save updated data
-        self._save_usage_data()
+        # Update usage statistics and append to the usage log
+        self._record({"type": "speculative" if speculative else "call", **api_call})
+        self.rate_limiter.add_cost(total_cost, api_call["timestamp"][:10])
         
         # Log summary
         logger.info(f"API Call: {input_tokens} input tokens, {output_tokens} output tokens, ${total_cost:.6f} cost")
         
         return api_call
     
+    def log_cancelled_call(self, model: str, duration: float, hedge: Optional[str] = None,
+                           input_tokens: int = 0, output_tokens: int = 0):
+        """Record an API call that was cancelled before it completed
+        
+        Cancelled calls are superseded by a newer request on the same connection,
+        or lost a hedged race (hedge="lost"). They are counted separately and do
+        not add to the request totals. A hedge loser was sent and may be billed,
+        so it is logged with its prompt tokens and any tokens it streamed, and
+        their cost adds to the cost totals and the daily cost limit.
+        """
+        record = {
+            "type": "cancelled",
+            "timestamp": datetime.now().isoformat(),
+            "model": model,
+            "duration": duration
+        }
+        if hedge:
+            record["hedge"] = hedge
+        if input_tokens or output_tokens:
+            pricing = GroqPricing.get_pricing(model)
+            input_cost = (input_tokens / 1_000_000) * pricing["input"]
+            output_cost = (output_tokens / 1_000_000) * pricing["output"]
+            record.update({
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "input_cost": input_cost,
+                "output_cost": output_cost,
+                "total_cost": input_cost + output_cost
+            })
+            self.rate_limiter.add_cost(record["total_cost"], record["timestamp"][:10])
+        self._record(record)
+        
+        logger.info(f"API Call cancelled: {model} after {duration:.3f}s")
+    
+    def log_cache_hit(self, model: str, duration: float, prefix_match: bool = False,
+                      similarity: Optional[float] = None):
+        """Record a request served from the suggestion cache
+        
+        Cache hits are zero-cost served requests: they appear in the API call
+        history but do not add to the upstream request, token or cost totals.
+        similarity is set for hits on a near-duplicate text (see semantic_cache).
+        """
+        api_call = {
+            "timestamp": datetime.now().isoformat(),
+            "model": model,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "input_cost": 0.0,
+            "output_cost": 0.0,
+            "total_cost": 0.0,
+            "duration": duration,
+            "success": True,
+            "cached": True,
+            "prefix_match": prefix_match
+        }
+        
+        if similarity is not None:
+            api_call["similarity"] = similarity
+        
+        self._record({"type": "cache_hit", **api_call})
+        
+        return api_call
+    
     def check_rate_limit(self, model: str) -> bool:
         """Check if we're approaching rate limits"""
         # Skip check if cost tracking is disabled
         if not config.ENABLE_COST_TRACKING:
             return True
-            
-        # Clean up old timestamps (older than 1 minute)
-        current_time = time.time()
-        self.request_timestamps = [ts for ts in self.request_timestamps if current_time - ts < 60]
         
-        # Get rate limit for model
+        # Check if we're at the configured threshold of the rate limit, across all workers
         rate_limit = GroqPricing.get_rate_limit(model)
-        
-        # Check if we're at the configured threshold of the rate limit
-        return len(self.request_timestamps) < (rate_limit * self.rate_limit_threshold)
+        return self.rate_limiter.allowed(model, rate_limit * self.rate_limit_threshold)
     
-    def record_request(self):
-        """Record a timestamp for rate limiting"""
-        self.request_timestamps.append(time.time())
+    def record_request(self, model: str = None) -> float:
+        """Count a request against the shared rate limit
+        
+        Returns:
+            0.0 if the request was counted, otherwise the seconds until the
+            rate limit threshold leaves room for it
+        """
+        if not config.ENABLE_COST_TRACKING:
+            return 0.0
+        
+        model = model or config.DEFAULT_MODEL
+        rate_limit = GroqPricing.get_rate_limit(model)
+        return self.rate_limiter.try_acquire(model, rate_limit * self.rate_limit_threshold)
         
     def check_daily_cost_limit(self) -> bool:
         """Check if we've exceeded the daily cost limit"""
         # Skip check if cost tracking is disabled
         if not config.ENABLE_COST_TRACKING:
             return True
-            
-        # Get today's usage
-        today = datetime.now().strftime("%Y-%m-%d")
-        today_usage = self.usage_data["requests_by_date"].get(today, {"cost": 0.0})
         
-        # Check if we've exceeded the daily cost limit
-        return today_usage["cost"] < self.daily_cost_limit
+        # Check today's cost across all workers against the daily cost limit
+        return self.rate_limiter.daily_cost() < self.daily_cost_limit
     
     def get_usage_summary(self) -> Dict:
         """Get a summary of API usage and costs"""
@@ -180,6 +246,10 @@ class CostTracker:
             "total_input_tokens": self.usage_data["total_input_tokens"],
             "total_output_tokens": self.usage_data["total_output_tokens"],
             "total_cost": self.usage_data["total_cost"],
+            "total_cancelled": self.usage_data["total_cancelled"],
+            "total_cache_hits": self.usage_data["total_cache_hits"],
+            "total_speculative_requests": self.usage_data.get("total_speculative_requests", 0),
+            "total_speculative_cost": self.usage_data.get("total_speculative_cost", 0.0),
             "today_usage": self.usage_data["requests_by_date"].get(
                 datetime.now().strftime("%Y-%m-%d"), 
                 {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cost": 0.0}
@@ -189,32 +259,66 @@ class CostTracker:
 # Initialize cost tracker
 cost_tracker = CostTracker()
 
+def usage_totals() -> Dict:
+    """Usage totals with the upstream circuit's state, as pushed to dashboards by the usage feed"""
+    return {**cost_tracker.get_usage_summary(), "circuit_breaker": circuit_breaker.stats()}
+
+usage_feed.attach(usage_totals)
+# Dashboards hear about the circuit opening even though no calls are recorded while it is open
+circuit_breaker.attach(lambda previous, state: usage_feed.touch())
+
 # Callback handler for token counting
-class TokenCountingHandler(BaseCallbackHandler):
-    """Callback handler that counts tokens for cost tracking"""
+class TokenCountingHandler:
+    """Callback handler that counts tokens for cost tracking
     
-    def __init__(self):
-        self.input_tokens = 0
+    Uses the token usage reported by the provider when the response has
+    it, otherwise counts with the local tokenizer (see token_counter).
+    Create it with token_counting_handler() to pass it to LangChain.
+    """
+    
+    def __init__(self, prompt_tokens: Optional[int] = None):
+        """Initialize the handler
+        
+        Args:
+            prompt_tokens: Input tokens already counted by the caller; counted from the prompt if None
+        """
+        self.input_tokens = prompt_tokens or 0
         self.output_tokens = 0
+        self.prompt_counted = prompt_tokens is not None
+        # "provider" when the counts come from the API response, otherwise the local counter's name
+        self.source = token_counter.name
         self.start_time = None
         self.end_time = None
+    
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        """Called when a chat model starts processing"""
+        self.start_time = time.time()
+        if not self.prompt_counted:
+            for prompt_messages in messages:
+                self.input_tokens += token_counter.count_messages(
+                    {"content": message.content} for message in prompt_messages
+                )
         
     def on_llm_start(self, serialized, prompts, **kwargs):
         """Called when LLM starts processing"""
         self.start_time = time.time()
-        # Estimate input tokens (this is approximate)
-        for prompt in prompts:
-            # Rough estimate: 1 token ≈ 4 characters for English text
-            self.input_tokens += len(prompt) // 4
+        if not self.prompt_counted:
+            for prompt in prompts:
+                self.input_tokens += token_counter.count(prompt)
     
     def on_llm_end(self, response, **kwargs):
         """Called when LLM finishes processing"""
         self.end_time = time.time()
-        # Estimate output tokens (this is approximate)
         if hasattr(response, 'generations') and response.generations:
             for gen in response.generations[0]:
-                # Rough estimate: 1 token ≈ 4 characters for English text
-                self.output_tokens += len(gen.text) // 4
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+                if usage:
+                    # Exact counts billed by the provider
+                    self.input_tokens = usage["input_tokens"]
+                    self.output_tokens = usage["output_tokens"]
+                    self.source = "provider"
+                    return
+                self.output_tokens += token_counter.count(gen.text)
     
     def get_duration(self):
         """Get the duration of the API call"""
@@ -222,36 +326,94 @@ class TokenCountingHandler(BaseCallbackHandler):
             return self.end_time - self.start_time
         return 0
 
+_callback_handler_class = None
+
+def token_counting_handler(prompt_tokens: Optional[int] = None) -> TokenCountingHandler:
+    """Create a TokenCountingHandler that LangChain accepts as a callback
+    
+    LangChain's callback base class is mixed in on first use, so importing
+    this module does not import LangChain.
+    """
+    global _callback_handler_class
+    if _callback_handler_class is None:
+        from langchain.callbacks.base import BaseCallbackHandler
+        _callback_handler_class = type("TokenCountingCallbackHandler",
+                                       (TokenCountingHandler, BaseCallbackHandler), {})
+    return _callback_handler_class(prompt_tokens)
+
+# Shared LLM clients per model, created on first use and reused for every request
+_llm_clients: Dict[tuple, "ChatGroq"] = {}
+_http_async_client: Optional[httpx.AsyncClient] = None
+
+def get_http_async_client() -> httpx.AsyncClient:
+    """Return the pooled async HTTP client used for Groq requests
+    
+    Connections are kept alive between requests so that each suggestion does
+    not pay for a new TCP/TLS handshake.
+    """
+    global _http_async_client
+    if _http_async_client is None or _http_async_client.is_closed:
+        _http_async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY
+            ),
+            timeout=config.LLM_REQUEST_TIMEOUT
+        )
+    return _http_async_client
+
 # Initialize the LLM
-def get_llm(callback_handler=None):
-    """Initialize and return the LLM client
+def get_llm(model: str = None, degraded: bool = False):
+    """Return the shared LLM client for a model, initializing it on first use
+    
+    Token counting callbacks are passed per request (see get_text_suggestions)
+    so the same client can be shared by all connections. Clients for
+    different models share one pool of HTTP connections.
     
     Args:
-        callback_handler: Optional callback handler for token counting
+        model: Model name (default: DEFAULT_MODEL)
+        degraded: Get the client used while the upstream is struggling: shorter
+            completions and timeout, and no retries to add to its load
         
     Returns:
         Initialized LLM client
     """
+    model = model or config.DEFAULT_MODEL
+    llm = _llm_clients.get((model, degraded))
+    if llm is not None:
+        return llm
+    
     try:
         # Check if we have a valid API key
         if not config.GROQ_API_KEY:
             raise ValueError("GROQ_API_KEY is not set in environment variables")
-            
-        # Create a BaseCallbackManager if a handler is provided
-        callbacks = BaseCallbackManager([callback_handler]) if callback_handler else None
         
+        from langchain_groq import ChatGroq
         llm = ChatGroq(
-            groq_api_key="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",
-            model_name=config.DEFAULT_MODEL,
+            groq_api_key=config.GROQ_API_KEY,
+            groq_api_base=config.GROQ_API_BASE,
+            model_name=model,
             temperature=config.TEMPERATURE,
-            max_tokens=config.MAX_TOKENS,
-            callbacks=callbacks
+            max_tokens=config.CIRCUIT_DEGRADED_MAX_TOKENS if degraded else config.MAX_TOKENS,
+            request_timeout=config.CIRCUIT_DEGRADED_TIMEOUT if degraded else config.LLM_REQUEST_TIMEOUT,
+            max_retries=0 if degraded else config.LLM_MAX_RETRIES,
+            http_async_client=get_http_async_client()
         )
+        _llm_clients[(model, degraded)] = llm
         return llm
     except Exception as e:
         logger.error(f"Error initializing LLM: {str(e)}")
         raise
 
+async def close_llm():
+    """Close the pooled HTTP connections and drop the shared LLM clients"""
+    global _http_async_client
+    _llm_clients.clear()
+    if _http_async_client is not None:
+        await _http_async_client.aclose()
+        _http_async_client = None
+
 # Create a system prompt for text suggestions
 SYSTEM_PROMPT = """
 You are an intelligent text suggestion assistant. Your task is to provide helpful, 
@@ -266,133 +428,925 @@ context-aware text suggestions as the user types. Consider the following guideli
 Provide ONLY the suggested text continuation without any explanations or prefixes.
 """
 
-async def get_text_suggestions(user_text: str) -> dict:
-    """Generate text suggestions based on user input
+# Coalesces identical concurrent upstream calls across connections
+suggestion_flights = SingleFlight()
+
+class _Speculation:
+    """A speculative call, until a request a user is waiting on joins its flight"""
+    
+    def __init__(self):
+        # A request joined the flight, so the call serves it and is not speculative any more
+        self.claimed = False
+        # The finished call was logged (and should be charged) as speculative
+        self.logged = False
+    
+    def log_as_speculative(self) -> bool:
+        """Whether to log the finished call as speculative, remembered for the prefetcher"""
+        self.logged = not self.claimed
+        return self.logged
+
+# Flight key -> the speculative call running under it
+_speculations: Dict[tuple, _Speculation] = {}
+
+def _join_flight(key: tuple) -> tuple:
+    """Claim a speculative call running under the key for a request a user is waiting on"""
+    speculation = _speculations.get(key)
+    if speculation is not None:
+        speculation.claimed = True
+    return key
+
+# Bump whenever SYSTEM_PROMPT or the user message template changes so cached suggestions are not reused
+PROMPT_VERSION = 1
+
+# Model slot of cache and single-flight keys while calls are routed or hedged across models
+ROUTED_MODELS_KEY = "routed"
+
+# Returned when the shared rate limit threshold leaves no room before the request's deadline
+RATE_LIMITED_ERROR = {
+    "error": "Rate limit threshold reached. Please try again in a moment.",
+    "rate_limited": True
+}
+
+# Returned when a request waited too long for an upstream slot
+SHED_ERROR = {
+    "error": "Server is busy. Please try again in a moment.",
+    "shed": True
+}
+
+# Returned instead of calling the LLM while the circuit breaker is open
+CIRCUIT_OPEN_ERROR = {
+    "error": "Suggestions are limited while the AI service recovers. Please try again in a moment.",
+    "circuit_open": True
+}
+
+# Bounds and fairly shares concurrent upstream calls between connections
+upstream_scheduler = UpstreamScheduler()
+
+async def _apply_spell_check(user_text: str, spell_session: Optional[SpellCheckSession] = None):
+    """Spell-correct the user text before it is sent to the LLM
     
     Args:
         user_text: The text input from the user
+        spell_session: Optional per-connection session that only re-checks edited words
+        
+    Returns:
+        Tuple of (corrected_text, spelling_correction) where spelling_correction
+        is None when no corrections were made
+    """
+    # Apply spell checking to correct any spelling errors, off the event loop
+    with stage_timer("spell_check"):
+        corrected_text = await correct_spelling_async(user_text, spell_session)
+    
+    # Track spelling corrections to send to frontend
+    spelling_correction = None
+    
+    # Log if corrections were made
+    if corrected_text != user_text:
+        logger.info(f"Spelling corrected: '{user_text}' → '{corrected_text}'")
+        # Create spelling correction data for frontend
+        spelling_correction = {
+            "original": user_text,
+            "corrected": corrected_text
+        }
+    
+    return corrected_text, spelling_correction
+
+def _check_limits() -> Optional[Dict]:
+    """Check the circuit breaker and the daily cost limit before making an API call
+    
+    Returns:
+        An error response dict if the call must be blocked, otherwise None
+    """
+    # While the upstream is failing, answer at once rather than queue for a call that will not be made
+    if circuit_breaker.is_open:
+        return dict(CIRCUIT_OPEN_ERROR)
+    
+    # Skip cost checks if cost tracking is disabled
+    if not config.ENABLE_COST_TRACKING:
+        return None
+    
+    # Check daily cost limit before making API call
+    with stage_timer("rate_limit"):
+        within_limit = cost_tracker.check_daily_cost_limit()
+    if not within_limit:
+        logger.warning("Daily cost limit reached. Blocking API calls.")
+        return {
+            "suggestion": "",
+            "error": "Daily cost limit reached. Please try again tomorrow.",
+            "cost_limit_exceeded": True
+        }
+        
+    # Rate limits are checked when the call gets its upstream slot, which may wait
+    # briefly for room instead of failing straight away
+    return None
+
+def _get_cached_suggestion(user_text: str, spelling_correction: Optional[Dict]) -> Optional[Dict]:
+    """Serve a suggestion from the cache if possible
+    
+    Args:
+        user_text: The spell-corrected user text
+        spelling_correction: Spelling correction data, if any
+        
+    Returns:
+        The response dict for a cache hit, otherwise None
+    """
+    if not config.ENABLE_SUGGESTION_CACHE:
+        return None
+    
+    start_time = time.time()
+    prefix_hits = suggestion_cache.prefix_hits
+    with stage_timer("cache_lookup"):
+        suggestion = suggestion_cache.get(user_text, _shared_model_key(), config.TEMPERATURE, PROMPT_VERSION)
+    if suggestion is None:
+        return None
+    duration = time.time() - start_time
+    
+    cost_tracker.log_cache_hit(
+        model=_shared_model_key(),
+        duration=duration,
+        prefix_match=suggestion_cache.prefix_hits > prefix_hits
+    )
+    logger.info(f"Cache hit: {suggestion[:30]}..." if len(suggestion) > 30 
+               else f"Cache hit: {suggestion}")
+    
+    result = _build_result(suggestion, {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cost": 0.0,
+        "duration": duration
+    }, spelling_correction)
+    result["cached"] = True
+    result["source"] = "cache"
+    return result
+
+def _get_similar_suggestion(user_text: str, spelling_correction: Optional[Dict]) -> Optional[Dict]:
+    """Serve the suggestion cached for a near-duplicate text if possible
+    
+    Args:
+        user_text: The spell-corrected user text
+        spelling_correction: Spelling correction data, if any
+        
+    Returns:
+        The response dict for a near-duplicate hit, otherwise None
+    """
+    if not config.ENABLE_SEMANTIC_CACHE:
+        return None
+    
+    start_time = time.time()
+    with stage_timer("semantic_cache_lookup"):
+        match = semantic_cache.get(user_text, _shared_model_key(), config.TEMPERATURE, PROMPT_VERSION)
+    if match is None:
+        return None
+    suggestion, similarity = match
+    duration = time.time() - start_time
+    
+    cost_tracker.log_cache_hit(model=_shared_model_key(), duration=duration, similarity=similarity)
+    logger.info(f"Near-duplicate cache hit ({similarity:.2f}): {suggestion[:30]}")
+    
+    result = _build_result(suggestion, {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cost": 0.0,
+        "duration": duration
+    }, spelling_correction)
+    result["cached"] = True
+    result["source"] = "semantic_cache"
+    result["similarity"] = similarity
+    return result
+
+def _get_local_completion(user_text: str, spelling_correction: Optional[Dict],
+                          min_confidence: float, fallback: bool = False) -> Optional[Dict]:
+    """Serve a suggestion from the local n-gram model if it is confident enough
+    
+    Args:
+        user_text: The spell-corrected user text
+        spelling_correction: Spelling correction data, if any
+        min_confidence: Minimum probability of the completion
+        fallback: Whether the LLM path is unavailable (throttled or over the cost limit)
+        
+    Returns:
+        The response dict for a local completion, otherwise None
+    """
+    if not config.ENABLE_LOCAL_COMPLETION:
+        return None
+    
+    start_time = time.time()
+    with stage_timer("local_completion"):
+        completion = local_completer.complete(user_text, min_confidence)
+    if completion is None:
+        return None
+    suggestion, confidence = completion
+    
+    local_completer.served += 1
+    if fallback:
+        local_completer.fallbacks += 1
+    logger.info(f"Local completion ({confidence:.2f}): {suggestion}")
+    
+    result = _build_result(suggestion, {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cost": 0.0,
+        "duration": time.time() - start_time
+    }, spelling_correction)
+    result["source"] = "ngram"
+    result["confidence"] = confidence
+    if fallback:
+        result["fallback"] = True
+    return result
+
+def _local_fallback(user_text: str, spelling_correction: Optional[Dict], error_result: Dict) -> Dict:
+    """Answer from the local model when the LLM path is throttled, or return the error"""
+    return _get_local_completion(
+        user_text, spelling_correction, config.NGRAM_FALLBACK_CONFIDENCE, fallback=True
+    ) or error_result
+
+def _is_throttled(error_result: Dict) -> bool:
+    """Whether an error means the LLM was not called because of limits, load or an open circuit"""
+    return bool(error_result.get("rate_limited") or error_result.get("shed")
+                or error_result.get("cost_limit_exceeded") or error_result.get("circuit_open"))
+
+def record_accepted_suggestion(text: str, suggestion: str, source: Optional[str] = None):
+    """Learn from a suggestion the user accepted
+    
+    Args:
+        text: The text the suggestion was generated for
+        suggestion: The accepted suggestion
+        source: What produced the suggestion ("llm", "cache", "semantic_cache" or "ngram")
+    """
+    if source == "semantic_cache":
+        semantic_cache.accepted += 1
+    if config.ENABLE_LOCAL_COMPLETION:
+        local_completer.learn_accepted(f"{text} {suggestion}")
+
+def _cache_suggestion(user_text: str, suggestion: str):
+    """Store a freshly generated suggestion in the caches"""
+    if config.ENABLE_SUGGESTION_CACHE:
+        suggestion_cache.put(user_text, _shared_model_key(), config.TEMPERATURE, PROMPT_VERSION, suggestion)
+    if config.ENABLE_SEMANTIC_CACHE:
+        semantic_cache.put(user_text, _shared_model_key(), config.TEMPERATURE, PROMPT_VERSION, suggestion)
+
+def _build_messages(user_text: str) -> List[Dict]:
+    """Build the chat messages sent to the LLM"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Based on this text, suggest a natural continuation:\n\n{user_text}"}
+    ]
+
+# The system prompt and message template are the same for every call, so their tokens are counted once
+PROMPT_FIXED_TOKENS = token_counter.count_messages(_build_messages(""))
+
+def _prompt_tokens(user_text: str) -> int:
+    """Input tokens of the prompt for a user text"""
+    return PROMPT_FIXED_TOKENS + token_counter.count(user_text)
+
+def _build_result(suggestion: str, usage: Dict, spelling_correction: Optional[Dict]) -> Dict:
+    """Build the response sent to the client
+    
+    Args:
+        suggestion: The suggested text continuation
+        usage: Usage metrics for the API call that produced the suggestion
+        spelling_correction: Spelling correction data, if any
+        
+    Returns:
+        A dictionary containing the suggestion, spelling corrections, and usage metrics
+    """
+    # Usage totals are pushed to clients by the usage feed rather than sent with every suggestion
+    result = {
+        "suggestion": suggestion,
+        "usage": usage
+    }
+    
+    if spelling_correction:
+        result["spelling_correction"] = spelling_correction
+        
+    return result
+
+def _log_failed_call(error: Exception, model: str = None):
+    """Log a failed API call if possible"""
+    try:
+        cost_tracker.log_api_call(
+            model=model or config.DEFAULT_MODEL,
+            input_tokens=0,  # We don't know how many tokens were processed
+            output_tokens=0,
+            duration=0.0,
+            success=False,
+            error=str(error)
+        )
+    except Exception as log_error:
+        logger.error(f"Error logging failed API call: {str(log_error)}")
+
+def _shared_model_key() -> str:
+    """The model part of cache and single-flight keys
+
+    Deliberately model-agnostic while routing or hedging: the model is picked
+    only after the caches and single-flight have missed, and any routed model
+    answers the same prompt interchangeably. Calls are still logged under the
+    model that made them; cache hits under this key, since no model made them.
+    """
+    if config.ENABLE_MODEL_ROUTING or config.ENABLE_HEDGING:
+        return ROUTED_MODELS_KEY
+    return config.DEFAULT_MODEL
+
+def _flight_key(user_text: str) -> tuple:
+    """Key under which identical concurrent requests share one upstream call"""
+    return (_shared_model_key(), config.TEMPERATURE, PROMPT_VERSION, user_text)
+
+async def _reserve_rate_limit(ticket: SlotTicket, model: str) -> Optional[Dict]:
+    """Count the call against the model's shared rate limit, waiting for room until the ticket's deadline
+    
+    Returns:
+        An error dict if the rate limit leaves no room in time, otherwise None
+    """
+    with stage_timer("rate_limit"):
+        while True:
+            retry_after = cost_tracker.record_request(model)
+            if retry_after == 0.0:
+                return None
+            if time.monotonic() + retry_after > ticket.deadline:
+                logger.warning("Rate limit threshold reached. Throttling API calls.")
+                return dict(RATE_LIMITED_ERROR)
+            await asyncio.sleep(retry_after)
+
+def _context_savings(omitted_chars: int) -> Dict:
+    """Prompt savings from leaving the start of the document out, reported with a call's usage"""
+    return {
+        "context_chars_omitted": omitted_chars,
+        # Estimated at about 4 characters per token: tokenizing the omitted text would cost what windowing saves
+        "input_tokens_saved": omitted_chars // 4
+    }
+
+def _queue_usage(ticket: SlotTicket) -> Dict:
+    """Queueing metrics reported with a call's usage"""
+    return {
+        "queue_wait": time.monotonic() - ticket.enqueued_at,
+        "queue_depth": ticket.queue_depth
+    }
+
+def _choose_model(prompt_tokens: int, exclude: tuple = ()) -> Optional[str]:
+    """The model for a call: the router's pick among models with rate limit room"""
+    if not config.ENABLE_MODEL_ROUTING:
+        return None if config.DEFAULT_MODEL in exclude else config.DEFAULT_MODEL
+    return model_router.choose(prompt_tokens, exclude, available=cost_tracker.check_rate_limit)
+
+class HedgeRace:
+    """Shared by the attempts of one call: the first to produce output wins"""
+    
+    def __init__(self):
+        self.hedged = False
+        self.winner: Optional[int] = None
+    
+    def claim(self, attempt: int) -> bool:
+        """Claim the win for an attempt; True if it is (or already was) the winner"""
+        if self.winner is None:
+            self.winner = attempt
+        return self.winner == attempt
+    
+    def role(self, attempt: int) -> Optional[str]:
+        """How the attempt is labelled in the usage log: None unless the call was hedged"""
+        if not self.hedged or self.winner is None:
+            return None
+        return "won" if self.winner == attempt else "lost"
+
+async def _hedged(attempt_fn, user_text: str, ticket: SlotTicket, model: str,
+                  prompt_tokens: int) -> AsyncIterator[Dict]:
+    """Run an upstream call, hedging it with a second model if it is slow to answer
+    
+    If the first attempt has produced nothing by its model's hedging deadline
+    (see ModelRouter.hedge_delay), a second attempt goes to the next best
+    model, provided an upstream slot and rate limit room are free right
+    away. Events then come from whichever attempt produces output first; the
+    other is cancelled. An attempt that fails does not win while the other
+    is still running.
+    
+    Args:
+        attempt_fn: Async generator function (user_text, ticket, model, race, attempt) yielding events
+        user_text: The spell-corrected user text
+        ticket: The upstream slot held for the first attempt
+        model: The model for the first attempt
+        prompt_tokens: Input tokens of the prompt, for choosing the hedge model
+    """
+    race = HedgeRace()
+    attempts = {}
+    
+    def launch(attempt_model: str):
+        attempt = len(attempts)
+        events = attempt_fn(user_text, ticket, attempt_model, race, attempt)
+        attempts[asyncio.ensure_future(events.__anext__())] = (attempt, events)
+    
+    async def cancel_others(keep):
+        # The cancelled attempt logs itself as a cancelled call
+        for future, (_, events) in attempts.items():
+            if future is keep:
+                continue
+            future.cancel()
+            try:
+                await future
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+            await events.aclose()
+    
+    launch(model)
+    hedge_ticket = None
+    winner = None
+    try:
+        # A second call would only add to a struggling upstream's load
+        hedging = config.ENABLE_HEDGING and not circuit_breaker.degraded
+        delay = model_router.hedge_delay(model) if hedging else None
+        if delay is not None:
+            done, _ = await asyncio.wait(set(attempts), timeout=delay)
+            if not done:
+                # A second call to the same model still dodges a slow replica if it is the only one
+                hedge_model = _choose_model(prompt_tokens, exclude=(model,)) or model
+                hedge_ticket = upstream_scheduler.try_acquire_nowait(ticket.client_id)
+                if hedge_ticket and cost_tracker.record_request(hedge_model) != 0.0:
+                    # No rate limit room: give the slot back now rather than hold it for the whole call
+                    upstream_scheduler.release(ticket.client_id)
+                    hedge_ticket = None
+                if hedge_ticket:
+                    race.hedged = True
+                    model_router.hedges += 1
+                    logger.info(f"Hedging {model} with {hedge_model} after {delay:.3f}s")
+                    launch(hedge_model)
+        
+        pending = set(attempts)
+        while winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # The attempt that claimed the race wins even if both finished in the same step
+            for future in sorted(done, key=lambda f: attempts[f][0] != race.winner):
+                if "error" in future.result() and pending:
+                    continue
+                winner = future
+                break
+        await cancel_others(winner)
+        
+        attempt, events = attempts[winner]
+        if race.hedged and attempt > 0 and race.winner == attempt:
+            model_router.hedge_wins += 1
+        yield winner.result()
+        async for event in events:
+            yield event
+    finally:
+        await cancel_others(winner)
+        if winner is not None:
+            await attempts[winner][1].aclose()
+        if hedge_ticket:
+            upstream_scheduler.release(ticket.client_id)
+
+async def _generate_suggestion(user_text: str, client_id: Hashable = None, max_wait: Optional[float] = None) -> Dict:
+    """Call the LLM for the spell-corrected text and log its cost
+    
+    Runs once per single-flight key, so cost is logged once however many
+    connections are waiting on the result.
+    
+    Args:
+        user_text: The spell-corrected user text
+        client_id: The connection the call is scheduled for
+        max_wait: Seconds the call may wait for an upstream slot and rate limit room
+    
+    Returns:
+        {"suggestion": str, "usage": dict} on success, or {"error": str}
+    """
+    try:
+        async with upstream_scheduler.slot(client_id, max_wait) as ticket:
+            observe_stage("upstream_queue", ticket.wait)
+            prompt_tokens = _prompt_tokens(user_text)
+            model = _choose_model(prompt_tokens) or config.DEFAULT_MODEL
+            limit_error = await _reserve_rate_limit(ticket, model)
+            if limit_error:
+                return limit_error
+            async with aclosing(_hedged(_invoke_attempt, user_text, ticket, model, prompt_tokens)) as events:
+                async for event in events:
+                    return event
+    except UpstreamBusy:
+        return dict(SHED_ERROR)
+
+async def _invoke_attempt(user_text: str, ticket: SlotTicket, model: str,
+                          race: HedgeRace, attempt: int) -> AsyncIterator[Dict]:
+    """One attempt of _generate_suggestion, as a single-event generator for _hedged"""
+    yield await _invoke_llm(user_text, ticket, model, race, attempt)
+
+async def _invoke_llm(user_text: str, ticket: SlotTicket, model: str = None,
+                      race: Optional[HedgeRace] = None, attempt: int = 0,
+                      speculation: Optional[_Speculation] = None) -> Dict:
+    """Make the upstream call for _generate_suggestion once it holds a slot"""
+    model = model or config.DEFAULT_MODEL
+    race = race or HedgeRace()
+    queue_usage = _queue_usage(ticket)
+    
+    epoch = circuit_breaker.acquire()
+    if epoch is None:
+        return dict(CIRCUIT_OPEN_ERROR)
+    
+    # Create a token counting callback handler for this request only
+    token_handler = token_counting_handler(_prompt_tokens(user_text))
+    
+    start_time = time.time()
+    try:
+        # Get the shared LLM client
+        llm = get_llm(model, degraded=circuit_breaker.degraded)
+        
+        # Generate the suggestion directly using the LLM
+        response = await llm.ainvoke(_build_messages(user_text), config={"callbacks": [token_handler]})
+    except asyncio.CancelledError:
+        # Every waiting request was superseded, or a hedged attempt answered first;
+        # the upstream HTTP call is aborted with the task
+        elapsed = time.time() - start_time
+        if race.role(attempt) == "lost":
+            cost_tracker.log_cancelled_call(model, elapsed, hedge="lost", input_tokens=token_handler.input_tokens)
+        else:
+            cost_tracker.log_cancelled_call(model, elapsed, hedge=race.role(attempt))
+        model_router.record_censored(model, elapsed)
+        circuit_breaker.record_cancelled(epoch, elapsed)
+        raise
+    except Exception as e:
+        logger.error(f"Error generating suggestion: {str(e)}")
+        model_router.record(model, time.time() - start_time, success=False)
+        circuit_breaker.record(epoch, time.time() - start_time, success=False)
+        _log_failed_call(e, model)
+        return {"error": str(e)}
+    duration = time.time() - start_time
+    observe_stage("llm", duration)
+    race.claim(attempt)
+    model_router.record(model, duration, success=True, output_tokens=token_handler.output_tokens)
+    circuit_breaker.record(epoch, duration, success=True)
+    
+    # Extract and clean the suggestion
+    suggestion = response.content.strip()
+    _cache_suggestion(user_text, suggestion)
+    
+    # Log token usage and cost
+    api_call = cost_tracker.log_api_call(
+        model=model,
+        input_tokens=token_handler.input_tokens,
+        output_tokens=token_handler.output_tokens,
+        duration=duration,
+        success=True,
+        hedge=race.role(attempt),
+        speculative=speculation is not None and speculation.log_as_speculative()
+    )
+    
+    logger.info(f"Generated suggestion: {suggestion[:30]}..." if len(suggestion) > 30 
+               else f"Generated suggestion: {suggestion}")
+    
+    return {
+        "suggestion": suggestion,
+        "usage": {
+            "model": model,
+            "hedged": race.hedged,
+            "input_tokens": token_handler.input_tokens,
+            "output_tokens": token_handler.output_tokens,
+            "token_count_source": token_handler.source,
+            "cost": api_call["total_cost"],
+            "duration": duration,
+            **queue_usage
+        }
+    }
+
+async def _stream_suggestion(user_text: str, client_id: Hashable = None,
+                             max_wait: Optional[float] = None) -> AsyncIterator[Dict]:
+    """Stream the LLM's suggestion for the spell-corrected text and log its cost
+    
+    Yields {"delta": str} events followed by one final event, either
+    {"suggestion": str, "usage": dict} or {"error": str}. Runs once per
+    single-flight key and is fanned out to every waiting connection.
+    
+    Args:
+        user_text: The spell-corrected user text
+        client_id: The connection the call is scheduled for
+        max_wait: Seconds the call may wait for an upstream slot and rate limit room
+    """
+    try:
+        async with upstream_scheduler.slot(client_id, max_wait) as ticket:
+            observe_stage("upstream_queue", ticket.wait)
+            prompt_tokens = _prompt_tokens(user_text)
+            model = _choose_model(prompt_tokens) or config.DEFAULT_MODEL
+            limit_error = await _reserve_rate_limit(ticket, model)
+            if limit_error:
+                yield limit_error
+                return
+            async with aclosing(_hedged(_stream_llm, user_text, ticket, model, prompt_tokens)) as events:
+                async for event in events:
+                    yield event
+    except UpstreamBusy:
+        yield dict(SHED_ERROR)
+
+async def _stream_llm(user_text: str, ticket: SlotTicket, model: str = None,
+                      race: Optional[HedgeRace] = None, attempt: int = 0,
+                      speculation: Optional[_Speculation] = None) -> AsyncIterator[Dict]:
+    """Make the upstream streaming call for _stream_suggestion once it holds a slot"""
+    model = model or config.DEFAULT_MODEL
+    race = race or HedgeRace()
+    queue_usage = _queue_usage(ticket)
+    
+    epoch = circuit_breaker.acquire()
+    if epoch is None:
+        yield dict(CIRCUIT_OPEN_ERROR)
+        return
+    
+    # Create a token counting callback handler for this request only
+    token_handler = token_counting_handler(_prompt_tokens(user_text))
+    
+    start_time = time.time()
+    time_to_first_token = None
+    chunks = []
+    try:
+        llm = get_llm(model, degraded=circuit_breaker.degraded)
+        
+        # Close the upstream stream promptly if this generator is closed mid-stream
+        async with aclosing(llm.astream(_build_messages(user_text), config={"callbacks": [token_handler]})) as stream:
+            async for chunk in stream:
+                delta = chunk.content
+                # Drop leading whitespace so the streamed text matches the stripped final suggestion
+                if not chunks:
+                    delta = delta.lstrip()
+                if not delta:
+                    continue
+                if time_to_first_token is None:
+                    time_to_first_token = time.time() - start_time
+                    race.claim(attempt)
+                chunks.append(delta)
+                yield {"delta": delta}
+    except (asyncio.CancelledError, GeneratorExit):
+        # Every waiting request was superseded, the consumer closed the stream early,
+        # or a hedged attempt produced a token first
+        elapsed = time.time() - start_time
+        if race.role(attempt) == "lost":
+            cost_tracker.log_cancelled_call(model, elapsed, hedge="lost", input_tokens=token_handler.input_tokens,
+                                            output_tokens=token_counter.count("".join(chunks)))
+        else:
+            cost_tracker.log_cancelled_call(model, elapsed, hedge=race.role(attempt))
+        if time_to_first_token is None:
+            model_router.record_censored(model, elapsed)
+            circuit_breaker.record_cancelled(epoch, elapsed)
+        else:
+            circuit_breaker.record(epoch, time_to_first_token, success=True)
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming suggestion: {str(e)}")
+        model_router.record(model, time.time() - start_time, success=False)
+        circuit_breaker.record(epoch, time.time() - start_time, success=False)
+        _log_failed_call(e, model)
+        yield {"error": str(e)}
+        return
+    duration = time.time() - start_time
+    observe_stage("llm", duration)
+    if time_to_first_token is not None:
+        observe_stage("time_to_first_token", time_to_first_token)
+    race.claim(attempt)
+    latency = time_to_first_token if time_to_first_token is not None else duration
+    model_router.record(model, latency, success=True, output_tokens=token_handler.output_tokens)
+    circuit_breaker.record(epoch, latency, success=True)
+    
+    suggestion = "".join(chunks).strip()
+    _cache_suggestion(user_text, suggestion)
+    
+    # Log token usage and cost
+    api_call = cost_tracker.log_api_call(
+        model=model,
+        input_tokens=token_handler.input_tokens,
+        output_tokens=token_handler.output_tokens,
+        duration=duration,
+        success=True,
+        time_to_first_token=time_to_first_token,
+        hedge=race.role(attempt),
+        speculative=speculation is not None and speculation.log_as_speculative()
+    )
+    
+    logger.info(f"Streamed suggestion: {suggestion[:30]}..." if len(suggestion) > 30 
+               else f"Streamed suggestion: {suggestion}")
+    
+    yield {
+        "suggestion": suggestion,
+        "usage": {
+            "model": model,
+            "hedged": race.hedged,
+            "input_tokens": token_handler.input_tokens,
+            "output_tokens": token_handler.output_tokens,
+            "token_count_source": token_handler.source,
+            "cost": api_call["total_cost"],
+            "duration": duration,
+            "time_to_first_token": time_to_first_token,
+            **queue_usage
+        }
+    }
+
+async def get_text_suggestions(user_text: Union[str, GapBuffer], spell_session: Optional[SpellCheckSession] = None,
+                               client_id: Hashable = None, max_wait: Optional[float] = None) -> dict:
+    """Generate text suggestions based on user input
+    
+    Args:
+        user_text: The text input from the user, or the connection's document buffer
+        spell_session: Optional per-connection spell check session
+        client_id: Identifies the connection for fair scheduling of upstream calls
+        max_wait: Seconds the request may queue for an upstream call (default UPSTREAM_QUEUE_TIMEOUT)
         
     Returns:
         A dictionary containing the suggested text continuation, spelling corrections,
         and usage metrics
     """
     try:
+        # Only the end of a long document goes into the prompt
+        user_text, omitted_chars = build_context(user_text)
+        
         # Skip processing for very short inputs
         if len(user_text.strip()) < 3:
             return {"suggestion": ""}
             
-        # Apply spell checking to correct any spelling errors
-        corrected_text = correct_spelling(user_text)
-        
-        # Track spelling corrections to send to frontend
-        spelling_correction = None
-        
-        # Log if corrections were made
-        if corrected_text != user_text:
-            logger.info(f"Spelling corrected: '{user_text}' → '{corrected_text}'")
-            # Create spelling correction data for frontend
-            spelling_correction = {
-                "original": user_text,
-                "corrected": corrected_text
-            }
-            
         # Use the corrected text for generating suggestions
-        user_text = corrected_text
-        
-        # Skip cost checks if cost tracking is disabled
-        if config.ENABLE_COST_TRACKING:
-            # Check daily cost limit before making API call
-            if not cost_tracker.check_daily_cost_limit():
-                logger.warning("Daily cost limit reached. Blocking API calls.")
-                return {
-                    "suggestion": "",
-                    "error": "Daily cost limit reached. Please try again tomorrow.",
-                    "cost_limit_exceeded": True
-                }
-                
-            # Check rate limits before making API call
-            if not cost_tracker.check_rate_limit(config.DEFAULT_MODEL):
-                logger.warning("Rate limit threshold reached. Throttling API calls.")
-                return {
-                    "suggestion": "",
-                    "error": "Rate limit threshold reached. Please try again in a moment.",
-                    "rate_limited": True
-                }
+        user_text, spelling_correction = await _apply_spell_check(user_text, spell_session)
         
-        # Record this request for rate limiting
-        cost_tracker.record_request()
+        cached_result = (_get_cached_suggestion(user_text, spelling_correction)
+                         or _get_similar_suggestion(user_text, spelling_correction))
+        if cached_result:
+            return cached_result
         
-        # Create token counting callback handler
-        token_handler = TokenCountingHandler()
-            
-        # Get LLM with token counting
-        llm = get_llm(callback_handler=token_handler)
+        # Confident short continuations do not need an upstream call
+        local_result = _get_local_completion(user_text, spelling_correction, config.NGRAM_CONFIDENCE)
+        if local_result:
+            return local_result
         
-        # Create messages directly
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": f"Based on this text, suggest a natural continuation:\n\n{user_text}"}
-        ]
+        limit_error = _check_limits()
+        if limit_error:
+            return _local_fallback(user_text, spelling_correction, limit_error)
         
-        # Generate the suggestion directly using the LLM
-        start_time = time.time()
-        response = await asyncio.to_thread(lambda: llm.invoke(messages))
-        duration = time.time() - start_time
-        
-        # Extract and clean the suggestion
-        suggestion = response.content.strip()
-        
-        # Log token usage and cost
-        api_call = cost_tracker.log_api_call(
-            model=config.DEFAULT_MODEL,
-            input_tokens=token_handler.input_tokens,
-            output_tokens=token_handler.output_tokens,
-            duration=duration,
-            success=True
+        # Identical concurrent requests share one upstream call
+        generated = await suggestion_flights.do(
+            _join_flight(_flight_key(user_text)), lambda: _generate_suggestion(user_text, client_id, max_wait)
         )
-        
-        logger.info(f"Generated suggestion: {suggestion[:30]}..." if len(suggestion) > 30 
-                   else f"Generated suggestion: {suggestion}")
-        
-        # Get usage summary
-        usage_summary = cost_tracker.get_usage_summary()
+        if "error" in generated:
+            error_result = {"suggestion": "", **generated}
+            if _is_throttled(generated):
+                return _local_fallback(user_text, spelling_correction, error_result)
+            return error_result
         
         # Return suggestion, spelling corrections, and usage metrics
-        result = {
-            "suggestion": suggestion,
-            "usage": {
-                "input_tokens": token_handler.input_tokens,
-                "output_tokens": token_handler.output_tokens,
-                "cost": api_call["total_cost"],
-                "duration": duration
-            },
-            "usage_summary": {
-                "total_cost": usage_summary["total_cost"],
-                "total_requests": usage_summary["total_requests"],
-                "today_cost": usage_summary["today_usage"]["cost"],
-                "today_requests": usage_summary["today_usage"]["requests"]
-            }
-        }
-        
-        if spelling_correction:
-            result["spelling_correction"] = spelling_correction
-            
+        # The usage dict is shared by every request on the flight, so extend a copy
+        usage = {**generated["usage"], **_context_savings(omitted_chars)}
+        result = _build_result(generated["suggestion"], usage, spelling_correction)
+        result["source"] = "llm"
         return result
         
     except Exception as e:
         logger.error(f"Error generating suggestion: {str(e)}")
+        _log_failed_call(e)
+        return {"suggestion": "", "error": str(e)}
+
+async def stream_text_suggestions(user_text: Union[str, GapBuffer],
+                                  spell_session: Optional[SpellCheckSession] = None,
+                                  client_id: Hashable = None,
+                                  max_wait: Optional[float] = None) -> AsyncIterator[dict]:
+    """Generate text suggestions, yielding tokens as the LLM produces them
+    
+    Yields incremental frames of the form {"delta": str, "seq": int} followed by
+    one final frame with "done": True that carries the full suggestion, usage
+    and cost. Early exits (short input, limits, errors) yield only the final frame.
+    
+    Args:
+        user_text: The text input from the user, or the connection's document buffer
+        spell_session: Optional per-connection spell check session
+        client_id: Identifies the connection for fair scheduling of upstream calls
+        max_wait: Seconds the request may queue for an upstream call (default UPSTREAM_QUEUE_TIMEOUT)
+    """
+    try:
+        # Only the end of a long document goes into the prompt
+        user_text, omitted_chars = build_context(user_text)
         
-        # Log failed API call if possible
-        try:
-            cost_tracker.log_api_call(
-                model=config.DEFAULT_MODEL,
-                input_tokens=0,  # We don't know how many tokens were processed
-                output_tokens=0,
-                duration=0.0,
-                success=False,
-                error=str(e)
-            )
-        except Exception as log_error:
-            logger.error(f"Error logging failed API call: {str(log_error)}")
+        # Skip processing for very short inputs
+        if len(user_text.strip()) < 3:
+            yield {"suggestion": "", "done": True}
+            return
+            
+        # Use the corrected text for generating suggestions
+        user_text, spelling_correction = await _apply_spell_check(user_text, spell_session)
+        
+        cached_result = (_get_cached_suggestion(user_text, spelling_correction)
+                         or _get_similar_suggestion(user_text, spelling_correction))
+        if cached_result:
+            yield {**cached_result, "done": True}
+            return
+        
+        # Confident short continuations do not need an upstream call
+        local_result = _get_local_completion(user_text, spelling_correction, config.NGRAM_CONFIDENCE)
+        if local_result:
+            yield {**local_result, "done": True}
+            return
+        
+        limit_error = _check_limits()
+        if limit_error:
+            yield {**_local_fallback(user_text, spelling_correction, limit_error), "done": True}
+            return
+        
+        # Identical concurrent requests share one upstream stream
+        seq = 0
+        events = suggestion_flights.stream(_join_flight(_flight_key(user_text)),
+                                           lambda: _stream_suggestion(user_text, client_id, max_wait))
+        async with aclosing(events):
+            async for event in events:
+                if "delta" in event:
+                    yield {"delta": event["delta"], "seq": seq}
+                    seq += 1
+                elif "error" in event:
+                    error_result = {"suggestion": "", **event}
+                    if _is_throttled(event):
+                        error_result = _local_fallback(user_text, spelling_correction, error_result)
+                    yield {**error_result, "done": True}
+                else:
+                    # The usage dict is shared by every request on the flight, so extend a copy
+                    usage = {**event["usage"], **_context_savings(omitted_chars)}
+                    result = _build_result(event["suggestion"], usage, spelling_correction)
+                    result["source"] = "llm"
+                    result["done"] = True
+                    result["seq"] = seq
+                    yield result
         
-        return {"suggestion": "", "error": str(e)}
\ No newline at end of file
+    except Exception as e:
+        logger.error(f"Error streaming suggestion: {str(e)}")
+        _log_failed_call(e)
+        yield {"suggestion": "", "error": str(e), "done": True}
+
+async def _speculate(user_text: str, speculation: _Speculation, client_id: Hashable = None) -> AsyncIterator[Dict]:
+    """Make a speculative upstream call, only with capacity nobody is waiting for
+    
+    Never queues for an upstream slot or waits for rate limit room, and is
+    never hedged, so prefetching cannot delay a request a user is waiting on.
+    Yields the same events as _stream_suggestion (one final event when not streaming).
+    While it runs, a request for the same text that joins its flight claims
+    it (see _join_flight), and it is then logged as an ordinary call.
+    """
+    # Probes of a recovering upstream are kept for requests a user is waiting on
+    if circuit_breaker.state != CLOSED:
+        yield dict(CIRCUIT_OPEN_ERROR)
+        return
+    ticket = upstream_scheduler.try_acquire_nowait(client_id)
+    if ticket is None:
+        yield dict(SHED_ERROR)
+        return
+    key = _flight_key(user_text)
+    _speculations[key] = speculation
+    try:
+        model = _choose_model(_prompt_tokens(user_text)) or config.DEFAULT_MODEL
+        if cost_tracker.record_request(model) != 0.0:
+            yield dict(RATE_LIMITED_ERROR)
+            return
+        if config.ENABLE_STREAMING:
+            async with aclosing(_stream_llm(user_text, ticket, model, speculation=speculation)) as events:
+                async for event in events:
+                    yield event
+        else:
+            yield await _invoke_llm(user_text, ticket, model, speculation=speculation)
+    finally:
+        if _speculations.get(key) is speculation:
+            del _speculations[key]
+        upstream_scheduler.release(client_id)
+
+async def _last_event(events: AsyncIterator[Dict]) -> Dict:
+    """Run an event generator to completion and return its final event"""
+    event = None
+    async with aclosing(events):
+        async for event in events:
+            pass
+    return event
+
+async def prefetch_suggestion(user_text: str, client_id: Hashable = None) -> Optional[Dict]:
+    """Precompute the suggestion for a text the user is likely to send next
+    
+    The call goes through the same single-flight key as a real request for
+    the text, so a request arriving while it runs joins it, and its result
+    lands in the suggestion cache for a request arriving later.
+    
+    Args:
+        user_text: The predicted text, e.g. the current text with its suggestion accepted
+        client_id: The connection the call is made for
+        
+    Returns:
+        {"suggestion": str, "usage": dict, "speculative": bool} if an upstream
+        call was made, where speculative is False if a request joined the call
+        (or the prefetch joined a request's call) and it is not charged as
+        speculation; {"error": str} if it could not be made right away, or
+        None if the text needs no call (too short, cached, or answered locally)
+    """
+    user_text, _ = build_context(user_text)
+    if len(user_text.strip()) < 3:
+        return None
+    
+    # Without the connection's session, so its record of the last text checked stays intact
+    user_text, _ = await _apply_spell_check(user_text)
+    if config.ENABLE_SUGGESTION_CACHE and suggestion_cache.contains(
+            user_text, _shared_model_key(), config.TEMPERATURE, PROMPT_VERSION):
+        return None
+    if config.ENABLE_LOCAL_COMPLETION and local_completer.complete(user_text, config.NGRAM_CONFIDENCE):
+        return None
+    limit_error = _check_limits()
+    if limit_error:
+        return limit_error
+    
+    key = _flight_key(user_text)
+    speculation = _Speculation()
+    if config.ENABLE_STREAMING:
+        result = await _last_event(suggestion_flights.stream(key, lambda: _speculate(user_text, speculation, client_id)))
+    else:
+        result = await suggestion_flights.do(key, lambda: _last_event(_speculate(user_text, speculation, client_id)))
+    if result is None or "error" in result:
+        return result
+    # The final event is shared with any request in the flight, so it is copied rather than marked
+    return {**result, "speculative": speculation.logged}
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from sub-millisecond cache lookups to slow LLM calls
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Fixed-bucket histogram
+
+    Observing is a binary search and two additions, with no lock: all
+    observations are made on the event loop thread.
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One count per bucket plus the +Inf bucket, not cumulative
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _StageTimer:
+    """Context manager that observes the time spent in its block"""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+class MetricsRegistry:
+    """Histograms and gauges rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        # name -> (help, label name, {label value: histogram})
+        self._histograms: Dict[str, tuple] = {}
+        # name -> (help, function returning the current value)
+        self._gauges: Dict[str, tuple] = {}
+
+    def histogram(self, name: str, help_text: str, label: str, value: str,
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """Get (creating if needed) the histogram for one label value"""
+        _, _, series = self._histograms.setdefault(name, (help_text, label, {}))
+        histogram = series.get(value)
+        if histogram is None:
+            histogram = series[value] = Histogram(buckets)
+        return histogram
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]):
+        """Register a gauge whose value is read when metrics are rendered"""
+        self._gauges[name] = (help_text, read)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format"""
+        lines = []
+        for name, (help_text, label, series) in self._histograms.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for value, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{{label}="{value}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {histogram.count}')
+        for name, (help_text, read) in self._gauges.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+def stage_timer(stage: str) -> _StageTimer:
+    """Time a block as one stage of handling a suggestion request
+
+    Usage:
+        with stage_timer("spell_check"):
+            ...
+    """
+    return _StageTimer(_stage_histogram(stage))
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration measured elsewhere (e.g. queue wait, time to first token)"""
+    _stage_histogram(stage).observe(seconds)
+
+def _stage_histogram(stage: str) -> Histogram:
+    histogram = _stages.get(stage)
+    if histogram is None:
+        histogram = _stages[stage] = metrics_registry.histogram(
+            "suggestion_stage_seconds", "Time spent in each stage of handling a suggestion request",
+            "stage", stage
+        )
+    return histogram
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a callback scheduled to run on time
+
+    A coroutine sleeps for a fixed interval and records how much longer
+    than that the sleep took. Lag means something blocked the loop, and
+    every connection's messages waited for it.
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or config.LOOP_LAG_INTERVAL
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.histogram = metrics_registry.histogram(
+            "event_loop_lag_seconds", "Delay of the event loop in running scheduled callbacks",
+            "loop", "main"
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start monitoring the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.histogram.observe(self.lag)
+
+class SamplingProfiler:
+    """Statistical profiler for the event loop thread, switched on and off at runtime
+
+    While running, a background thread records the event loop thread's
+    call stack every `interval` seconds. The report lists how often each
+    stack was seen in the collapsed format read by flame graph tools.
+    Sampling costs the profiled thread nothing but a share of the GIL.
+    """
+
+    def __init__(self, interval: float = None, max_depth: int = 64):
+        self.interval = interval or config.PROFILER_INTERVAL
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id: int = None):
+        """Start sampling a thread (by default the calling one), discarding earlier samples"""
+        if self.running:
+            return
+        self.samples.clear()
+        self.sample_count = 0
+        self._stop.clear()
+        target = thread_id or threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:.1f}ms interval)")
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info(f"Sampling profiler stopped after {self.sample_count} samples")
+
+    def report(self, limit: int = 200) -> str:
+        """Most frequent stacks, one "outermost;...;innermost count" line each"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common(limit)) + "\n"
+
+    def _run(self, thread_id: int):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            stack: List[str] = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+# Create singleton instances
+metrics_registry = MetricsRegistry()
+_stages: Dict[str, Histogram] = {}
+loop_lag_monitor = LoopLagMonitor()
+sampling_profiler = SamplingProfiler()
+
+metrics_registry.gauge("event_loop_lag_latest_seconds", "Most recent event loop lag measurement",
+                       lambda: loop_lag_monitor.lag)
+metrics_registry.gauge("event_loop_lag_max_seconds", "Largest event loop lag since startup",
+                       lambda: loop_lag_monitor.max_lag)
+metrics_registry.gauge("profiler_running", "1 while the sampling profiler is running",
+                       lambda: int(sampling_profiler.running))
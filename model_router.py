@@ -0,0 +1,184 @@
+import logging
+import math
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+class ModelStats:
+    """Recent latency and error rate of one model"""
+
+    def __init__(self, window: int):
+        # Exponentially weighted moving averages, and when they were last updated
+        self.latency = config.ROUTER_PRIOR_LATENCY
+        self.error_rate = 0.0
+        self.output_tokens = config.ROUTER_PRIOR_OUTPUT_TOKENS
+        self.updated = 0.0
+        # Recent latencies, for the hedging deadline
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+
+    def decayed(self, value: float, prior: float, now: float) -> float:
+        """An average drifts back to its prior when the model has not been used for a while,
+        so a model that was slow or failing gets tried again eventually"""
+        if not self.updated:
+            return prior
+        return prior + (value - prior) * math.exp(-(now - self.updated) / config.ROUTER_STATS_DECAY)
+
+class ModelRouter:
+    """Picks the model for each LLM call from recent latency, errors and cost
+
+    The candidates are the models with both a rate limit and pricing in
+    config. Each call goes to the model with the lowest expected latency
+    (its latency EWMA plus a penalty for its error rate EWMA) whose
+    estimated cost per token fits ROUTER_COST_BUDGET and whose rate limit
+    has room. The budget is per token rather than per call, so the same
+    models qualify whatever the length of the prompt.
+    Ties go to DEFAULT_MODEL, then to the cheaper model.
+    """
+
+    def __init__(self, models: Iterable[str] = None, alpha: float = None, window: int = None):
+        """Initialize the router
+
+        Args:
+            models: Candidate models (default: those in both GROQ_RATE_LIMITS and GROQ_PRICING)
+            alpha: Weight of the newest sample in the moving averages
+            window: Number of recent latencies kept per model for the hedging deadline
+        """
+        if models is None:
+            models = [m for m in config.GROQ_PRICING if m in config.GROQ_RATE_LIMITS]
+        self.models: List[str] = list(models) or [config.DEFAULT_MODEL]
+        self.alpha = alpha or config.ROUTER_EWMA_ALPHA
+        window = window or config.ROUTER_LATENCY_WINDOW
+        self._stats: Dict[str, ModelStats] = {model: ModelStats(window) for model in self.models}
+
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def estimated_cost(self, model: str, prompt_tokens: int) -> float:
+        """Expected cost in USD of a call with the given prompt"""
+        pricing = config.GROQ_PRICING.get(model, config.GROQ_PRICING[config.DEFAULT_MODEL])
+        output_tokens = self._stats[model].output_tokens
+        return (prompt_tokens * pricing["input"] + output_tokens * pricing["output"]) / 1_000_000
+
+    def cost_per_million_tokens(self, model: str, prompt_tokens: int) -> float:
+        """Expected cost in USD per 1M tokens (prompt and completion) of a call with the given prompt"""
+        tokens = prompt_tokens + self._stats[model].output_tokens
+        return self.estimated_cost(model, prompt_tokens) * 1_000_000 / tokens if tokens else 0.0
+
+    def choose(self, prompt_tokens: int, exclude: Iterable[str] = (),
+               available: Callable[[str], bool] = None) -> Optional[str]:
+        """Pick the model for a call
+
+        Args:
+            prompt_tokens: Input tokens of the prompt, for the cost estimate
+            exclude: Models not to use (e.g. the one a hedged call is already waiting on)
+            available: Returns False for models whose rate limit has no room
+
+        Returns:
+            The best model, or None if every candidate is excluded or unavailable
+        """
+        now = time.monotonic()
+        candidates = [m for m in self.models if m not in exclude and (available is None or available(m))]
+        if not candidates:
+            return None
+        within_budget = [m for m in candidates
+                         if self.cost_per_million_tokens(m, prompt_tokens) <= config.ROUTER_COST_BUDGET]
+        if not within_budget:
+            # Nothing fits the budget; the cheapest model is the closest
+            return min(candidates, key=lambda m: self.estimated_cost(m, prompt_tokens))
+        return min(within_budget, key=lambda m: (
+            self._score(m, now), m != config.DEFAULT_MODEL, self.estimated_cost(m, prompt_tokens)
+        ))
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        """Seconds to wait for a model before hedging with a second call
+
+        The model's recent p95 latency times ROUTER_HEDGE_MULTIPLIER, so about
+        one call in twenty is hedged. None until enough calls have been seen.
+        """
+        samples = self._stats[model].samples
+        if len(samples) < config.ROUTER_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        p95 = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+        return max(config.ROUTER_HEDGE_MIN_DELAY, p95 * config.ROUTER_HEDGE_MULTIPLIER)
+
+    def record(self, model: str, latency: float, success: bool, output_tokens: int = None):
+        """Record the outcome of a call
+
+        Args:
+            model: The model called
+            latency: Time to first token for streamed calls, otherwise the call duration
+            success: Whether the call succeeded
+            output_tokens: Completion tokens, for cost estimates
+        """
+        stats = self._stats.get(model)
+        if stats is None:
+            return
+        now = time.monotonic()
+        stats.calls += 1
+        stats.error_rate = self._update(stats.decayed(stats.error_rate, 0.0, now), 0.0 if success else 1.0)
+        if success:
+            stats.latency = self._update(stats.decayed(stats.latency, config.ROUTER_PRIOR_LATENCY, now), latency)
+            stats.samples.append(latency)
+            if output_tokens is not None:
+                stats.output_tokens = self._update(stats.output_tokens, output_tokens)
+        else:
+            stats.errors += 1
+        stats.updated = now
+
+    def record_censored(self, model: str, elapsed: float):
+        """Record a call cancelled after `elapsed` seconds without an answer
+
+        The real latency is at least `elapsed`, so this only ever raises the
+        estimate; a model that keeps losing hedges stops being preferred.
+        """
+        stats = self._stats.get(model)
+        if stats is None:
+            return
+        now = time.monotonic()
+        latency = stats.decayed(stats.latency, config.ROUTER_PRIOR_LATENCY, now)
+        if elapsed > latency:
+            stats.latency = self._update(latency, elapsed)
+            stats.samples.append(elapsed)
+            stats.updated = now
+
+    def stats(self) -> Dict:
+        """Get per-model estimates and hedging counters"""
+        now = time.monotonic()
+        return {
+            "models": {
+                model: {
+                    "latency": stats.decayed(stats.latency, config.ROUTER_PRIOR_LATENCY, now),
+                    "error_rate": stats.decayed(stats.error_rate, 0.0, now),
+                    "hedge_delay": self.hedge_delay(model),
+                    "calls": stats.calls,
+                    "errors": stats.errors
+                }
+                for model, stats in self._stats.items()
+            },
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins
+        }
+
+    def _score(self, model: str, now: float) -> float:
+        """Expected latency in seconds, with errors counted as ROUTER_ERROR_PENALTY each"""
+        stats = self._stats[model]
+        return (stats.decayed(stats.latency, config.ROUTER_PRIOR_LATENCY, now)
+                + config.ROUTER_ERROR_PENALTY * stats.decayed(stats.error_rate, 0.0, now))
+
+    def _update(self, average: float, sample: float) -> float:
+        return average + self.alpha * (sample - average)
+
+# Create a singleton instance
+model_router = ModelRouter()
@@ -0,0 +1,307 @@
+import atexit
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+(?:'[A-Za-z]+)?|[.,!?;:]")
+SENTENCE_END = {".", "!", "?"}
+MODEL_FORMAT_VERSION = 1
+
+class NGramModel:
+    """Word n-gram model for short local text completions
+
+    For every context of one to order-1 preceding words the model counts
+    the words that followed it and keeps the most frequent one, so a
+    completion step is a single dictionary lookup. Completions back off
+    from the longest trusted context to shorter ones and extend greedily
+    while the product of the step probabilities stays above the requested
+    confidence.
+    """
+
+    def __init__(self, order: int = None, min_count: int = None):
+        """Initialize an empty model
+
+        Args:
+            order: Longest n-gram, i.e. contexts have up to order-1 words
+            min_count: Contexts seen fewer times than this are not used for completions
+        """
+        self.order = order or config.NGRAM_ORDER
+        self.min_count = min_count or config.NGRAM_MIN_COUNT
+
+        # Words are lowercased for lookups; _surface keeps the form to show for
+        # words only ever seen capitalized (names, "I")
+        self.vocab: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._surface: Dict[int, str] = {}
+
+        # context word ids -> {next word id: count}, its total and its most frequent next word
+        self._counts: Dict[Tuple[int, ...], Dict[int, int]] = {}
+        self._totals: Dict[Tuple[int, ...], int] = {}
+        self._best: Dict[Tuple[int, ...], Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return TOKEN_PATTERN.findall(text)
+
+    def train(self, texts: Iterable[str]):
+        """Count the n-grams of each text (one document or line per item)"""
+        for text in texts:
+            self.learn(text)
+
+    def learn(self, text: str):
+        """Add the n-grams of one text to the model"""
+        ids = [self._word_id(token) for token in self.tokenize(text)]
+        with self._lock:
+            for i in range(1, len(ids)):
+                for n in range(1, self.order):
+                    if i - n < 0:
+                        break
+                    self._count(tuple(ids[i - n:i]), ids[i])
+
+    def complete(self, text: str, min_confidence: float, max_words: int = None) -> Optional[Tuple[str, float]]:
+        """Predict the words that follow the text
+
+        Args:
+            text: The text typed so far
+            min_confidence: Minimum probability of the whole completion
+            max_words: Maximum number of words to predict
+
+        Returns:
+            (completion, confidence), or None if not even one word is confident enough
+        """
+        max_words = max_words or config.NGRAM_MAX_WORDS
+        context = []
+        for token in self.tokenize(text)[-(self.order - 1):]:
+            word_id = self._ids.get(token.lower())
+            context.append(-1 if word_id is None else word_id)
+
+        predicted = []
+        confidence = 1.0
+        while len(predicted) < max_words:
+            step = self._predict(context)
+            if step is None or confidence * step[1] < min_confidence:
+                break
+            word_id, probability = step
+            confidence *= probability
+            predicted.append(word_id)
+            context = (context + [word_id])[-(self.order - 1):]
+            if self.vocab[word_id] in SENTENCE_END:
+                break
+
+        if not predicted:
+            return None
+        return self._render(predicted), confidence
+
+    def stats(self) -> Dict:
+        """Get model size"""
+        return {
+            "vocabulary": len(self.vocab),
+            "contexts": len(self._counts)
+        }
+
+    def save(self, path: Path):
+        """Write the model to a JSON file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = {
+                "version": MODEL_FORMAT_VERSION,
+                "order": self.order,
+                "vocab": self.vocab,
+                "surface": {str(k): v for k, v in self._surface.items()},
+                "counts": [list(context) + [word_id, count]
+                           for context, followers in self._counts.items()
+                           for word_id, count in followers.items()]
+            }
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["NGramModel"]:
+        """Load a model saved with save(), returning None if it is missing or unreadable"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Error loading n-gram model from {path}")
+            return None
+        if data.get("version") != MODEL_FORMAT_VERSION:
+            return None
+
+        model = cls(order=data["order"])
+        model.vocab = data["vocab"]
+        model._ids = {word: i for i, word in enumerate(model.vocab)}
+        model._surface = {int(k): v for k, v in data["surface"].items()}
+        for row in data["counts"]:
+            model._count(tuple(row[:-2]), row[-2], row[-1])
+        return model
+
+    def _word_id(self, token: str) -> int:
+        word = token.lower()
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self._ids[word] = len(self.vocab)
+            self.vocab.append(word)
+            if token != word:
+                self._surface[word_id] = token
+        elif token == word:
+            # Seen in lowercase, so the lowercase form is the one to suggest
+            self._surface.pop(word_id, None)
+        return word_id
+
+    def _count(self, context: Tuple[int, ...], word_id: int, count: int = 1):
+        followers = self._counts.setdefault(context, {})
+        followers[word_id] = followers.get(word_id, 0) + count
+        self._totals[context] = self._totals.get(context, 0) + count
+        best = self._best.get(context)
+        if best is None or followers[word_id] > best[1]:
+            self._best[context] = (word_id, followers[word_id])
+
+    def _predict(self, context: List[int]) -> Optional[Tuple[int, float]]:
+        """Most likely next word and its probability, from the longest trusted context"""
+        for n in range(min(len(context), self.order - 1), 0, -1):
+            key = tuple(context[-n:])
+            total = self._totals.get(key, 0)
+            if total >= self.min_count:
+                word_id, count = self._best[key]
+                return word_id, count / total
+        return None
+
+    def _render(self, word_ids: List[int]) -> str:
+        text = ""
+        for word_id in word_ids:
+            word = self._surface.get(word_id, self.vocab[word_id])
+            # Punctuation attaches to the previous word
+            if text and word[0].isalnum():
+                text += " "
+            text += word
+        return text
+
+class LocalCompleter:
+    """The n-gram model used to serve suggestions, plus learning from accepted ones
+
+    Accepted suggestions are learned immediately and appended to a corpus
+    file, so the next offline training run includes them. The appends are
+    buffered and written by a background thread, as the usage log does, so
+    accepting a suggestion never waits on disk I/O on the event loop.
+    """
+
+    def __init__(self, model_file: Path = None, accepted_file: Path = None, flush_interval: float = None):
+        self.model_file = Path(model_file or config.NGRAM_MODEL_FILE)
+        self.accepted_file = Path(accepted_file or config.NGRAM_ACCEPTED_FILE)
+        self.flush_interval = flush_interval or config.NGRAM_ACCEPTED_FLUSH_INTERVAL
+        self.model = NGramModel.load(self.model_file) or NGramModel()
+        if not self.model.vocab:
+            logger.info(f"No n-gram model at {self.model_file}; local completions start empty")
+
+        self.served = 0
+        self.fallbacks = 0
+        self.accepted = 0
+
+        # Accepted texts not yet appended to accepted_file
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def complete(self, text: str, min_confidence: float) -> Optional[Tuple[str, float]]:
+        """Predict a completion (see NGramModel.complete)"""
+        return self.model.complete(text, min_confidence)
+
+    def learn_accepted(self, text: str):
+        """Learn from text that ends with a suggestion the user accepted"""
+        self.accepted += 1
+        self.model.learn(text)
+        with self._lock:
+            self._pending.append(" ".join(text.split()) + "\n")
+        self._start()
+
+    def flush(self):
+        """Append the buffered accepted texts to accepted_file"""
+        with self._lock:
+            lines, self._pending = self._pending, []
+        if not lines:
+            return
+        self.accepted_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.accepted_file, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+    def close(self):
+        """Stop the background writer and append what is still buffered"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self) -> Dict:
+        """Get served/fallback/accepted counters and model size"""
+        return {
+            **self.model.stats(),
+            "served": self.served,
+            "fallbacks": self.fallbacks,
+            "accepted": self.accepted
+        }
+
+    def _start(self):
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="accepted-suggestions-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error appending accepted suggestions: {str(e)}")
+
+def train_model(corpus_files: Iterable[Path], output: Path = None) -> NGramModel:
+    """Train a model from corpus files and the accepted suggestions, and save it"""
+    output = Path(output or config.NGRAM_MODEL_FILE)
+    files = [Path(f) for f in corpus_files]
+    accepted = Path(config.NGRAM_ACCEPTED_FILE)
+    if accepted.exists():
+        files.append(accepted)
+
+    model = NGramModel()
+    start_time = time.time()
+    for path in files:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            model.train(f)
+    model.save(output)
+    logger.info(f"Trained n-gram model from {len(files)} files in {time.time() - start_time:.1f}s: "
+                f"{len(model.vocab)} words, {len(model._counts)} contexts")
+    return model
+
+# Create a singleton instance
+local_completer = LocalCompleter()
+
+if __name__ == "__main__":
+    # Train offline: python ngram_model.py corpus.txt [more.txt ...]
+    train_model(sys.argv[1:])
@@ -0,0 +1,191 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# State file layout: header, daily cost, then one sliding-window slot per model
+STATE_MAGIC = b"RLIM"
+STATE_FORMAT_VERSION = 1
+_HEADER = struct.Struct("=4sI")
+_DAILY = struct.Struct("=Id")
+_SLOT = struct.Struct("=48sddd")
+MAX_MODELS = 32
+_STATE_SIZE = _HEADER.size + _DAILY.size + MAX_MODELS * _SLOT.size
+
+def _day_number(day: str) -> int:
+    """Encode a YYYY-MM-DD date as an integer"""
+    return int(day.replace("-", ""))
+
+class SharedRateLimiter:
+    """Sliding-window-counter rate limiter and daily cost meter shared across processes
+
+    The state lives in a small memory-mapped file guarded by an exclusive
+    flock, so every uvicorn worker on the host draws from the same request
+    budget and daily cost limit. Each model keeps the request count of the
+    current and previous fixed windows; the count over the last window is
+    estimated by weighting the previous window by how much of it still
+    overlaps, which makes every check and update constant time.
+    """
+
+    def __init__(self, path: Path = None, window: float = None):
+        """Open (creating if needed) the shared state file
+
+        Args:
+            path: Shared state file; every process that should share limits must use the same one
+            window: Length of the rate limit window in seconds
+        """
+        self.path = Path(path or config.RATE_LIMIT_STATE_FILE)
+        self.window = window or config.RATE_LIMIT_WINDOW
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread_lock = threading.Lock()
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._fd = fd
+        with self._locked():
+            if os.fstat(fd).st_size < _STATE_SIZE or os.pread(fd, 4, 0) != STATE_MAGIC:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, _STATE_SIZE)
+                os.pwrite(fd, _HEADER.pack(STATE_MAGIC, STATE_FORMAT_VERSION), 0)
+        self._state = mmap.mmap(fd, _STATE_SIZE)
+        # Slot offset by model name, learned from the shared table
+        self._slots = {}
+
+    def allowed(self, model: str, limit: float) -> bool:
+        """Whether a request to the model would currently fit under the limit"""
+        with self._locked():
+            offset = self._slot(model)
+            return self._count(offset, time.time()) + 1 <= limit
+
+    def acquire(self, model: str, limit: float) -> bool:
+        """Atomically count a request to the model if it fits under the limit
+
+        Returns:
+            True if the request was counted, False if the limit has been reached
+        """
+        return self.try_acquire(model, limit) == 0.0
+
+    def try_acquire(self, model: str, limit: float) -> float:
+        """Atomically count a request to the model if it fits under the limit
+
+        Returns:
+            0.0 if the request was counted, otherwise the number of seconds
+            until it would fit if no other request is counted meanwhile
+        """
+        with self._locked():
+            offset = self._slot(model)
+            now = time.time()
+            if self._count(offset, now) + 1 <= limit:
+                name, window_start, current, previous = _SLOT.unpack_from(self._state, offset)
+                _SLOT.pack_into(self._state, offset, name, window_start, current + 1, previous)
+                return 0.0
+            return self._retry_after(offset, now, limit)
+
+    def request_count(self, model: str) -> float:
+        """Estimated number of requests to the model over the last window"""
+        with self._locked():
+            return self._count(self._slot(model), time.time())
+
+    def add_cost(self, cost: float, day: str = None):
+        """Add to the shared cost of the given day (default today)"""
+        day = _day_number(day or datetime.now().strftime("%Y-%m-%d"))
+        with self._locked():
+            stored_day, stored_cost = _DAILY.unpack_from(self._state, _HEADER.size)
+            if stored_day != day:
+                if stored_day > day:
+                    # A late record for a previous day no longer counts
+                    return
+                stored_cost = 0.0
+            _DAILY.pack_into(self._state, _HEADER.size, day, stored_cost + cost)
+
+    def daily_cost(self, day: str = None) -> float:
+        """Shared cost of the given day (default today)"""
+        day = _day_number(day or datetime.now().strftime("%Y-%m-%d"))
+        with self._locked():
+            stored_day, stored_cost = _DAILY.unpack_from(self._state, _HEADER.size)
+            return stored_cost if stored_day == day else 0.0
+
+    def seed_daily_cost(self, cost: float, day: str = None):
+        """Make the shared daily cost at least `cost`, e.g. from usage recorded before a restart"""
+        day = _day_number(day or datetime.now().strftime("%Y-%m-%d"))
+        with self._locked():
+            stored_day, stored_cost = _DAILY.unpack_from(self._state, _HEADER.size)
+            if stored_day < day or (stored_day == day and stored_cost < cost):
+                _DAILY.pack_into(self._state, _HEADER.size, day, cost)
+
+    def close(self):
+        """Unmap and close the state file"""
+        self._state.close()
+        os.close(self._fd)
+
+    def _count(self, offset: int, now: float) -> float:
+        """Roll the slot's windows forward to now and return the sliding-window estimate"""
+        name, window_start, current, previous = _SLOT.unpack_from(self._state, offset)
+        elapsed_windows = int((now - window_start) // self.window)
+        if elapsed_windows >= 1:
+            previous = current if elapsed_windows == 1 else 0.0
+            current = 0.0
+            window_start += elapsed_windows * self.window
+            _SLOT.pack_into(self._state, offset, name, window_start, current, previous)
+        overlap = 1.0 - (now - window_start) / self.window
+        return previous * overlap + current
+
+    def _retry_after(self, offset: int, now: float, limit: float) -> float:
+        """Seconds until one more request fits, given windows already rolled forward to now"""
+        if limit < 1:
+            return float("inf")
+        _, window_start, current, previous = _SLOT.unpack_from(self._state, offset)
+        if current + 1 > limit:
+            # Not before the next window, where this window's count decays as the previous one
+            window_start += self.window
+            previous, current = current, 0.0
+            if previous + 1 <= limit:
+                return max(0.0, window_start - now)
+        # The previous window's weight must fall to the room left in the current one
+        fits_at = window_start + self.window * (1.0 - (limit - 1 - current) / previous)
+        return max(0.0, fits_at - now)
+
+    def _slot(self, model: str) -> int:
+        """Offset of the model's slot, claiming a free one if needed (caller holds the lock)"""
+        offset = self._slots.get(model)
+        if offset is not None:
+            return offset
+
+        name = model.encode("utf-8")[:48].ljust(48, b"\0")
+        base = _HEADER.size + _DAILY.size
+        for i in range(MAX_MODELS):
+            offset = base + i * _SLOT.size
+            stored_name = self._state[offset:offset + 48]
+            if stored_name == name:
+                break
+            if stored_name == b"\0" * 48:
+                _SLOT.pack_into(self._state, offset, name, time.time(), 0.0, 0.0)
+                break
+        else:
+            raise RuntimeError(f"Rate limiter state has no free slot for model {model}")
+        self._slots[model] = offset
+        return offset
+
+    @contextmanager
+    def _locked(self):
+        """Hold the in-process lock and an exclusive flock on the state file"""
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
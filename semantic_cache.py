@@ -0,0 +1,255 @@
+import logging
+import re
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Case, punctuation and runs of whitespace are ignored when comparing texts
+NON_WORD = re.compile(r"[\W_]+")
+SHINGLE_LENGTH = 5
+_HASH_MASK = (1 << 64) - 1
+
+def normalize(text: str) -> str:
+    """Lowercase the text and collapse punctuation and whitespace into single spaces"""
+    return NON_WORD.sub(" ", text.lower()).strip()
+
+class _Entry:
+    """One cached suggestion and where it is indexed"""
+
+    __slots__ = ("signature", "guard", "suggestion", "expires_at", "buckets", "text_key")
+
+    def __init__(self, signature: array, guard: str, suggestion: str, expires_at: float,
+                 buckets: List[Tuple], text_key: Tuple):
+        self.signature = signature
+        self.guard = guard
+        self.suggestion = suggestion
+        self.expires_at = expires_at
+        self.buckets = buckets
+        self.text_key = text_key
+
+class SemanticCache:
+    """A near-duplicate cache of LLM suggestions
+
+    The second tier behind SuggestionCache's exact keys: texts that differ
+    only in case, punctuation, whitespace or a word or two share a
+    suggestion. The last SEMANTIC_CACHE_TAIL_CHARS of the normalized text
+    are embedded as a MinHash signature of character shingles (one
+    permutation hashing: each shingle is hashed once into one of
+    signature_size bins, and each bin keeps its minimum), whose share of
+    equal bins estimates the Jaccard similarity of two tails.
+
+    Signatures are indexed by locality-sensitive hashing: each band of
+    band_size bins is a dictionary key, so a lookup only compares the
+    entries sharing a band with it instead of the whole cache. A neighbour
+    is a hit if its estimated similarity reaches the threshold and its last
+    guard_words words are the same, since the continuation depends most on
+    how the text ends. Entries are bounded by LRU eviction and a TTL.
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, threshold: float = None,
+                 tail_chars: int = None, signature_size: int = None, band_size: int = None,
+                 guard_words: int = None):
+        """Initialize the cache
+
+        Args:
+            max_entries: Maximum number of cached suggestions before LRU eviction
+            ttl: Seconds a cached suggestion stays valid
+            threshold: Minimum estimated Jaccard similarity of the text tails for a hit
+            tail_chars: Characters at the end of the normalized text that are compared
+            signature_size: MinHash bins per signature (a power of two)
+            band_size: Bins per LSH band; signature_size must be a multiple
+            guard_words: Number of final words that must match exactly
+        """
+        self.max_entries = max_entries or config.SEMANTIC_CACHE_MAX_ENTRIES
+        self.ttl = ttl or config.SUGGESTION_CACHE_TTL
+        self.threshold = threshold or config.SEMANTIC_CACHE_THRESHOLD
+        self.tail_chars = tail_chars or config.SEMANTIC_CACHE_TAIL_CHARS
+        self.signature_size = signature_size or config.SEMANTIC_CACHE_SIGNATURE_SIZE
+        self.band_size = band_size or config.SEMANTIC_CACHE_BAND_SIZE
+        self.guard_words = config.SEMANTIC_CACHE_GUARD_WORDS if guard_words is None else guard_words
+        if self.signature_size & (self.signature_size - 1) or self.signature_size % self.band_size:
+            raise ValueError("signature_size must be a power of two and a multiple of band_size")
+        self._bin_bits = self.signature_size.bit_length() - 1
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # (model, temperature, prompt_version, band, band hash) -> ids of entries in that bucket
+        self._buckets: Dict[Tuple, Set[int]] = {}
+        # (model, temperature, prompt_version, normalized tail) -> id, so a text is stored once
+        self._texts: Dict[Tuple, int] = {}
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.candidates = 0
+        self.accepted = 0
+
+    def get(self, text: str, model: str, temperature: float, prompt_version: int) -> Optional[Tuple[str, float]]:
+        """Look up the suggestion of the most similar cached text
+
+        Args:
+            text: The spell-corrected user text
+            model: The model name
+            temperature: The sampling temperature
+            prompt_version: Version of the system prompt
+
+        Returns:
+            (suggestion, estimated similarity), or None on a miss
+        """
+        params = (model, temperature, prompt_version)
+        tail, guard = self._tail(text)
+        if not tail:
+            self.misses += 1
+            return None
+        signature = self._signature(tail)
+        now = time.monotonic()
+
+        candidates = set()
+        for bucket in self._bucket_keys(params, signature):
+            candidates.update(self._buckets.get(bucket, ()))
+        self.candidates += len(candidates)
+
+        best_id, best_similarity = None, self.threshold
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.expires_at <= now:
+                self._remove(entry_id)
+                self.evictions += 1
+                continue
+            if entry.guard != guard:
+                continue
+            similarity = sum(a == b for a, b in zip(signature, entry.signature)) / self.signature_size
+            if similarity >= best_similarity:
+                best_id, best_similarity = entry_id, similarity
+        if best_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        return self._entries[best_id].suggestion, best_similarity
+
+    def put(self, text: str, model: str, temperature: float, prompt_version: int, suggestion: str):
+        """Store a suggestion for the given text"""
+        if not suggestion:
+            return
+        params = (model, temperature, prompt_version)
+        tail, guard = self._tail(text)
+        if not tail:
+            return
+        text_key = params + (tail,)
+        previous = self._texts.get(text_key)
+        if previous is not None:
+            self._remove(previous)
+
+        signature = self._signature(tail)
+        buckets = self._bucket_keys(params, signature)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = _Entry(signature, guard, suggestion, time.monotonic() + self.ttl,
+                                         buckets, text_key)
+        self._texts[text_key] = entry_id
+        for bucket in buckets:
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+
+        # Evict least recently used entries beyond the size bound
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all cached suggestions"""
+        self._entries.clear()
+        self._buckets.clear()
+        self._texts.clear()
+
+    def stats(self) -> Dict:
+        """Get cache size, hit rate and precision counters
+
+        precision is the share of near-duplicate hits the user went on to
+        accept. It understates the true precision, since users also pass
+        over suggestions that were right, so compare it with the acceptance
+        of exact cache and LLM suggestions rather than with 1.0.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "buckets": len(self._buckets),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_candidates": self.candidates / lookups if lookups else 0.0,
+            "accepted": self.accepted,
+            "precision": self.accepted / self.hits if self.hits else None
+        }
+
+    def _tail(self, text: str) -> Tuple[str, str]:
+        """The normalized tail of a text that is compared, and its guard words"""
+        normalized = normalize(text[-2 * self.tail_chars:])
+        if len(normalized) > self.tail_chars:
+            # Start at a word boundary so the first shingles are not partial words
+            cut = normalized.find(" ", len(normalized) - self.tail_chars)
+            normalized = normalized[cut + 1:] if cut != -1 else normalized[-self.tail_chars:]
+        if len(normalized) < SHINGLE_LENGTH:
+            return "", ""
+        guard = " ".join(normalized.rsplit(" ", self.guard_words)[1:]) if self.guard_words else ""
+        return normalized, guard or normalized
+
+    def _signature(self, tail: str) -> array:
+        """One permutation MinHash signature of the tail's character shingles"""
+        size = self.signature_size
+        bin_mask = size - 1
+        bits = self._bin_bits
+        empty = _HASH_MASK
+        bins = [empty] * size
+        for i in range(len(tail) - SHINGLE_LENGTH + 1):
+            h = hash(tail[i:i + SHINGLE_LENGTH]) & _HASH_MASK
+            index = h & bin_mask
+            value = h >> bits
+            if value < bins[index]:
+                bins[index] = value
+        # Densify: an empty bin takes the value of the next filled bin, offset by the distance,
+        # so short texts still compare bin by bin
+        if empty in bins:
+            original = bins[:]
+            for i in range(size):
+                if original[i] == empty:
+                    for distance in range(1, size):
+                        value = original[(i + distance) & bin_mask]
+                        if value != empty:
+                            bins[i] = value + distance
+                            break
+        # Values are below 2 ** (64 - bits), so they fit a signed 64-bit array
+        return array("q", bins)
+
+    def _bucket_keys(self, params: Tuple, signature: array) -> List[Tuple]:
+        size = self.band_size
+        return [params + (band, hash(tuple(signature[band * size:(band + 1) * size])))
+                for band in range(self.signature_size // size)]
+
+    def _remove(self, entry_id: int):
+        """Remove an entry and its index references"""
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        if self._texts.get(entry.text_key) == entry_id:
+            del self._texts[entry.text_key]
+        for bucket in entry.buckets:
+            ids = self._buckets.get(bucket)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[bucket]
+
+# Create a singleton instance
+semantic_cache = SemanticCache()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    """One shared upstream call and the callers waiting on it"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # Streamed items produced so far, replayed to callers that join late
+        self.items: List[Any] = []
+        self.done = False
+        # Every caller left and the task was cancelled; new callers start a new flight
+        self.abandoned = False
+        self.changed = asyncio.Event()
+
+    def publish(self, item: Any = None, done: bool = False):
+        """Record a streamed item and wake every waiting caller"""
+        if not done:
+            self.items.append(item)
+        self.done = done
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+class SingleFlight:
+    """Coalesces identical concurrent calls into one shared upstream call
+
+    The first caller for a key (the leader) starts the call in its own task;
+    callers that arrive while it is running (followers) await the same
+    result. A cancelled caller only stops waiting: the shared call keeps
+    running for the others and is cancelled only once no callers remain.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `call()` once for all concurrent callers with the same key
+
+        Args:
+            key: Identifies calls that may share a result
+            call: Factory for the coroutine that performs the upstream call
+
+        Returns:
+            The result of the shared call
+        """
+        flight = self._join(key)
+        if flight.task is None:
+            flight.task = asyncio.create_task(call())
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    async def stream(self, key: Hashable, call: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Iterate `call()` once for all concurrent callers with the same key
+
+        Every caller receives every item, including those produced before it joined.
+
+        Args:
+            key: Identifies calls that may share a result
+            call: Factory for the async iterator that performs the upstream call
+        """
+        flight = self._join(key)
+        if flight.task is None:
+            flight.task = asyncio.create_task(self._pump(flight, call))
+            flight.task.add_done_callback(lambda _: self._finish(key, flight))
+
+        try:
+            index = 0
+            while True:
+                while index < len(flight.items):
+                    yield flight.items[index]
+                    index += 1
+                if flight.done:
+                    break
+                await flight.changed.wait()
+            # Surface an exception raised by the shared call
+            if flight.task.done() and not flight.task.cancelled():
+                flight.task.result()
+        finally:
+            self._leave(key, flight)
+
+    def stats(self) -> Dict:
+        """Get leader/follower counters and the coalescing ratio"""
+        calls = self.leaders + self.followers
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.leaders,
+            "coalesced_calls": self.followers,
+            "coalescing_ratio": self.followers / calls if calls else 0.0
+        }
+
+    def _join(self, key: Hashable) -> _Flight:
+        flight = self._flights.get(key)
+        if flight is None or flight.abandoned or (flight.task is not None and flight.task.done()):
+            flight = self._flights[key] = _Flight()
+            self.leaders += 1
+        else:
+            self.followers += 1
+        flight.waiters += 1
+        return flight
+
+    def _leave(self, key: Hashable, flight: _Flight):
+        flight.waiters -= 1
+        # Nobody is waiting any more, so there is no point finishing the upstream call
+        if flight.waiters == 0 and flight.task is not None and not flight.task.done():
+            # Removed first, so a caller arriving before the task has unwound starts a new call
+            # instead of joining the cancelled one
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.abandoned = True
+            flight.task.cancel()
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        flight.publish(done=True)
+
+    @staticmethod
+    async def _pump(flight: _Flight, call: Callable[[], AsyncIterator[Any]]):
+        async with aclosing(call()) as items:
+            async for item in items:
+                flight.publish(item)
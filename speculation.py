@@ -0,0 +1,154 @@
+import asyncio
+import logging
+from typing import Dict, Hashable, Optional, Union
+
+import config
+from llm_service import prefetch_suggestion
+from text_buffer import GapBuffer, join_suggestion
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+class _Session:
+    """Speculation state of one connection"""
+
+    def __init__(self):
+        self.spent = 0.0
+        # The text the user will send if they accept the last suggestion
+        self.predicted: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        # Whether the prefetch for `predicted` made (or joined) an upstream call
+        self.prefetched = False
+
+class SpeculativePrefetcher:
+    """Prefetches the suggestion that follows a delivered one
+
+    Once a suggestion has been delivered and the user has been idle for
+    SPECULATION_IDLE_DELAY, the suggestion for the text with that suggestion
+    accepted is fetched ahead of time (see llm_service.prefetch_suggestion),
+    so accepting it gets a follow-up from the cache, or by joining the call
+    still in flight, instead of a full LLM round trip. Any other input
+    cancels the prefetch. Each connection may spend at most
+    SPECULATION_SESSION_BUDGET on speculative calls.
+    """
+
+    def __init__(self, budget: float = None, delay: float = None):
+        """Initialize the prefetcher
+
+        Args:
+            budget: USD each connection may spend on speculative calls
+            delay: Seconds of idle time after a suggestion before prefetching
+        """
+        self.budget = config.SPECULATION_SESSION_BUDGET if budget is None else budget
+        self.delay = config.SPECULATION_IDLE_DELAY if delay is None else delay
+        self._sessions: Dict[Hashable, _Session] = {}
+
+        self.scheduled = 0
+        self.prefetched = 0
+        self.unneeded = 0
+        self.skipped = 0
+        self.over_budget = 0
+        self.cancelled = 0
+        self.hits = 0
+        self.cost = 0.0
+
+    def schedule(self, session_id: Hashable, document: Union[str, GapBuffer], suggestion: str):
+        """Prefetch the follow-up to a suggestion just delivered for the document
+
+        Args:
+            session_id: The connection (also its client id for upstream scheduling)
+            document: The text the suggestion was generated for
+            suggestion: The delivered suggestion
+        """
+        if not config.ENABLE_SPECULATION or not suggestion:
+            return
+        session = self._sessions.setdefault(session_id, _Session())
+        self._cancel(session)
+        if session.spent >= self.budget:
+            self.over_budget += 1
+            return
+        text = document if isinstance(document, str) else document.text()
+        session.predicted = join_suggestion(text, suggestion)
+        session.prefetched = False
+        session.task = asyncio.create_task(self._prefetch(session_id, session, session.predicted))
+        self.scheduled += 1
+
+    def observe(self, session_id: Hashable, document: GapBuffer):
+        """Check a connection's new text against the prediction
+
+        Counts a hit if the user sent the predicted text once the prefetch
+        had started its call, and otherwise cancels the prefetch: the text
+        changed, or the request for it is about to make the call anyway.
+        """
+        session = self._sessions.get(session_id)
+        if session is None or session.predicted is None:
+            return
+        predicted = session.predicted
+        session.predicted = None
+        if session.prefetched and len(document) == len(predicted) and document.text() == predicted:
+            self.hits += 1
+            # A prefetch still in flight is left running, and no longer cancelled by the
+            # next schedule(): the request for this text has joined it
+            session.task = None
+            return
+        self._cancel(session)
+
+    def discard(self, session_id: Hashable):
+        """Forget a closed connection, cancelling its prefetch"""
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._cancel(session)
+
+    def stats(self) -> Dict:
+        """Get prefetch, hit rate and spend counters"""
+        return {
+            "enabled": config.ENABLE_SPECULATION,
+            "scheduled": self.scheduled,
+            "prefetched": self.prefetched,
+            "unneeded": self.unneeded,
+            "skipped": self.skipped,
+            "over_budget": self.over_budget,
+            "cancelled": self.cancelled,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.prefetched if self.prefetched else 0.0,
+            "cost": self.cost,
+            "cost_per_hit": self.cost / self.hits if self.hits else None
+        }
+
+    async def _prefetch(self, session_id: Hashable, session: _Session, text: str):
+        await asyncio.sleep(self.delay)
+        # Marked before the call so a request joining it still counts as a hit
+        session.prefetched = True
+        try:
+            result = await prefetch_suggestion(text, session_id)
+        except Exception as e:
+            logger.error(f"Error prefetching suggestion: {str(e)}")
+            result = {"error": str(e)}
+        if result is None:
+            # Already cached or answered locally: no call needed, and no hit to claim
+            session.prefetched = False
+            self.unneeded += 1
+        elif "error" in result:
+            session.prefetched = False
+            self.skipped += 1
+        else:
+            # A call a request joined is charged to that request, not to speculation
+            cost = result["usage"]["cost"] if result.get("speculative") else 0.0
+            session.spent += cost
+            self.cost += cost
+            self.prefetched += 1
+            logger.info(f"Prefetched suggestion for accepted text (${cost:.6f}, "
+                        f"${session.spent:.6f} of ${self.budget:.6f} spent)")
+
+    def _cancel(self, session: _Session):
+        if session.task is not None and not session.task.done():
+            session.task.cancel()
+            self.cancelled += 1
+        session.task = None
+
+# Create a singleton instance
+speculative_prefetcher = SpeculativePrefetcher()
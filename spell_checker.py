@@ -1,9 +1,15 @@
 import logging
+import asyncio
+import multiprocessing
 import re
-from typing import Optional, List
-from spellchecker import SpellChecker as PySpellChecker
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Dict, Iterable, Tuple
 
 import config
+from symspell import load_or_build_index
 
 # Configure logging
 logging.basicConfig(
@@ -12,18 +18,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Candidate words; length and capitalization filters are applied per word
+WORD_PATTERN = re.compile(r'\b[a-zA-Z]+\b')
+
 class SpellChecker:
     """A class to handle spell checking and correction functionality"""
     
-    def __init__(self):
-        """Initialize the spell checker"""
-        try:
-            self.checker = PySpellChecker()
-            self.is_available = True
-            logger.info("Spell checker initialized successfully")
-        except Exception as e:
-            self.is_available = False
-            logger.error(f"Failed to initialize spell checker: {str(e)}")
+    def __init__(self, engine: Optional[str] = None):
+        """Initialize the spell checker
+        
+        The dictionary is loaded by load(), or on first use.
+        
+        Args:
+            engine: "symspell" or "pyspellchecker"; defaults to config.SPELL_CHECK_ENGINE
+        """
+        self.engine = engine or config.SPELL_CHECK_ENGINE
+        self._checker = None
+        self._available = False
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        # Bounded word -> correction memo shared by every caller in this process
+        self._memo: "OrderedDict[str, str]" = OrderedDict()
+    
+    def load(self):
+        """Load the dictionary if it is not loaded yet"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                # Both engines expose the unknown()/correction() interface used by correct_word
+                if self.engine == "symspell":
+                    self._checker = load_or_build_index()
+                else:
+                    from spellchecker import SpellChecker as PySpellChecker
+                    self._checker = PySpellChecker()
+                self._available = True
+                logger.info("Spell checker initialized successfully")
+            except Exception as e:
+                logger.error(f"Failed to initialize spell checker: {str(e)}")
+            self._loaded = True
+    
+    @property
+    def checker(self):
+        """The spelling engine, loading it if needed"""
+        self.load()
+        return self._checker
+    
+    @property
+    def is_available(self) -> bool:
+        """Whether the dictionary loaded, loading it if needed"""
+        self.load()
+        return self._available
     
     def correct_text(self, text: str) -> str:
         """Correct spelling errors in the provided text
@@ -45,17 +92,35 @@ class SpellChecker:
         
         # Process words in reverse order to avoid position shifts
         for word, start, end in reversed(words_with_positions):
-            # Skip very short words, numbers, and special terms
-            if len(word) <= 2 or word.isdigit() or self._is_special_term(word):
-                continue
-                
-            corrected = self.correct_word(word)
+            corrected = self.correct_token(word)
             if corrected != word:
                 # Replace the misspelled word with its correction
                 result[start:end] = corrected
         
         return ''.join(result)
     
+    def correct_token(self, word: str) -> str:
+        """Correct a word matched by WORD_PATTERN, skipping words that are never checked
+        
+        Args:
+            word: The word to check and potentially correct
+            
+        Returns:
+            The corrected word or the original if it is skipped or correct
+        """
+        return self.correct_word(word) if self.should_check(word) else word
+    
+    def should_check(self, word: str) -> bool:
+        """Whether a word matched by WORD_PATTERN is spell checked at all"""
+        # Skip words that are too short or likely proper nouns, based on config
+        if len(word) < config.SPELL_CHECK_MIN_WORD_LENGTH:
+            return False
+        if config.SPELL_CHECK_IGNORE_CAPITALIZED and word[0].isupper():
+            return False
+        
+        # Skip very short words, numbers, and special terms
+        return not (len(word) <= 2 or word.isdigit() or self._is_special_term(word))
+    
     def correct_word(self, word: str) -> str:
         """Correct a single word if it's misspelled
         
@@ -67,7 +132,29 @@ class SpellChecker:
         """
         if not self.is_available:
             return word
-            
+        
+        corrected = self.cached_correction(word)
+        if corrected is None:
+            corrected = self._correct_word(word)
+            self.remember_correction(word, corrected)
+        return corrected
+    
+    def cached_correction(self, word: str) -> Optional[str]:
+        """Return the memoized correction for a word, or None if it has not been checked"""
+        corrected = self._memo.get(word)
+        if corrected is not None:
+            self._memo.move_to_end(word)
+        return corrected
+    
+    def remember_correction(self, word: str, corrected: str):
+        """Memoize a correction, evicting the least recently used beyond SPELL_CHECK_MEMO_SIZE"""
+        self._memo[word] = corrected
+        self._memo.move_to_end(word)
+        if len(self._memo) > config.SPELL_CHECK_MEMO_SIZE:
+            self._memo.popitem(last=False)
+    
+    def _correct_word(self, word: str) -> str:
+        """Uncached implementation of correct_word"""
         # Preserve capitalization
         is_capitalized = word[0].isupper() if word else False
         
@@ -96,7 +183,7 @@ class SpellChecker:
         """
         words_with_positions = []
         # Find all words in the text
-        for match in re.finditer(r'\b[a-zA-Z]+\b', text):
+        for match in WORD_PATTERN.finditer(text):
             word = match.group(0)
             start_pos = match.start()
             end_pos = match.end()
@@ -125,14 +212,247 @@ class SpellChecker:
         special_terms = {'api', 'json', 'html', 'css', 'js', 'url', 'http', 'https'}
         return word.lower() in special_terms
 
+def _common_length(a: str, b: str, limit: int, reverse: bool) -> int:
+    """Length of the common prefix (or suffix) of a and b, at most limit
+    
+    Binary search over slice comparisons, which run in C, instead of a
+    per-character Python loop.
+    """
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if (a[len(a) - mid:] == b[len(b) - mid:]) if reverse else (a[:mid] == b[:mid]):
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+class SpellCheckSession:
+    """Incremental spell checking for one connection
+    
+    Remembers the words of the previous text and their corrections. On each
+    new text only the words inside the edited span are re-checked; words
+    before and after it are reused, so the cost of a keystroke does not grow
+    with the length of the document.
+    """
+    
+    def __init__(self, checker: Optional[SpellChecker] = None):
+        self.checker = checker or spell_checker
+        self._text = ""
+        # (start, end, word, corrected) for every WORD_PATTERN match in _text
+        self._tokens: List[tuple] = []
+    
+    def correct_text(self, text: str) -> str:
+        """Correct spelling errors in the provided text, reusing previous work
+        
+        Args:
+            text: The full current text
+            
+        Returns:
+            The corrected text, identical to SpellChecker.correct_text(text)
+        """
+        if not self.checker.is_available:
+            return text
+        
+        head, changed, tail = self._split(text)
+        middle = [(start, end, word, self.checker.correct_token(word)) for start, end, word in changed]
+        return self._apply(text, head + middle + tail)
+    
+    async def correct_text_async(self, text: str, batcher: "SpellCheckBatcher") -> str:
+        """Like correct_text, but corrects the edited words through a worker pool batcher"""
+        if not self.checker.is_available:
+            return text
+        
+        head, changed, tail = self._split(text)
+        corrections = await batcher.correct_words(
+            word for _, _, word in changed if self.checker.should_check(word)
+        )
+        middle = [(start, end, word, corrections.get(word, word)) for start, end, word in changed]
+        return self._apply(text, head + middle + tail)
+    
+    def _split(self, text: str) -> Tuple[List[tuple], List[tuple], List[tuple]]:
+        """Diff text against the previous text
+        
+        Returns:
+            (head, changed, tail): reusable tokens before the edit, (start, end, word)
+            matches inside it that need checking, and reusable tokens after it
+        """
+        old_text, old_tokens = self._text, self._tokens
+        
+        # The edit lies between the common prefix and the common suffix
+        limit = min(len(old_text), len(text))
+        prefix = _common_length(old_text, text, limit, reverse=False)
+        suffix = _common_length(old_text, text, limit - prefix, reverse=True)
+        shift = len(text) - len(old_text)
+        
+        # Words are unchanged if a character of the common prefix/suffix separates them from the edit
+        head = old_tokens[:bisect_left(old_tokens, prefix, key=lambda t: t[1])]
+        tail = [
+            (start + shift, end + shift, word, corrected)
+            for start, end, word, corrected in old_tokens[
+                bisect_right(old_tokens, len(old_text) - suffix, key=lambda t: t[0]):
+            ]
+        ]
+        
+        # Re-tokenize only the text between the reused words
+        window_start = head[-1][1] if head else 0
+        window_end = tail[0][0] if tail else len(text)
+        changed = [
+            (window_start + m.start(), window_start + m.end(), m.group(0))
+            for m in WORD_PATTERN.finditer(text[window_start:window_end])
+        ]
+        return head, changed, tail
+    
+    def _apply(self, text: str, tokens: List[tuple]) -> str:
+        """Remember the new text and tokens, and return the corrected text"""
+        self._text = text
+        self._tokens = tokens
+        
+        # Rebuild the corrected text from the unchanged gaps and corrected words
+        parts = []
+        position = 0
+        for start, end, word, corrected in [t for t in tokens if t[3] != t[2]]:
+            parts.append(text[position:start])
+            parts.append(corrected)
+            position = end
+        parts.append(text[position:])
+        return "".join(parts)
+
+def _load_in_worker():
+    """Load the dictionary when a worker process starts, before its first batch"""
+    spell_checker.load()
+
+def _correct_words_in_worker(words: List[str]) -> List[str]:
+    """Correct a batch of words inside a worker process"""
+    return [spell_checker.correct_word(word) for word in words]
+
+class SpellCheckBatcher:
+    """Runs word corrections in a process pool, micro-batching across connections
+    
+    Words requested within SPELL_CHECK_BATCH_WINDOW seconds of each other are
+    deduplicated and corrected in a single worker call, so the event loop never
+    runs the CPU-bound correction itself. Results are memoized in this process
+    so repeated words skip the pool entirely.
+    """
+    
+    def __init__(self, checker: Optional[SpellChecker] = None, workers: Optional[int] = None,
+                 batch_window: Optional[float] = None, max_batch_words: Optional[int] = None):
+        self.checker = checker or spell_checker
+        self.workers = config.SPELL_CHECK_WORKERS if workers is None else workers
+        self.batch_window = config.SPELL_CHECK_BATCH_WINDOW if batch_window is None else batch_window
+        self.max_batch_words = max_batch_words or config.SPELL_CHECK_MAX_BATCH_WORDS
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending_words: set = set()
+        self._waiters: List[asyncio.Future] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.batched_words = 0
+    
+    def start(self):
+        """Start the worker pool; without it, words are corrected inline"""
+        if self.workers > 0 and self._executor is None:
+            # Workers are not forked from this process: by now it runs the usage log flusher and
+            # other threads, and a child forked while one of them holds a lock can deadlock on it
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            context = multiprocessing.get_context(method)
+            if method == "forkserver":
+                context.set_forkserver_preload([__name__])
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                 initializer=_load_in_worker)
+            logger.info(f"Spell check worker pool started with {self.workers} workers")
+    
+    def shutdown(self):
+        """Stop the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+    
+    async def correct_words(self, words: Iterable[str]) -> Dict[str, str]:
+        """Correct words that passed SpellChecker.should_check
+        
+        Returns:
+            Mapping of each word to its correction (or itself)
+        """
+        corrections = {}
+        missing = []
+        for word in set(words):
+            corrected = self.checker.cached_correction(word)
+            if corrected is None:
+                missing.append(word)
+            else:
+                corrections[word] = corrected
+        if not missing:
+            return corrections
+        
+        if self._executor is None:
+            corrections.update((word, self.checker.correct_word(word)) for word in missing)
+            return corrections
+        
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._pending_words.update(missing)
+        self._waiters.append(waiter)
+        if len(self._pending_words) >= self.max_batch_words:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        
+        # The batch runs to completion even if this caller is cancelled
+        batch = await asyncio.shield(waiter)
+        corrections.update((word, batch[word]) for word in missing)
+        return corrections
+    
+    def stats(self) -> Dict:
+        """Get batch counters"""
+        return {
+            "workers": self.workers if self._executor else 0,
+            "batches": self.batches,
+            "batched_words": self.batched_words,
+            "words_per_batch": self.batched_words / self.batches if self.batches else 0.0
+        }
+    
+    def _flush(self):
+        """Send every pending word to the pool as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        words, waiters = list(self._pending_words), self._waiters
+        self._pending_words, self._waiters = set(), []
+        if words:
+            asyncio.ensure_future(self._run_batch(words, waiters))
+    
+    async def _run_batch(self, words: List[str], waiters: List[asyncio.Future]):
+        self.batches += 1
+        self.batched_words += len(words)
+        try:
+            corrected = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _correct_words_in_worker, words
+            )
+        except Exception as e:
+            logger.error(f"Error in spell check worker: {str(e)}")
+            # Fall back to leaving the words uncorrected rather than failing the request
+            corrected = words
+        else:
+            for word, correction in zip(words, corrected):
+                self.checker.remember_correction(word, correction)
+        
+        batch = dict(zip(words, corrected))
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(batch)
+
 # Create a singleton instance
 spell_checker = SpellChecker()
 
-def correct_spelling(text: str) -> str:
+# Shared batcher; start() it to move corrections into the worker pool
+spell_batcher = SpellCheckBatcher()
+
+def correct_spelling(text: str, session: Optional[SpellCheckSession] = None) -> str:
     """Correct spelling errors in the provided text
     
     Args:
         text: The input text to check for spelling errors
+        session: Optional per-connection session that only re-checks edited words
         
     Returns:
         The corrected text with spelling errors fixed
@@ -142,8 +462,31 @@ def correct_spelling(text: str) -> str:
         return text
     
     try:
+        if session is not None:
+            return session.correct_text(text)
         return spell_checker.correct_text(text)
     except Exception as e:
         logger.error(f"Error in spell correction: {str(e)}")
         # In case of any error, return the original text
-        return text
\ No newline at end of file
+        return text
+
+async def correct_spelling_async(text: str, session: Optional[SpellCheckSession] = None) -> str:
+    """Correct spelling errors without running the correction on the event loop
+    
+    Args:
+        text: The input text to check for spelling errors
+        session: Optional per-connection session that only re-checks edited words
+        
+    Returns:
+        The corrected text with spelling errors fixed
+    """
+    # Skip spell checking if disabled in config or if text is empty
+    if not config.ENABLE_SPELL_CHECK or not text or len(text.strip()) == 0:
+        return text
+    
+    try:
+        return await (session or SpellCheckSession()).correct_text_async(text, spell_batcher)
+    except Exception as e:
+        logger.error(f"Error in spell correction: {str(e)}")
+        # In case of any error, return the original text
+        return text
@@ -21,7 +21,66 @@ document.addEventListener('DOMContentLoaded', () => {
     let socket;
     let typingTimer;
     const doneTypingInterval = 500; // ms - delay before sending text for suggestions
+    // Longer while the server reports the AI service is struggling (debounce_ms)
+    let typingPause = doneTypingInterval;
     let isConnected = false;
+    // The server closes connections idle for a long while with this code;
+    // they are reopened when the user types again rather than right away
+    const idleCloseCode = 4001;
+    let closedIdle = false;
+    
+    // Streaming state - suggestion text assembled from delta frames
+    let streamedSuggestion = '';
+    let lastSeq = -1;
+    
+    // Request ids - replies to anything but the latest request are stale
+    let requestCounter = 0;
+    let latestRequestId = 0;
+    
+    // Delta protocol - after one full sync, only edits to the text are sent.
+    // syncedText is the text the server holds; null forces a full sync.
+    const useDeltaProtocol = true;
+    let syncedText = null;
+    
+    // Usage totals pushed by the server's usage feed (see /api/usage/stream)
+    let usageFeed = null;
+    let usageTotals = null;
+    
+    // Follow the usage feed, once, showing its totals below the last API call
+    function subscribeUsageFeed() {
+        if (usageFeed) return;
+        usageFeed = new EventSource('/api/usage/stream');
+        usageFeed.addEventListener('snapshot', event => {
+            usageTotals = JSON.parse(event.data).totals;
+            showUsageSummary();
+        });
+        usageFeed.addEventListener('delta', event => {
+            if (!usageTotals) return;
+            Object.assign(usageTotals, JSON.parse(event.data).totals);
+            showUsageSummary();
+        });
+    }
+    
+    function showUsageSummary() {
+        let usageSummary = document.getElementById('usageSummary');
+        if (!usageSummary) {
+            usageSummary = document.createElement('div');
+            usageSummary.id = 'usageSummary';
+            usageSummary.className = 'usage-info';
+            document.querySelector('.info-panel').appendChild(usageSummary);
+        }
+        
+        usageSummary.innerHTML = `
+            <h4>Usage Summary:</h4>
+            <ul>
+                <li>Total requests: ${usageTotals.total_requests}</li>
+                <li>Total cost: $${usageTotals.total_cost.toFixed(6)}</li>
+                <li>Today's requests: ${usageTotals.today_usage.requests}</li>
+                <li>Today's cost: $${usageTotals.today_usage.cost.toFixed(6)}</li>
+            </ul>
+            <p><a href="/dashboard">View detailed dashboard →</a></p>
+        `;
+    }
     
     // Connect to WebSocket
     function connectWebSocket() {
@@ -31,18 +90,64 @@ document.addEventListener('DOMContentLoaded', () => {
         
         updateConnectionStatus('connecting');
         
-        socket = new WebSocket(wsUrl);
+        // Offer compact binary frames, falling back to JSON if the server does not support them
+        socket = new WebSocket(wsUrl, [wireCodec.protocol, wireCodec.jsonProtocol]);
+        socket.binaryType = 'arraybuffer';
         
         // WebSocket event handlers
         socket.onopen = () => {
             console.log('WebSocket connection established');
             isConnected = true;
+            // A new connection starts with an empty server-side document
+            syncedText = null;
             updateConnectionStatus('connected');
+            // Typing reopened an idle connection: ask for the suggestion it was waiting for
+            if (closedIdle) {
+                closedIdle = false;
+                sendTextForSuggestion();
+            }
         };
         
         socket.onmessage = (event) => {
             try {
-                const data = JSON.parse(event.data);
+                const data = typeof event.data === 'string' ? JSON.parse(event.data) : wireCodec.decodeFrame(event.data);
+                
+                // Drop replies to requests that a newer keystroke has superseded
+                if (data.request_id !== undefined && data.request_id !== latestRequestId) {
+                    return;
+                }
+                
+                // The server's copy of the text diverged - send the full text again
+                if (data.resync) {
+                    syncedText = null;
+                    sendTextForSuggestion();
+                    return;
+                }
+                
+                // Final frames say how long a typing pause to wait for before the next request
+                if (data.delta === undefined) {
+                    typingPause = Math.max(doneTypingInterval, data.debounce_ms || 0);
+                }
+                
+                // Streaming delta frame - append to the suggestion being built
+                if (data.delta !== undefined) {
+                    if (data.seq === 0) {
+                        streamedSuggestion = '';
+                    } else if (data.seq !== lastSeq + 1) {
+                        return; // Out-of-order frame
+                    }
+                    lastSeq = data.seq;
+                    streamedSuggestion += data.delta;
+                    displaySuggestion(streamedSuggestion);
+                    return;
+                }
+                
+                // Final frame (or non-streaming reply) carries the full suggestion
+                if (data.done) {
+                    streamedSuggestion = '';
+                    lastSeq = -1;
+                }
+                
                 if (data.suggestion) {
                     displaySuggestion(data.suggestion);
                 }
@@ -77,22 +182,43 @@ document.addEventListener('DOMContentLoaded', () => {
                         </ul>
                     `;
                     
-                    // Display summary if available
-                    if (data.usage_summary) {
-                        const totalCost = '$' + data.usage_summary.total_cost.toFixed(6);
-                        const todayCost = '$' + data.usage_summary.today_cost.toFixed(6);
-                        
-                        usageInfo.innerHTML += `
-                            <h4>Usage Summary:</h4>
-                            <ul>
-                                <li>Total requests: ${data.usage_summary.total_requests}</li>
-                                <li>Total cost: ${totalCost}</li>
-                                <li>Today's requests: ${data.usage_summary.today_requests}</li>
-                                <li>Today's cost: ${todayCost}</li>
-                            </ul>
-                            <p><a href="/dashboard">View detailed dashboard →</a></p>
-                        `;
+                    // Time to first token is only reported for streamed suggestions
+                    if (data.usage.time_to_first_token != null) {
+                        usageInfo.querySelector('ul').innerHTML +=
+                            `<li>Time to first token: ${data.usage.time_to_first_token.toFixed(3)}s</li>`;
                     }
+
+                    // Which engine produced the suggestion: llm, cache or ngram
+                    if (data.source) {
+                        usageInfo.querySelector('ul').innerHTML +=
+                            `<li>Source: ${data.source}${data.fallback ? ' (fallback)' : ''}` +
+                            `${data.similarity != null ? ` (similarity ${data.similarity.toFixed(2)})` : ''}</li>`;
+                    }
+
+                    // Model the router picked, and whether a hedged second call answered
+                    if (data.usage.model) {
+                        usageInfo.querySelector('ul').innerHTML +=
+                            `<li>Model: ${data.usage.model}${data.usage.hedged ? ' (hedged)' : ''}</li>`;
+                    }
+
+                    // Time spent queued for an upstream slot, and how many requests were ahead
+                    if (data.usage.queue_wait != null) {
+                        usageInfo.querySelector('ul').innerHTML +=
+                            `<li>Queue wait: ${data.usage.queue_wait.toFixed(3)}s (${data.usage.queue_depth} ahead)</li>`;
+                    }
+
+                    // Prompt and wire savings from the delta protocol and context window
+                    if (data.usage.input_tokens_saved) {
+                        usageInfo.querySelector('ul').innerHTML +=
+                            `<li>Input tokens saved: ${data.usage.input_tokens_saved}</li>`;
+                    }
+                    if (data.usage.bytes_saved) {
+                        usageInfo.querySelector('ul').innerHTML +=
+                            `<li>Bytes saved: ${data.usage.bytes_saved}</li>`;
+                    }
+
+                    // Usage totals come from the usage feed, followed from the first API call shown
+                    subscribeUsageFeed();
                 }
                 
                 // Display error if present
@@ -156,11 +282,15 @@ document.addEventListener('DOMContentLoaded', () => {
             spellCheckContainer.appendChild(suggestionItem);
         }
         
-        socket.onclose = () => {
+        socket.onclose = (event) => {
             console.log('WebSocket connection closed');
             isConnected = false;
             updateConnectionStatus('disconnected');
             
+            if (event.code === idleCloseCode) {
+                closedIdle = true;
+                return;
+            }
             // Try to reconnect after a delay
             setTimeout(connectWebSocket, 3000);
         };
@@ -268,30 +398,78 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Send corrected text for suggestions
         clearTimeout(typingTimer);
-        typingTimer = setTimeout(sendTextForSuggestion, doneTypingInterval);
+        typingTimer = setTimeout(sendTextForSuggestion, typingPause);
         
         // Hide the spelling correction container after applying
         spellCheckContainer.style.display = 'none';
     }
     
+    // Send a message in the encoding negotiated for the connection
+    function sendMessage(message) {
+        if (socket.protocol === wireCodec.protocol) {
+            socket.send(wireCodec.encodeFrame(message));
+        } else {
+            socket.send(JSON.stringify(message));
+        }
+    }
+    
     // Send text to server for suggestions
     function sendTextForSuggestion() {
         const text = userInput.value.trim();
         
         if (isConnected && text.length > 0) {
-            socket.send(text);
+            latestRequestId = ++requestCounter;
+            // Offsets are UTF-16 units here but code points on the server, so text
+            // with characters outside the BMP (e.g. emoji) is always sent in full
+            if (useDeltaProtocol && syncedText !== null && !/[\uD800-\uDFFF]/.test(text)) {
+                sendMessage({
+                    edits: diffText(syncedText, text),
+                    length: text.length,
+                    request_id: latestRequestId
+                });
+            } else {
+                sendMessage({ text: text, request_id: latestRequestId });
+            }
+            syncedText = text;
         } else {
             displaySuggestion('');
         }
     }
     
+    // Edit operations [offset, deleteCount, insertText] turning oldText into newText.
+    // Typing changes one place at a time, so a single replacement between the
+    // common prefix and the common suffix covers it.
+    function diffText(oldText, newText) {
+        if (oldText === newText) {
+            return [];
+        }
+        let prefix = 0;
+        const maxPrefix = Math.min(oldText.length, newText.length);
+        while (prefix < maxPrefix && oldText[prefix] === newText[prefix]) {
+            prefix++;
+        }
+        let suffix = 0;
+        const maxSuffix = maxPrefix - prefix;
+        while (suffix < maxSuffix &&
+               oldText[oldText.length - 1 - suffix] === newText[newText.length - 1 - suffix]) {
+            suffix++;
+        }
+        return [[prefix, oldText.length - prefix - suffix, newText.slice(prefix, newText.length - suffix)]];
+    }
+    
     // Accept the current suggestion
     function acceptSuggestion() {
         const suggestion = suggestionBox.textContent;
         if (suggestion && suggestion.trim() !== '') {
-            userInput.value += suggestion;
+            // Joined as text_buffer.join_suggestion predicts, so a prefetched follow-up matches
+            const text = userInput.value;
+            const needsSpace = text !== '' && !/\s$/.test(text) && !/^[\s,.;:!?)\]}'"]/.test(suggestion);
+            userInput.value = text + (needsSpace ? ' ' : '') + suggestion;
             displaySuggestion('');
             userInput.focus();
+            // Ask for the follow-up straight away rather than after the typing delay
+            clearTimeout(typingTimer);
+            sendTextForSuggestion();
         }
     }
     
@@ -303,8 +481,14 @@ document.addEventListener('DOMContentLoaded', () => {
         // Check spelling as user types
         checkSpelling();
         
+        // Reopen a connection the server closed as idle; it asks for a suggestion once open
+        if (closedIdle && socket.readyState === WebSocket.CLOSED) {
+            connectWebSocket();
+            return;
+        }
+        
         // Start a new timer for suggestions
-        typingTimer = setTimeout(sendTextForSuggestion, doneTypingInterval);
+        typingTimer = setTimeout(sendTextForSuggestion, typingPause);
     });
     
     // Handle Tab key to accept suggestion
@@ -0,0 +1,164 @@
+/**
+ * Compact binary frames for the suggestion WebSocket (subprotocol suggest.bin.v1)
+ * Mirrors wire_codec.py: keys are sent as their index in KEYS, values are tagged
+ */
+
+class WireCodec {
+    constructor() {
+        // Same order as KEYS in wire_codec.py: only ever append
+        this.keys = [
+            'text', 'edits', 'length', 'request_id', 'deadline_ms',
+            'suggestion', 'delta', 'seq', 'done', 'source', 'cached', 'similarity', 'confidence',
+            'fallback', 'error', 'resync', 'rate_limited', 'shed', 'spelling_correction', 'original',
+            'corrected', 'usage',
+            'model', 'hedged', 'input_tokens', 'output_tokens', 'token_count_source', 'cost', 'duration',
+            'time_to_first_token', 'queue_wait', 'queue_depth', 'context_chars_omitted',
+            'input_tokens_saved', 'bytes_received', 'bytes_saved',
+            // Upstream circuit breaker
+            'circuit_open', 'debounce_ms'
+        ];
+        this.keyCodes = new Map(this.keys.map((key, i) => [key, i + 1]));
+        this.protocol = 'suggest.bin.v1';
+        this.jsonProtocol = 'suggest.json';
+        this.encoder = new TextEncoder();
+        this.decoder = new TextDecoder();
+    }
+    
+    // Decode a frame from the server (an ArrayBuffer) into a message
+    decodeFrame(buffer) {
+        const reader = { bytes: new Uint8Array(buffer), view: new DataView(buffer), pos: 1 };
+        const kind = reader.bytes[0];
+        if (kind === 1) {
+            // Streamed delta: request id, seq, then the text to the end of the frame
+            const requestId = this.readUint(reader);
+            const seq = this.readUint(reader);
+            const delta = this.decoder.decode(reader.bytes.subarray(reader.pos));
+            return { delta: delta, seq: seq, request_id: requestId };
+        }
+        if (kind === 2) {
+            return this.readValue(reader);
+        }
+        throw new Error(`Unknown frame kind ${kind}`);
+    }
+    
+    // Encode a message to the server as a frame
+    encodeFrame(message) {
+        const out = [2];
+        this.writeValue(message, out);
+        return new Uint8Array(out);
+    }
+    
+    writeUint(value, out) {
+        // Arithmetic rather than bit operations, which would truncate to 32 bits
+        while (value > 0x7f) {
+            out.push((value % 0x80) | 0x80);
+            value = Math.floor(value / 0x80);
+        }
+        out.push(value);
+    }
+    
+    writeString(value, out) {
+        const bytes = this.encoder.encode(value);
+        this.writeUint(bytes.length, out);
+        for (let i = 0; i < bytes.length; i++) {
+            out.push(bytes[i]);
+        }
+    }
+    
+    writeValue(value, out) {
+        if (value === null || value === undefined) {
+            out.push(0);
+        } else if (value === false) {
+            out.push(1);
+        } else if (value === true) {
+            out.push(2);
+        } else if (typeof value === 'string') {
+            out.push(6);
+            this.writeString(value, out);
+        } else if (typeof value === 'number') {
+            if (Number.isSafeInteger(value)) {
+                out.push(value >= 0 ? 3 : 4);
+                this.writeUint(value >= 0 ? value : -1 - value, out);
+            } else {
+                out.push(5);
+                const bytes = new Uint8Array(8);
+                new DataView(bytes.buffer).setFloat64(0, value, true);
+                bytes.forEach(b => out.push(b));
+            }
+        } else if (Array.isArray(value)) {
+            out.push(7);
+            this.writeUint(value.length, out);
+            value.forEach(item => this.writeValue(item, out));
+        } else {
+            const entries = Object.entries(value);
+            out.push(8);
+            this.writeUint(entries.length, out);
+            entries.forEach(([key, item]) => {
+                const code = this.keyCodes.get(key);
+                if (code === undefined) {
+                    out.push(0);
+                    this.writeString(key, out);
+                } else {
+                    this.writeUint(code, out);
+                }
+                this.writeValue(item, out);
+            });
+        }
+    }
+    
+    readUint(reader) {
+        let value = 0;
+        let scale = 1;
+        for (;;) {
+            const byte = reader.bytes[reader.pos++];
+            if (byte === undefined) throw new Error('Truncated frame');
+            value += (byte & 0x7f) * scale;
+            if (byte < 0x80) return value;
+            scale *= 0x80;
+        }
+    }
+    
+    readString(reader) {
+        const length = this.readUint(reader);
+        const text = this.decoder.decode(reader.bytes.subarray(reader.pos, reader.pos + length));
+        reader.pos += length;
+        return text;
+    }
+    
+    readValue(reader) {
+        const tag = reader.bytes[reader.pos++];
+        switch (tag) {
+            case 0: return null;
+            case 1: return false;
+            case 2: return true;
+            case 3: return this.readUint(reader);
+            case 4: return -1 - this.readUint(reader);
+            case 5: {
+                const value = reader.view.getFloat64(reader.pos, true);
+                reader.pos += 8;
+                return value;
+            }
+            case 6: return this.readString(reader);
+            case 7: {
+                const count = this.readUint(reader);
+                const list = [];
+                for (let i = 0; i < count; i++) list.push(this.readValue(reader));
+                return list;
+            }
+            case 8: {
+                const count = this.readUint(reader);
+                const result = {};
+                for (let i = 0; i < count; i++) {
+                    const code = this.readUint(reader);
+                    const key = code === 0 ? this.readString(reader) : this.keys[code - 1];
+                    result[key] = this.readValue(reader);
+                }
+                return result;
+            }
+            default: throw new Error(`Unknown value tag ${tag}`);
+        }
+    }
+}
+
+// Export the codec
+const wireCodec = new WireCodec();
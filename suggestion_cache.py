@@ -0,0 +1,154 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Tuple, Set
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+class SuggestionCache:
+    """An LRU + TTL cache of LLM suggestions with prefix matching
+
+    Entries are keyed on (model, temperature, prompt_version, text). Besides
+    exact hits, a lookup also succeeds when the new text is a cached text
+    followed by the start of its cached suggestion: the user is typing out
+    the suggestion, so the rest of it is served without an upstream call.
+    """
+
+    # Number of trailing characters of a cached text used to index it for prefix lookups
+    TAIL_LENGTH = 16
+
+    def __init__(self, max_entries: int = None, ttl: float = None,
+                 prefix_window: int = None, max_text_length: int = None):
+        """Initialize the cache
+
+        Args:
+            max_entries: Maximum number of cached suggestions before LRU eviction
+            ttl: Seconds a cached suggestion stays valid
+            prefix_window: Maximum number of typed characters matched against a cached suggestion
+            max_text_length: Texts longer than this are not cached
+        """
+        self.max_entries = max_entries or config.SUGGESTION_CACHE_MAX_ENTRIES
+        self.ttl = ttl or config.SUGGESTION_CACHE_TTL
+        self.prefix_window = prefix_window or config.SUGGESTION_CACHE_PREFIX_WINDOW
+        self.max_text_length = max_text_length or config.SUGGESTION_CACHE_MAX_TEXT_LENGTH
+
+        # key -> (suggestion, expires_at), least recently used first
+        self._entries: "OrderedDict[Tuple, Tuple[str, float]]" = OrderedDict()
+        # (model, temperature, prompt_version, text tail) -> keys ending with that tail
+        self._tails: Dict[Tuple, Set[Tuple]] = {}
+
+        self.hits = 0
+        self.prefix_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, text: str, model: str, temperature: float, prompt_version: int) -> Optional[str]:
+        """Look up a suggestion for the given text
+
+        Args:
+            text: The spell-corrected user text
+            model: The model name
+            temperature: The sampling temperature
+            prompt_version: Version of the system prompt
+
+        Returns:
+            The cached suggestion, the remainder of a cached suggestion the user
+            has partially typed, or None on a miss
+        """
+        params = (model, temperature, prompt_version)
+        now = time.monotonic()
+
+        suggestion = self._lookup(params + (text,), now)
+        if suggestion:
+            self.hits += 1
+            return suggestion
+
+        # Try shorter cached texts whose suggestion the user may be typing out
+        for cut in range(len(text) - 1, max(len(text) - self.prefix_window, 0), -1):
+            tail = text[max(0, cut - self.TAIL_LENGTH):cut]
+            for key in list(self._tails.get(params + (tail,), ())):
+                cached_text = key[3]
+                if len(cached_text) != cut or not text.startswith(cached_text):
+                    continue
+                suggestion = self._lookup(key, now)
+                typed = text[cut:].lstrip()
+                if suggestion and typed and len(typed) < len(suggestion) and suggestion.startswith(typed):
+                    self.prefix_hits += 1
+                    return suggestion[len(typed):]
+
+        self.misses += 1
+        return None
+
+    def contains(self, text: str, model: str, temperature: float, prompt_version: int) -> bool:
+        """Whether an exact, unexpired entry exists for the text, without counting a lookup"""
+        return self._lookup((model, temperature, prompt_version, text), time.monotonic()) is not None
+
+    def put(self, text: str, model: str, temperature: float, prompt_version: int, suggestion: str):
+        """Store a suggestion for the given text"""
+        if not suggestion or len(text) > self.max_text_length:
+            return
+
+        key = (model, temperature, prompt_version, text)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            tail_key = (model, temperature, prompt_version, text[-self.TAIL_LENGTH:])
+            self._tails.setdefault(tail_key, set()).add(key)
+        self._entries[key] = (suggestion, time.monotonic() + self.ttl)
+
+        # Evict least recently used entries beyond the size bound
+        while len(self._entries) > self.max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all cached suggestions"""
+        self._entries.clear()
+        self._tails.clear()
+
+    def stats(self) -> Dict:
+        """Get cache size and hit/miss counters"""
+        lookups = self.hits + self.prefix_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "prefix_hits": self.prefix_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.prefix_hits) / lookups if lookups else 0.0
+        }
+
+    def _lookup(self, key: Tuple, now: float) -> Optional[str]:
+        """Return the suggestion for a key, dropping it if expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        suggestion, expires_at = entry
+        if expires_at <= now:
+            self._remove(key)
+            self.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return suggestion
+
+    def _remove(self, key: Tuple):
+        """Remove an entry and its prefix index reference"""
+        self._entries.pop(key, None)
+        model, temperature, prompt_version, text = key
+        tail_key = (model, temperature, prompt_version, text[-self.TAIL_LENGTH:])
+        keys = self._tails.get(tail_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tails[tail_key]
+
+# Create a singleton instance
+suggestion_cache = SuggestionCache()
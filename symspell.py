@@ -0,0 +1,243 @@
+import array
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from bisect import bisect_left
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Index file layout: header, word frequencies (uint64), sorted delete hashes
+# (uint32), word ids for each hash (uint32), then the newline-joined words
+INDEX_MAGIC = b"SYMS"
+INDEX_FORMAT_VERSION = 1
+_HEADER = struct.Struct("=4sIII16sIIQ")
+
+def _source_tag() -> bytes:
+    """Identify the dictionary the index was built from"""
+    try:
+        version = metadata.version("pyspellchecker")
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+    return f"pyspellchecker {version}".encode("ascii")[:16].ljust(16, b"\0")
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """All strings obtained by deleting up to max_distance characters from word"""
+    result = {word}
+    current = {word}
+    for _ in range(max_distance):
+        next_level = set()
+        for item in current:
+            if item:
+                for i in range(len(item)):
+                    next_level.add(item[:i] + item[i + 1:])
+        result |= next_level
+        current = next_level
+    return result
+
+def _hash(text: str) -> int:
+    """Stable 32-bit hash of a delete string (collisions are filtered by the distance check)"""
+    return zlib.crc32(text.encode("utf-8"))
+
+def bounded_distance(a: str, b: str, max_distance: int) -> int:
+    """Edit distance between two strings, capped at max_distance + 1
+
+    Counts deletes, inserts, replaces and adjacent transposes, including a
+    transpose around one inserted or deleted character. For max_distance <= 2
+    this is exactly pyspellchecker's notion of distance: its edit-distance-2
+    candidates are any two successive edits.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    # Common prefixes and suffixes never change the distance
+    start = 0
+    shortest = min(len(a), len(b))
+    while start < shortest and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if not a or not b:
+        return min(len(a) + len(b), max_distance + 1)
+    if max_distance == 0:
+        return 1
+
+    # The first characters differ, so one edit must start here
+    remaining = max_distance - 1
+    best = min(
+        bounded_distance(a[1:], b[1:], remaining),
+        bounded_distance(a[1:], b, remaining),
+        bounded_distance(a, b[1:], remaining)
+    )
+    if len(a) > 1 and len(b) > 1 and a[0] == b[1] and a[1] == b[0]:
+        best = min(best, bounded_distance(a[2:], b[2:], remaining))
+    result = 1 + best
+
+    if max_distance >= 2 and result > 2:
+        # Transpose followed by an insert or delete between the swapped pair
+        if len(a) > 1 and len(b) > 2 and a[0] == b[2] and a[1] == b[0] and a[2:] == b[3:]:
+            result = 2
+        elif len(a) > 2 and len(b) > 1 and a[2] == b[0] and a[0] == b[1] and a[3:] == b[2:]:
+            result = 2
+    return min(result, max_distance + 1)
+
+class SymSpellIndex:
+    """Spelling correction over a precomputed symmetric-delete index
+
+    Every dictionary word is indexed under each string obtained by deleting
+    up to max_distance of its characters. A lookup only has to generate the
+    deletes of the input word and verify the few words that share one, instead
+    of generating every edit-distance-2 string. Candidates are ranked exactly
+    like pyspellchecker: distance-1 words before distance-2 words, then by
+    frequency, ties broken alphabetically.
+    """
+
+    def __init__(self, words, frequencies, hashes, word_ids, max_distance: int,
+                 longest_word_length: int, source: Optional[mmap.mmap] = None):
+        self.words = words
+        self.frequencies = dict(zip(words, frequencies))
+        self._hashes = hashes
+        self._word_ids = word_ids
+        self.max_distance = max_distance
+        self.longest_word_length = longest_word_length
+        # Keep the mapped file open for as long as the index views reference it
+        self._source = source
+
+    @classmethod
+    def build(cls, word_frequency: Dict[str, int], max_distance: int = 2) -> "SymSpellIndex":
+        """Build the index from a word -> frequency dictionary"""
+        words = sorted(word_frequency)
+        frequencies = array.array("Q", (word_frequency[w] for w in words))
+        keys = array.array("Q")
+        for word_id, word in enumerate(words):
+            keys.extend((_hash(d) << 32) | word_id for d in _deletes(word, max_distance))
+        keys = array.array("Q", sorted(keys))
+        hashes = array.array("I", (k >> 32 for k in keys))
+        word_ids = array.array("I", (k & 0xFFFFFFFF for k in keys))
+        longest = max((len(w) for w in words), default=0)
+        return cls(words, frequencies, hashes, word_ids, max_distance, longest)
+
+    def save(self, path: Path):
+        """Write the index to a compact binary file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        words_blob = "\n".join(self.words).encode("utf-8")
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, INDEX_FORMAT_VERSION, self.max_distance,
+                                 self.longest_word_length, _source_tag(), len(self.words),
+                                 len(self._hashes), len(words_blob)))
+            f.write(array.array("Q", (self.frequencies[w] for w in self.words)).tobytes())
+            f.write(array.array("I", self._hashes).tobytes())
+            f.write(array.array("I", self._word_ids).tobytes())
+            f.write(words_blob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["SymSpellIndex"]:
+        """Memory-map an index file, returning None if it is missing or stale"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, "rb") as f:
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, max_distance, longest, tag,
+         n_words, n_entries, words_len) = _HEADER.unpack_from(source, 0)
+        if magic != INDEX_MAGIC or version != INDEX_FORMAT_VERSION or tag != _source_tag():
+            source.close()
+            return None
+
+        view = memoryview(source)
+        offset = _HEADER.size
+        frequencies = view[offset:offset + 8 * n_words].cast("Q")
+        offset += 8 * n_words
+        hashes = view[offset:offset + 4 * n_entries].cast("I")
+        offset += 4 * n_entries
+        word_ids = view[offset:offset + 4 * n_entries].cast("I")
+        offset += 4 * n_entries
+        words = bytes(view[offset:offset + words_len]).decode("utf-8").split("\n")
+        return cls(words, frequencies, hashes, word_ids, max_distance, longest, source)
+
+    def unknown(self, words: Iterable[str]) -> Set[str]:
+        """The subset of words that are not in the dictionary (pyspellchecker compatible)"""
+        return {w for w in (w.lower() for w in words) if self._should_check(w) and w not in self.frequencies}
+
+    def correction(self, word: str) -> Optional[str]:
+        """The most probable correct spelling for the word (pyspellchecker compatible)"""
+        word = word.lower()
+        if word in self.frequencies or not self._should_check(word):
+            return word
+
+        # Gather every dictionary word sharing a delete with the input
+        candidate_ids = set()
+        for delete in _deletes(word, self.max_distance):
+            key = _hash(delete)
+            i = bisect_left(self._hashes, key)
+            while i < len(self._hashes) and self._hashes[i] == key:
+                candidate_ids.add(self._word_ids[i])
+                i += 1
+
+        # Most frequent first, ties alphabetical; the first word within the
+        # smallest distance that has any match is the correction
+        ranked = sorted(
+            (self.words[word_id] for word_id in candidate_ids),
+            key=lambda candidate: (-self.frequencies[candidate], candidate)
+        )
+        for distance in range(1, self.max_distance + 1):
+            for candidate in ranked:
+                if bounded_distance(word, candidate, distance) <= distance:
+                    return candidate
+        return None
+
+    def _should_check(self, word: str) -> bool:
+        """Mirror pyspellchecker's rules for words it does not try to correct"""
+        if len(word) > self.longest_word_length + 3:
+            return False
+        if word == "nan":
+            return True
+        try:
+            float(word)
+            return False
+        except ValueError:
+            return True
+
+def load_or_build_index(path: Optional[Path] = None) -> SymSpellIndex:
+    """Load the prebuilt index, building and saving it from pyspellchecker's dictionary if needed"""
+    path = Path(path or config.SPELL_INDEX_FILE)
+    index = SymSpellIndex.load(path)
+    if index is not None:
+        return index
+
+    from spellchecker import SpellChecker as PySpellChecker
+
+    logger.info(f"Building spell index at {path}")
+    start_time = time.time()
+    word_frequency = dict(PySpellChecker().word_frequency.dictionary)
+    index = SymSpellIndex.build(word_frequency)
+    index.save(path)
+    logger.info(f"Spell index built in {time.time() - start_time:.1f}s")
+    # Reload so the in-memory index is the compact memory-mapped form
+    return SymSpellIndex.load(path) or index
+
+if __name__ == "__main__":
+    # Prebuild the index artifact: python symspell.py [path]
+    target = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(config.SPELL_INDEX_FILE)
+    if target.exists():
+        target.unlink()
+    load_or_build_index(target)
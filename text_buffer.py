@@ -0,0 +1,155 @@
+import re
+from typing import List, Sequence, Tuple, Union
+
+import config
+
+# End of a sentence: terminal punctuation followed by whitespace, or a line break
+SENTENCE_BOUNDARY = re.compile(r"[.!?][\"')\]]*\s+|\n+")
+
+class GapBuffer:
+    """Editable text with cheap edits near the previous edit
+
+    The text is kept in a list with a gap at the last edit position.
+    Typing happens at or near the same place, so an edit only moves the
+    characters between the previous and the new position instead of
+    rebuilding the whole string.
+    """
+
+    def __init__(self, text: str = "", gap: int = 64):
+        self._buffer: List[str] = list(text) + [""] * gap
+        self._gap_start = len(text)
+        self._gap_end = len(self._buffer)
+
+    def __len__(self) -> int:
+        return len(self._buffer) - (self._gap_end - self._gap_start)
+
+    def __getitem__(self, index: slice) -> str:
+        """Text of a slice (steps are not supported)"""
+        start, end, _ = index.indices(len(self))
+        if end <= start:
+            return ""
+        gap = self._gap_end - self._gap_start
+        if end <= self._gap_start:
+            return "".join(self._buffer[start:end])
+        if start >= self._gap_start:
+            return "".join(self._buffer[start + gap:end + gap])
+        return "".join(self._buffer[start:self._gap_start]) + "".join(self._buffer[self._gap_end:end + gap])
+
+    def text(self) -> str:
+        return self[:]
+
+    def set_text(self, text: str):
+        """Replace the whole text"""
+        self.__init__(text)
+
+    def replace(self, offset: int, delete_count: int, insert: str):
+        """Delete delete_count characters at offset, then insert text there
+
+        Raises:
+            ValueError: If the range is outside the text
+        """
+        if offset < 0 or delete_count < 0 or offset + delete_count > len(self):
+            raise ValueError(f"Edit ({offset}, {delete_count}) is outside a text of length {len(self)}")
+        self._move_gap(offset)
+        self._gap_end += delete_count
+        if len(insert) > self._gap_end - self._gap_start:
+            self._grow(len(insert))
+        self._buffer[self._gap_start:self._gap_start + len(insert)] = list(insert)
+        self._gap_start += len(insert)
+
+    def _move_gap(self, offset: int):
+        if offset < self._gap_start:
+            moved = self._gap_start - offset
+            self._buffer[self._gap_end - moved:self._gap_end] = self._buffer[offset:self._gap_start]
+            self._gap_start = offset
+            self._gap_end -= moved
+        elif offset > self._gap_start:
+            moved = offset - self._gap_start
+            self._buffer[self._gap_start:offset] = self._buffer[self._gap_end:self._gap_end + moved]
+            self._gap_start = offset
+            self._gap_end += moved
+
+    def _grow(self, needed: int):
+        """Enlarge the gap to hold at least `needed` characters"""
+        extra = max(needed, len(self._buffer))
+        self._buffer[self._gap_end:self._gap_end] = [""] * extra
+        self._gap_end += extra
+
+class DocumentTooLargeError(ValueError):
+    """A full text longer than MAX_DOCUMENT_CHARS; a resync would only send it again"""
+
+def apply_edits(document: GapBuffer, edits: Sequence[Sequence], expected_length: int = None):
+    """Apply client edit operations [offset, delete_count, insert_text] in order
+
+    Raises:
+        ValueError: If an edit is malformed or out of range, or the resulting
+            length differs from the client's, meaning the texts have diverged
+    """
+    for edit in edits:
+        if len(edit) != 3:
+            raise ValueError(f"Malformed edit: {edit!r}")
+        offset, delete_count, insert = edit
+        if not isinstance(offset, int) or not isinstance(delete_count, int) or not isinstance(insert, str):
+            raise ValueError(f"Malformed edit: {edit!r}")
+        document.replace(offset, delete_count, insert)
+    if len(document) > config.MAX_DOCUMENT_CHARS:
+        raise ValueError(f"Document exceeds {config.MAX_DOCUMENT_CHARS} characters")
+    if expected_length is not None and expected_length != len(document):
+        raise ValueError(f"Document length {len(document)} differs from the client's {expected_length}")
+
+def build_context(document: Union[str, GapBuffer], window: int = None,
+                  summary_chars: int = None) -> Tuple[str, int]:
+    """Select the part of the document sent to the LLM
+
+    Only the last `window` characters are kept, starting at a sentence
+    boundary when there is one. With summary_chars, the opening sentences of
+    the document (up to that many characters) are kept too, as a summary of
+    what it is about.
+
+    Args:
+        document: The full text
+        window: Maximum characters of trailing text
+        summary_chars: Maximum characters of opening text to keep (0 to disable)
+
+    Returns:
+        (context text, number of document characters left out)
+    """
+    window = window or config.CONTEXT_WINDOW_CHARS
+    summary_chars = config.CONTEXT_SUMMARY_CHARS if summary_chars is None else summary_chars
+    length = len(document)
+    if length <= window:
+        return document[0:length], 0
+
+    start = length - window
+    tail = document[start:length]
+    # Drop the partial sentence at the start of the window, unless that leaves too little
+    match = SENTENCE_BOUNDARY.search(tail)
+    if match and match.end() < len(tail) // 2:
+        tail = tail[match.end():]
+        start += match.end()
+
+    summary = ""
+    if summary_chars:
+        head = document[0:min(start, summary_chars)]
+        if len(head) < start:
+            # Keep whole opening sentences only
+            boundaries = [m.end() for m in SENTENCE_BOUNDARY.finditer(head)]
+            if boundaries:
+                head = head[:boundaries[-1]]
+        summary = head.strip()
+
+    omitted = start - len(summary)
+    if summary:
+        return f"{summary} [...] {tail}", omitted
+    return tail, omitted
+
+def join_suggestion(text: str, suggestion: str) -> str:
+    """The text as it reads after the user accepts a suggestion
+
+    The client appends the suggestion with a separating space unless the
+    text already ends in whitespace or the suggestion starts with whitespace
+    or punctuation (static/js/app.js does the same), then trims the result.
+    """
+    if not text or not suggestion or text[-1].isspace() or suggestion[0].isspace() or suggestion[0] in ",.;:!?)]}'\"":
+        return (text + suggestion).strip()
+    return f"{text} {suggestion}".strip()
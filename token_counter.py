@@ -0,0 +1,154 @@
+import base64
+import logging
+import re
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Llama 3's pre-tokenizer pattern, with \p{L} (letters) and \p{N} (numbers)
+# written for the standard re module
+PRE_TOKENIZE_PATTERN = re.compile(
+    r"(?i:'s|'t|'re|'ve|'m|'ll|'d)"
+    r"|(?:[^\r\n\w]|_)?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?(?:[^\s\w]|_)+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+"
+)
+
+# Llama 3 chat template: <|start_header_id|>role<|end_header_id|>\n\n ... <|eot_id|> per message,
+# and <|begin_of_text|> plus the assistant header around the whole prompt
+MESSAGE_OVERHEAD_TOKENS = 5
+PROMPT_OVERHEAD_TOKENS = 5
+
+class TokenCounter(ABC):
+    """Counts tokens for cost tracking; subclasses implement count()"""
+
+    name = "base"
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """Tokens in a piece of text"""
+
+    def count_messages(self, messages: Iterable[Dict]) -> int:
+        """Prompt tokens of chat messages ({"role", "content"} dicts), including the chat template"""
+        return PROMPT_OVERHEAD_TOKENS + sum(
+            MESSAGE_OVERHEAD_TOKENS + self.count(message["content"]) for message in messages
+        )
+
+    def stats(self) -> Dict:
+        return {"engine": self.name}
+
+class HeuristicTokenCounter(TokenCounter):
+    """About 4 characters per token, for when no tokenizer file is available"""
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        return len(text) // 4
+
+class BPETokenCounter(TokenCounter):
+    """Byte-level BPE token counts from a tiktoken-format rank file
+
+    This is the format of Llama 3's tokenizer.model: one base64-encoded
+    token and its merge rank per line. Text is split with the model's
+    pre-tokenizer pattern and each piece is merged pair by pair in rank
+    order, exactly as the model's tokenizer does.
+
+    Both the token count of each piece and of each whole text are kept in
+    LRU caches: words repeat constantly across keystrokes, and identical
+    texts are counted again for cache hits and coalesced requests.
+    """
+
+    name = "bpe"
+
+    def __init__(self, path: Path, cache_size: int = None):
+        """Load the rank file
+
+        Args:
+            path: tiktoken-format rank file
+            cache_size: Entries in each of the piece and text count caches
+        """
+        self.path = Path(path)
+        cache_size = cache_size or config.TOKEN_COUNT_CACHE_SIZE
+        self._ranks: Dict[bytes, int] = {}
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    token, rank = line.split()
+                    self._ranks[base64.b64decode(token)] = int(rank)
+        self._count_piece = lru_cache(maxsize=cache_size)(self._merge_count)
+        self._texts: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, text: str) -> int:
+        cached = self._texts.get(text)
+        if cached is not None:
+            self._texts.move_to_end(text)
+            self.hits += 1
+            return cached
+        self.misses += 1
+        tokens = sum(self._count_piece(piece) for piece in PRE_TOKENIZE_PATTERN.findall(text))
+        self._texts[text] = tokens
+        if len(self._texts) > self._cache_size:
+            self._texts.popitem(last=False)
+        return tokens
+
+    def stats(self) -> Dict:
+        piece_cache = self._count_piece.cache_info()
+        return {
+            "engine": self.name,
+            "vocabulary": len(self._ranks),
+            "text_hits": self.hits,
+            "text_misses": self.misses,
+            "piece_hits": piece_cache.hits,
+            "piece_misses": piece_cache.misses
+        }
+
+    def _merge_count(self, piece: str) -> int:
+        """Number of tokens the BPE merges leave for one pre-tokenized piece"""
+        data = piece.encode("utf-8")
+        if data in self._ranks:
+            return 1
+        parts: List[bytes] = [data[i:i + 1] for i in range(len(data))]
+        ranks = self._ranks
+        while len(parts) > 1:
+            best_rank = None
+            best_index = 0
+            for i in range(len(parts) - 1):
+                rank = ranks.get(parts[i] + parts[i + 1])
+                if rank is not None and (best_rank is None or rank < best_rank):
+                    best_rank = rank
+                    best_index = i
+            if best_rank is None:
+                break
+            parts[best_index:best_index + 2] = [parts[best_index] + parts[best_index + 1]]
+        return len(parts)
+
+def create_token_counter() -> TokenCounter:
+    """The counter selected by TOKEN_COUNTER, falling back to the heuristic without a tokenizer file"""
+    if config.TOKEN_COUNTER == "bpe":
+        path = Path(config.TOKENIZER_FILE)
+        if path.exists():
+            counter = BPETokenCounter(path)
+            logger.info(f"Loaded tokenizer with {len(counter._ranks)} tokens from {path}")
+            return counter
+        logger.warning(f"No tokenizer at {path}; estimating tokens from text length")
+    return HeuristicTokenCounter()
+
+# Create a singleton instance
+token_counter = create_token_counter()
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Hashable, Optional
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+class UpstreamBusy(Exception):
+    """Raised when a request waited longer than its deadline for an upstream slot"""
+
+class SlotTicket:
+    """One request's place in the upstream queue"""
+
+    def __init__(self, client_id: Hashable, deadline: float, queue_depth: int):
+        self.client_id = client_id
+        # time.monotonic() by which the request must have started its upstream call
+        self.deadline = deadline
+        # Number of requests queued ahead of this one when it arrived
+        self.queue_depth = queue_depth
+        self.enqueued_at = time.monotonic()
+        # Seconds spent waiting for the slot
+        self.wait = 0.0
+        self.future: Optional[asyncio.Future] = None
+
+class UpstreamScheduler:
+    """Bounds concurrent upstream calls and shares them fairly between clients
+
+    At most max_concurrency calls run at once, and at most max_per_client
+    of them for any one client. When a slot frees up it goes to the next
+    client in round-robin order that has a request waiting, so a client
+    sending many requests waits its turn behind everyone else instead of
+    starving them. A request that cannot get a slot before its deadline is
+    shed with UpstreamBusy.
+    """
+
+    def __init__(self, max_concurrency: int = None, max_per_client: int = None):
+        """Initialize the scheduler
+
+        Args:
+            max_concurrency: Maximum number of concurrent upstream calls
+            max_per_client: Maximum number of concurrent upstream calls per client
+        """
+        self.max_concurrency = max_concurrency or config.UPSTREAM_MAX_CONCURRENCY
+        self.max_per_client = max_per_client or config.UPSTREAM_MAX_PER_CLIENT
+
+        # client -> waiting tickets, in round-robin order
+        self._queues: "OrderedDict[Hashable, Deque[SlotTicket]]" = OrderedDict()
+        self._running: Dict[Hashable, int] = {}
+        self.active = 0
+        self.queued = 0
+
+        self.granted = 0
+        self.shed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, client_id: Hashable, timeout: float = None) -> AsyncIterator[SlotTicket]:
+        """Hold an upstream slot for the duration of the block
+
+        Args:
+            client_id: Identifies the client for fair sharing
+            timeout: Seconds the request may wait for a slot
+
+        Raises:
+            UpstreamBusy: If no slot was free before the timeout
+        """
+        ticket = await self.acquire(client_id, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(client_id)
+
+    async def acquire(self, client_id: Hashable, timeout: float = None) -> SlotTicket:
+        """Wait for an upstream slot; pair every successful call with release()"""
+        timeout = config.UPSTREAM_QUEUE_TIMEOUT if timeout is None else timeout
+        ticket = SlotTicket(client_id, time.monotonic() + timeout, self.queued)
+
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(client_id, deque()).append(ticket)
+        self.queued += 1
+        self._dispatch()
+        if ticket.future.done():
+            return ticket
+
+        try:
+            await asyncio.wait({ticket.future}, timeout=max(0.0, ticket.deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            if ticket.future.done():
+                # The slot was granted just as the request was superseded
+                self.release(client_id)
+            else:
+                self._dequeue(ticket)
+            raise
+
+        if not ticket.future.done():
+            self._dequeue(ticket)
+            self.shed += 1
+            logger.warning(f"Shed upstream request after {time.monotonic() - ticket.enqueued_at:.3f}s in queue")
+            raise UpstreamBusy()
+        return ticket
+
+    def try_acquire_nowait(self, client_id: Hashable) -> Optional[SlotTicket]:
+        """Take a free slot without queueing, for optional work such as hedged calls
+
+        Returns:
+            A granted ticket (pair it with release()), or None if the slot
+            would have to wait or go ahead of queued requests
+        """
+        if self.queued or not self._has_capacity(client_id):
+            return None
+        ticket = SlotTicket(client_id, time.monotonic(), 0)
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._grant(ticket)
+        return ticket
+
+    def release(self, client_id: Hashable):
+        """Free a slot and hand it to the next waiting client"""
+        self.active -= 1
+        running = self._running[client_id] - 1
+        if running:
+            self._running[client_id] = running
+        else:
+            del self._running[client_id]
+        self._dispatch()
+
+    def stats(self) -> Dict:
+        """Get concurrency, queue depth, shedding and wait time counters"""
+        return {
+            "active": self.active,
+            "queue_depth": self.queued,
+            "queued_clients": len(self._queues),
+            "granted": self.granted,
+            "shed": self.shed,
+            "avg_wait": self.total_wait / self.granted if self.granted else 0.0,
+            "max_wait": self.max_wait
+        }
+
+    def _has_capacity(self, client_id: Hashable) -> bool:
+        return self.active < self.max_concurrency and self._running.get(client_id, 0) < self.max_per_client
+
+    def _grant(self, ticket: SlotTicket):
+        self.active += 1
+        self._running[ticket.client_id] = self._running.get(ticket.client_id, 0) + 1
+        ticket.wait = time.monotonic() - ticket.enqueued_at
+        self.granted += 1
+        self.total_wait += ticket.wait
+        self.max_wait = max(self.max_wait, ticket.wait)
+        ticket.future.set_result(None)
+
+    def _dispatch(self):
+        """Grant free slots to waiting clients in round-robin order"""
+        while self.queued and self.active < self.max_concurrency:
+            for client_id in self._queues:
+                if self._has_capacity(client_id):
+                    break
+            else:
+                # Every waiting client is at its own limit
+                return
+            queue = self._queues.pop(client_id)
+            ticket = queue.popleft()
+            self.queued -= 1
+            if queue:
+                # Back of the line for this client's next request
+                self._queues[client_id] = queue
+            self._grant(ticket)
+
+    def _dequeue(self, ticket: SlotTicket):
+        queue = self._queues.get(ticket.client_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        self.queued -= 1
+        if not queue:
+            del self._queues[ticket.client_id]
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Counters kept per time bucket, as in UsageStore.aggregate
+FIELDS = ("requests", "cache_hits", "cancelled", "failures", "input_tokens", "output_tokens", "cost",
+          "speculative_requests", "speculative_cost")
+_FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+# Series name -> (bucket seconds, number of buckets): the last hour by minute and the last day by hour
+SERIES = {
+    "hour": (60, 60),
+    "day": (3600, 24)
+}
+
+def record_counts(record: Dict) -> List[Tuple[int, float]]:
+    """(field index, amount) pairs a usage record adds to its time bucket"""
+    kind = record.get("type", "call")
+    if kind == "cancelled":
+        # A hedge loser carries the tokens and cost it may be billed for
+        return [(_FIELD_INDEX["cancelled"], 1),
+                (_FIELD_INDEX["input_tokens"], record.get("input_tokens", 0)),
+                (_FIELD_INDEX["output_tokens"], record.get("output_tokens", 0)),
+                (_FIELD_INDEX["cost"], record.get("total_cost", 0.0))]
+    if kind == "cache_hit":
+        return [(_FIELD_INDEX["cache_hits"], 1)]
+    if kind == "speculative":
+        return [(_FIELD_INDEX["speculative_requests"], 1),
+                (_FIELD_INDEX["speculative_cost"], record["total_cost"])]
+    counts = [(_FIELD_INDEX["requests"], 1),
+              (_FIELD_INDEX["input_tokens"], record["input_tokens"]),
+              (_FIELD_INDEX["output_tokens"], record["output_tokens"]),
+              (_FIELD_INDEX["cost"], record["total_cost"])]
+    if not record.get("success", True):
+        counts.append((_FIELD_INDEX["failures"], 1))
+    return counts
+
+class RingSeries:
+    """Fixed-size time series of per-bucket counters
+
+    Each slot holds one bucket and is reused when the ring comes round to
+    it again, so adding to the current bucket is O(1) and old buckets fall
+    off without any cleanup pass.
+    """
+
+    def __init__(self, bucket_seconds: int, length: int):
+        self.bucket_seconds = bucket_seconds
+        self.length = length
+        # Bucket number (time // bucket_seconds) held in each slot, or -1 if empty
+        self._numbers = [-1] * length
+        self._values = [[0] * len(FIELDS) for _ in range(length)]
+
+    def add(self, now: float, counts: List[Tuple[int, float]]) -> int:
+        """Add counts to the bucket containing `now`, returning its bucket number"""
+        number = int(now // self.bucket_seconds)
+        slot = number % self.length
+        values = self._values[slot]
+        if self._numbers[slot] != number:
+            self._numbers[slot] = number
+            values[:] = [0] * len(FIELDS)
+        for index, amount in counts:
+            values[index] += amount
+        return number
+
+    def bucket(self, number: int) -> Dict:
+        """The counters of one bucket, zero if it has not been used or was overwritten"""
+        slot = number % self.length
+        values = self._values[slot] if self._numbers[slot] == number else [0] * len(FIELDS)
+        return {"start": number * self.bucket_seconds, **dict(zip(FIELDS, values))}
+
+    def buckets(self, now: float) -> List[Dict]:
+        """Every bucket of the window ending at `now`, oldest first"""
+        last = int(now // self.bucket_seconds)
+        return [self.bucket(number) for number in range(last - self.length + 1, last + 1)]
+
+class UsageFeed:
+    """Live usage aggregates, pushed to dashboards as Server-Sent Events
+
+    Recording a usage record updates the ring series and remembers which
+    buckets changed, in O(1). Every USAGE_FEED_INTERVAL seconds, if
+    anything changed, one delta message (changed totals, changed buckets and
+    the new calls) is encoded once and appended to a shared backlog; every
+    subscriber then sends those same bytes. The cost of an event does not
+    grow with the number of dashboards watching, and a subscriber that falls
+    further behind than the backlog gets a fresh snapshot instead.
+    """
+
+    def __init__(self, interval: float = None, backlog: int = None, recent_calls: int = None,
+                 keepalive: float = None):
+        """Initialize the feed
+
+        Args:
+            interval: Seconds between delta messages
+            backlog: Delta messages kept for subscribers that are behind
+            recent_calls: Calls included in a snapshot, and at most in one delta
+            keepalive: Seconds of silence after which a comment line is sent
+        """
+        self.interval = interval or config.USAGE_FEED_INTERVAL
+        self.keepalive = keepalive or config.USAGE_FEED_KEEPALIVE
+        recent_calls = recent_calls or config.USAGE_FEED_RECENT_CALLS
+        self.series = {name: RingSeries(*spec) for name, spec in SERIES.items()}
+        self._summary: Callable[[], Dict] = dict
+
+        self._recent_calls: Deque[Dict] = deque(maxlen=recent_calls)
+        self._new_calls: Deque[Dict] = deque(maxlen=recent_calls)
+        self._dirty: Dict[str, Set[int]] = {name: set() for name in SERIES}
+        self._sent_totals: Dict = {}
+        # Set when the totals changed without a usage record, so the next delta is sent anyway
+        self._touched = False
+
+        # (sequence number, encoded event) for the last `backlog` deltas
+        self._messages: Deque[Tuple[int, bytes]] = deque(maxlen=backlog or config.USAGE_FEED_BACKLOG)
+        self._seq = 0
+        self._changed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.subscribers = 0
+        self.records = 0
+        self.deltas = 0
+
+    def attach(self, summary: Callable[[], Dict]):
+        """Set the function returning the usage totals (CostTracker.get_usage_summary)"""
+        self._summary = summary
+
+    def record(self, record: Dict):
+        """Fold one usage record into the live aggregates"""
+        now = time.time()
+        counts = record_counts(record)
+        for name, series in self.series.items():
+            self._dirty[name].add(series.add(now, counts))
+        # Shaped like a usage store row, so cancelled calls show zero tokens and cost
+        call = {"input_tokens": 0, "output_tokens": 0, "total_cost": 0.0, **record}
+        call.setdefault("type", "call")
+        self._recent_calls.append(call)
+        self._new_calls.append(call)
+        self.records += 1
+
+    def touch(self):
+        """Send a delta at the next interval even if nothing is recorded before it"""
+        self._touched = True
+
+    def start(self):
+        """Start sending deltas from the running event loop"""
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Server-Sent Events for one subscriber: a snapshot, then deltas as they happen"""
+        self.start()
+        self.subscribers += 1
+        try:
+            yield self._event("snapshot", self._snapshot())
+            cursor = self._seq
+            while True:
+                if self._seq == cursor:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), self.keepalive)
+                    except asyncio.TimeoutError:
+                        # Keeps proxies from closing an idle connection
+                        yield b": keepalive\n\n"
+                        continue
+                if self._seq - cursor > len(self._messages):
+                    # Too far behind for the backlog
+                    pending = [self._event("snapshot", self._snapshot())]
+                else:
+                    # Copied first: the backlog can change while this subscriber is sending
+                    pending = [message for seq, message in self._messages if seq > cursor]
+                cursor = self._seq
+                for message in pending:
+                    yield message
+        finally:
+            self.subscribers -= 1
+
+    def stats(self) -> Dict:
+        """Get subscriber and message counters"""
+        return {
+            "subscribers": self.subscribers,
+            "records": self.records,
+            "deltas": self.deltas
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"Error sending usage feed delta: {str(e)}")
+
+    def _flush(self):
+        """Encode one delta for everything recorded since the last one, if anyone is listening"""
+        if not self._new_calls and not self._touched:
+            return
+        if not self.subscribers:
+            # New subscribers start from a snapshot, so there is nothing to keep
+            self._clear_pending()
+            return
+        totals = self._summary()
+        changed = {key: value for key, value in totals.items() if self._sent_totals.get(key) != value}
+        self._sent_totals = totals
+        delta = {
+            "seq": self._seq + 1,
+            "totals": changed,
+            "buckets": {name: [self.series[name].bucket(number) for number in sorted(numbers)]
+                        for name, numbers in self._dirty.items()},
+            "calls": list(self._new_calls)[::-1]
+        }
+        self._clear_pending()
+        self._seq += 1
+        self._messages.append((self._seq, self._event("delta", delta, self._seq)))
+        self.deltas += 1
+        # Wake every waiting subscriber; the next delta waits on a new event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _clear_pending(self):
+        self._touched = False
+        self._new_calls.clear()
+        for numbers in self._dirty.values():
+            numbers.clear()
+
+    def _snapshot(self) -> Dict:
+        now = time.time()
+        totals = self._summary()
+        return {
+            "seq": self._seq,
+            "totals": totals,
+            "series": {name: series.buckets(now) for name, series in self.series.items()},
+            "calls": list(self._recent_calls)[::-1]
+        }
+
+    @staticmethod
+    def _event(name: str, data: Dict, seq: int = None) -> bytes:
+        event_id = f"id: {seq}\n" if seq is not None else ""
+        return f"{event_id}event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+
+# Create a singleton instance
+usage_feed = UsageFeed()
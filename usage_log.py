@@ -0,0 +1,428 @@
+import atexit
+import copy
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# Number of individual API calls kept in the usage history
+API_CALL_HISTORY = 1000
+
+SNAPSHOT_FORMAT_VERSION = 2
+
+def empty_usage_data() -> Dict:
+    """A new, empty usage aggregate structure"""
+    return {
+        "total_requests": 0,
+        "total_input_tokens": 0,
+        "total_output_tokens": 0,
+        "total_cost": 0.0,
+        "total_cancelled": 0,
+        "total_cache_hits": 0,
+        "total_speculative_requests": 0,
+        "total_speculative_cost": 0.0,
+        "requests_by_date": {},
+        "api_calls": []
+    }
+
+def apply_usage_record(usage_data: Dict, record: Dict):
+    """Fold one usage record into the aggregates
+
+    Records are API call entries tagged with a "type": "call" for upstream
+    calls, "cache_hit" for requests served from the suggestion cache,
+    "cancelled" for calls superseded before they completed and
+    "speculative" for calls prefetching a suggestion nobody asked for yet.
+    """
+    kind = record.get("type", "call")
+    day = record["timestamp"][:10]
+    day_usage = usage_data["requests_by_date"].setdefault(day, {
+        "requests": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "cost": 0.0
+    })
+
+    if kind == "cancelled":
+        # Cancelled calls do not add to the request totals; a hedge loser's tokens and cost do count
+        usage_data["total_cancelled"] += 1
+        day_usage["cancelled"] = day_usage.get("cancelled", 0) + 1
+        if record.get("total_cost"):
+            usage_data["total_input_tokens"] += record["input_tokens"]
+            usage_data["total_output_tokens"] += record["output_tokens"]
+            usage_data["total_cost"] += record["total_cost"]
+            day_usage["input_tokens"] += record["input_tokens"]
+            day_usage["output_tokens"] += record["output_tokens"]
+            day_usage["cost"] += record["total_cost"]
+        return
+
+    if kind == "speculative":
+        # Speculative calls are spend without a served request; kept apart so
+        # the prefetch hit rate can be weighed against what it costs
+        usage_data["total_speculative_requests"] = usage_data.get("total_speculative_requests", 0) + 1
+        usage_data["total_speculative_cost"] = usage_data.get("total_speculative_cost", 0.0) + record["total_cost"]
+        day_usage["speculative_requests"] = day_usage.get("speculative_requests", 0) + 1
+        day_usage["speculative_cost"] = day_usage.get("speculative_cost", 0.0) + record["total_cost"]
+    elif kind == "cache_hit":
+        # Cache hits are served requests but not upstream requests
+        usage_data["total_cache_hits"] += 1
+        day_usage["cache_hits"] = day_usage.get("cache_hits", 0) + 1
+    else:
+        usage_data["total_requests"] += 1
+        usage_data["total_input_tokens"] += record["input_tokens"]
+        usage_data["total_output_tokens"] += record["output_tokens"]
+        usage_data["total_cost"] += record["total_cost"]
+        day_usage["requests"] += 1
+        day_usage["input_tokens"] += record["input_tokens"]
+        day_usage["output_tokens"] += record["output_tokens"]
+        day_usage["cost"] += record["total_cost"]
+
+    api_calls = usage_data["api_calls"]
+    api_calls.append({k: v for k, v in record.items() if k != "type"})
+    if len(api_calls) > API_CALL_HISTORY:
+        del api_calls[:-API_CALL_HISTORY]
+
+class UsageLog:
+    """Append-only, batched log of usage records, shared by every worker process
+
+    Records are buffered in memory and appended to a JSON-lines file by a
+    background thread, so logging a call never waits on disk I/O. Each
+    process writes its own log files, named by generation and process id
+    and held under an flock while open. On startup the aggregates are
+    rebuilt from the latest snapshot plus every log file not yet folded into
+    it. Compaction closes the process's log and starts a new generation, then,
+    under an flock on the directory's lock file, folds every log file whose
+    owner has closed it (its flock is free, so its writer closed it or died)
+    into a new snapshot, which is atomically replaced, and deletes those
+    files. The snapshot lists the files it folded, so a crash at any point
+    leaves every record on disk exactly once.
+    """
+
+    def __init__(self, directory: Path, name: str = None, legacy_file: Optional[Path] = None,
+                 flush_interval: float = None, batch_size: int = None, fsync: str = None,
+                 fsync_interval: float = None, compact_records: int = None,
+                 sinks: Optional[List[Callable[[List[Dict]], None]]] = None):
+        """Initialize the usage log
+
+        Args:
+            directory: Directory holding the snapshot and log files
+            name: Base name of the snapshot and log files
+            legacy_file: Whole-file JSON usage data to migrate when there is no snapshot yet
+            flush_interval: Seconds between background flushes
+            batch_size: Number of buffered records that triggers an early flush
+            fsync: "always", "interval" or "never"
+            fsync_interval: Seconds between fsyncs with the "interval" policy
+            compact_records: Number of logged records after which the log is compacted
+            sinks: Callables that also receive each flushed batch of records, on the flusher thread
+        """
+        self.directory = Path(directory)
+        self.name = name or config.USAGE_LOG_NAME
+        self.legacy_file = legacy_file
+        self.flush_interval = flush_interval or config.USAGE_LOG_FLUSH_INTERVAL
+        self.batch_size = batch_size or config.USAGE_LOG_BATCH_SIZE
+        self.fsync = fsync or config.USAGE_LOG_FSYNC
+        self.fsync_interval = fsync_interval or config.USAGE_LOG_FSYNC_INTERVAL
+        self.compact_records = compact_records or config.USAGE_LOG_COMPACT_RECORDS
+        self.sinks = list(sinks or [])
+        if self.fsync not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown fsync policy: {self.fsync}")
+
+        self.snapshot_file = self.directory / f"{self.name}.snapshot.json"
+        self.lock_file = self.directory / f"{self.name}.lock"
+
+        # Records this process logged since its last compaction, owned by whoever holds _io_lock
+        self._records_since_snapshot = 0
+        # This process's open log file, flocked until it is closed
+        self._file = None
+        self._last_fsync = time.monotonic()
+        self._lock_fd: Optional[int] = None
+
+        self._buffer: List[Dict] = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self) -> Dict:
+        """Rebuild the aggregates from disk and start the background flusher
+
+        Returns:
+            The aggregates, for the caller to keep updating in memory
+        """
+        with self._io_lock, self._locked():
+            snapshot = self._read_snapshot()
+            legacy = None if snapshot else self._read_legacy()
+            state = snapshot["usage_data"] if snapshot else copy.deepcopy(legacy) or empty_usage_data()
+            folded = self._folded(snapshot)
+
+            replayed = 0
+            for _, path in self._log_files():
+                # Files folded by an interrupted compaction are already in the snapshot; it deletes them
+                if path.name not in folded:
+                    replayed += self._replay(path, state)
+
+            # Open this process's log, and fold the logs other processes have closed
+            self._compact(legacy)
+            logger.info(f"Usage log loaded: {replayed} records replayed")
+
+        self._start()
+        return state
+
+    def append(self, record: Dict):
+        """Queue a record for the next background flush"""
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self._wake.set()
+
+    def flush(self):
+        """Write all buffered records to the log"""
+        with self._io_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return
+
+            if self._file is None:
+                with self._locked():
+                    self._open_log(self._next_generation(self._read_snapshot()))
+            self._file.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records))
+            self._file.flush()
+            now = time.monotonic()
+            if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+            self._records_since_snapshot += len(records)
+            for sink in self.sinks:
+                try:
+                    sink(records)
+                except Exception as e:
+                    logger.error(f"Error writing usage records to {sink}: {str(e)}")
+            if self._records_since_snapshot >= self.compact_records:
+                with self._locked():
+                    self._compact()
+
+    def compact(self):
+        """Flush, then fold every closed log into a new snapshot"""
+        self.flush()
+        with self._io_lock, self._locked():
+            self._compact()
+
+    def close(self):
+        """Stop the background flusher and make every record durable
+
+        The closed log is folded into the snapshot by the next compaction in
+        any process.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._io_lock:
+            self._close_log()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="usage-log-flusher", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing usage log: {str(e)}")
+
+    @contextmanager
+    def _locked(self):
+        """Hold an exclusive flock on the lock file, serializing snapshots across processes"""
+        if self._lock_fd is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _compact(self, legacy: Optional[Dict] = None):
+        """Start a new log generation and fold every closed log into the snapshot
+
+        The caller holds _io_lock and the lock file.
+
+        Args:
+            legacy: The legacy usage data, if the caller already read it
+        """
+        self._close_log()
+        snapshot = self._read_snapshot()
+        if snapshot is None and legacy is None:
+            legacy = self._read_legacy()
+        state = snapshot["usage_data"] if snapshot else legacy or empty_usage_data()
+        already_folded = self._folded(snapshot)
+        generation = self._next_generation(snapshot)
+        self._open_log(generation)
+
+        folded = []
+        try:
+            for _, path in self._log_files():
+                if path.name == self._file_name(generation):
+                    continue
+                if path.name in already_folded:
+                    # Left behind by a compaction interrupted after its snapshot was written
+                    path.unlink(missing_ok=True)
+                    continue
+                fd = self._try_lock(path)
+                if fd is None:
+                    # Still open in another process
+                    continue
+                folded.append((path, fd))
+                self._replay(path, state)
+
+            tmp_path = self.snapshot_file.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "version": SNAPSHOT_FORMAT_VERSION,
+                    "generation": generation,
+                    "folded": [path.name for path, _ in folded],
+                    "usage_data": state
+                }, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_file)
+
+            for path, _ in folded:
+                path.unlink(missing_ok=True)
+        finally:
+            for _, fd in folded:
+                os.close(fd)
+        self._records_since_snapshot = 0
+
+    def _open_log(self, generation: int):
+        """Create this process's log file for a generation and flock it (caller holds the lock file)"""
+        self._file = open(self.directory / self._file_name(generation), "x", encoding="utf-8")
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def _close_log(self):
+        """Close this process's log file, releasing its flock (caller holds _io_lock)"""
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+    def _next_generation(self, snapshot: Optional[Dict]) -> int:
+        """A generation above every one issued so far (caller holds the lock file)"""
+        generations = [generation for generation, _ in self._log_files()]
+        if snapshot is not None:
+            generations.append(snapshot["generation"])
+        return max(generations, default=0) + 1
+
+    def _file_name(self, generation: int) -> str:
+        return f"{self.name}.{generation}.{os.getpid()}.jsonl"
+
+    def _log_files(self) -> List[Tuple[int, Path]]:
+        """Existing log files of every process, oldest generation first
+
+        Names are <name>.<generation>.<pid>.jsonl, or <name>.<generation>.jsonl
+        as written before logs were per process.
+        """
+        files = []
+        for path in self.directory.glob(f"{self.name}.*.jsonl"):
+            parts = path.name[len(self.name) + 1:-len(".jsonl")].split(".")
+            if len(parts) <= 2 and all(part.isdigit() for part in parts):
+                files.append((int(parts[0]), path))
+        return sorted(files)
+
+    @staticmethod
+    def _try_lock(path: Path) -> Optional[int]:
+        """Open and flock a log file if no process holds it open, returning the descriptor"""
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _replay(self, path: Path, state: Dict) -> int:
+        """Apply every complete record in a log file to state, returning how many were applied"""
+        count = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn write from a crash can only affect the last line
+                    logger.warning(f"Skipping unreadable record in {path}")
+                    continue
+                apply_usage_record(state, record)
+                count += 1
+        return count
+
+    def _read_snapshot(self) -> Optional[Dict]:
+        if not self.snapshot_file.exists():
+            return None
+        try:
+            with open(self.snapshot_file, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Error loading usage snapshot from {self.snapshot_file}. Rebuilding from logs.")
+            return None
+        if snapshot.get("version") not in (1, SNAPSHOT_FORMAT_VERSION):
+            logger.error(f"Unsupported usage snapshot version in {self.snapshot_file}. Rebuilding from logs.")
+            return None
+        return snapshot
+
+    def _folded(self, snapshot: Optional[Dict]) -> Set[str]:
+        """Names of the log files the snapshot already includes"""
+        if snapshot is None:
+            return set()
+        if snapshot["version"] == 1:
+            # Version 1 snapshots cover every single-process log of an earlier generation
+            return {f"{self.name}.{generation}.jsonl" for generation in range(1, snapshot["generation"])}
+        return set(snapshot["folded"])
+
+    def _read_legacy(self) -> Optional[Dict]:
+        """Load usage data from the old whole-file JSON format"""
+        if self.legacy_file is None or not self.legacy_file.exists():
+            return None
+        try:
+            with open(self.legacy_file, "r") as f:
+                usage_data = json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Error loading usage data from {self.legacy_file}. Creating new data.")
+            return None
+        # Older logs predate cancellation and cache tracking
+        for key, value in empty_usage_data().items():
+            usage_data.setdefault(key, value)
+        logger.info(f"Migrating usage data from {self.legacy_file}")
+        return usage_data
@@ -0,0 +1,255 @@
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS api_calls (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    type TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    input_cost REAL NOT NULL DEFAULT 0,
+    output_cost REAL NOT NULL DEFAULT 0,
+    total_cost REAL NOT NULL DEFAULT 0,
+    duration REAL,
+    time_to_first_token REAL,
+    success INTEGER,
+    prefix_match INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_api_calls_ts ON api_calls (ts);
+CREATE INDEX IF NOT EXISTS idx_api_calls_model_ts ON api_calls (model, ts);
+CREATE INDEX IF NOT EXISTS idx_api_calls_success_ts ON api_calls (success, ts);
+"""
+
+_COLUMNS = ("ts", "timestamp", "type", "model", "input_tokens", "output_tokens", "input_cost",
+            "output_cost", "total_cost", "duration", "time_to_first_token", "success",
+            "prefix_match", "error")
+
+_INSERT = f"INSERT INTO api_calls ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+
+# strftime formats used to group calls into time buckets (local time)
+BUCKET_FORMATS = {
+    "minute": "%Y-%m-%dT%H:%M",
+    "hour": "%Y-%m-%dT%H:00",
+    "day": "%Y-%m-%d"
+}
+
+PERCENTILES = (50, 90, 99)
+
+class UsageStore:
+    """Queryable history of every usage record, backed by SQLite
+
+    The in-memory usage data only keeps the most recent API calls; the store
+    keeps all of them, indexed by time, model and outcome, so the dashboard
+    can page through calls and aggregate any time window without loading the
+    whole history. The database runs in WAL mode so the usage log flusher can
+    insert while request handlers read. Each thread uses its own connection.
+    """
+
+    def __init__(self, path: Path = None):
+        """Open (creating if needed) the usage database
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = Path(path or config.USAGE_STORE_FILE)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+        connection.commit()
+
+    def insert_records(self, records: Iterable[Dict]):
+        """Store a batch of usage records (see usage_log.apply_usage_record for the format)"""
+        connection = self._connection()
+        with connection:
+            connection.executemany(_INSERT, self._rows(records))
+
+    def seed(self, records: Iterable[Dict]) -> bool:
+        """Store records only if the store is empty, as one step across processes
+
+        Every worker seeds a new store with the call history at startup; the
+        check and the insert share an immediate (write-locked) transaction, so
+        only the first worker's records go in.
+
+        Returns:
+            Whether the records were stored
+        """
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            if connection.execute("SELECT 1 FROM api_calls LIMIT 1").fetchone() is not None:
+                return False
+            connection.executemany(_INSERT, self._rows(records))
+        return True
+
+    @staticmethod
+    def _rows(records: Iterable[Dict]) -> List[tuple]:
+        rows = []
+        for record in records:
+            kind = record.get("type", "cache_hit" if record.get("cached") else "call")
+            success = record.get("success")
+            rows.append((
+                datetime.fromisoformat(record["timestamp"]).timestamp(),
+                record["timestamp"],
+                kind,
+                record["model"],
+                record.get("input_tokens", 0),
+                record.get("output_tokens", 0),
+                record.get("input_cost", 0.0),
+                record.get("output_cost", 0.0),
+                record.get("total_cost", 0.0),
+                record.get("duration"),
+                record.get("time_to_first_token"),
+                None if success is None else int(success),
+                int(record["prefix_match"]) if "prefix_match" in record else None,
+                record.get("error")
+            ))
+        return rows
+
+    def query_calls(self, start: Optional[float] = None, end: Optional[float] = None,
+                    model: Optional[str] = None, success: Optional[bool] = None,
+                    limit: int = 50, before_id: Optional[int] = None) -> Dict:
+        """Get one page of calls, newest first
+
+        Args:
+            start: Only calls at or after this Unix time
+            end: Only calls before this Unix time
+            model: Only calls to this model
+            success: Only successful (True) or failed (False) calls
+            limit: Page size
+            before_id: Cursor from the previous page's next_before_id
+
+        Returns:
+            {"calls": [...], "next_before_id": cursor for the next page or None}
+        """
+        where, params = self._filters(start, end, model, success)
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(before_id)
+        rows = self._connection().execute(
+            f"SELECT id, {', '.join(_COLUMNS)} FROM api_calls {self._where(where)} "
+            "ORDER BY id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        calls = []
+        for row in rows[:limit]:
+            call = dict(zip(("id",) + _COLUMNS, row))
+            call["success"] = None if call["success"] is None else bool(call["success"])
+            call["cached"] = call["type"] == "cache_hit"
+            call["prefix_match"] = None if call["prefix_match"] is None else bool(call["prefix_match"])
+            calls.append(call)
+        return {
+            "calls": calls,
+            "next_before_id": calls[-1]["id"] if len(rows) > limit else None
+        }
+
+    def aggregate(self, start: Optional[float] = None, end: Optional[float] = None,
+                  model: Optional[str] = None, bucket: str = "hour") -> Dict:
+        """Aggregate usage over a time window
+
+        Args:
+            start: Window start as Unix time
+            end: Window end as Unix time
+            model: Only calls to this model
+            bucket: "minute", "hour" or "day"
+
+        Returns:
+            Per-bucket request, cache hit, cancellation, failure, token and cost
+            totals (speculative prefetch calls counted apart), the totals for the whole window, and duration and time to
+            first token percentiles of upstream calls
+        """
+        if bucket not in BUCKET_FORMATS:
+            raise ValueError(f"Unknown bucket: {bucket}")
+        where, params = self._filters(start, end, model, None)
+        connection = self._connection()
+
+        sums = """
+            SUM(type = 'call'), SUM(type = 'cache_hit'), SUM(type = 'cancelled'),
+            SUM(type = 'call' AND success = 0),
+            SUM(CASE WHEN type != 'speculative' THEN input_tokens END),
+            SUM(CASE WHEN type != 'speculative' THEN output_tokens END),
+            SUM(CASE WHEN type != 'speculative' THEN total_cost END),
+            SUM(type = 'speculative'), SUM(CASE WHEN type = 'speculative' THEN total_cost END)
+        """
+        names = ("requests", "cache_hits", "cancelled", "failures", "input_tokens", "output_tokens", "cost",
+                 "speculative_requests", "speculative_cost")
+        rows = connection.execute(
+            f"SELECT strftime(?, ts, 'unixepoch', 'localtime') AS bucket, {sums} "
+            f"FROM api_calls {self._where(where)} GROUP BY bucket ORDER BY bucket",
+            [BUCKET_FORMATS[bucket]] + params
+        ).fetchall()
+        buckets = [{"bucket": row[0], **dict(zip(names, (v or 0 for v in row[1:])))} for row in rows]
+        totals = {name: sum(b[name] for b in buckets) for name in names}
+
+        where.append("type = 'call'")
+        return {
+            "bucket": bucket,
+            "buckets": buckets,
+            "totals": totals,
+            "duration_percentiles": self._percentiles(connection, "duration", where, params),
+            "time_to_first_token_percentiles": self._percentiles(connection, "time_to_first_token", where, params)
+        }
+
+    def _percentiles(self, connection: sqlite3.Connection, column: str,
+                     where: List[str], params: List) -> Dict[str, Optional[float]]:
+        """Nearest-rank percentiles of a column over the filtered calls
+
+        The column is read once and sorted here, rather than sorted by SQLite once per percentile.
+        """
+        where = where + [f"{column} IS NOT NULL"]
+        values = sorted(row[0] for row in connection.execute(
+            f"SELECT {column} FROM api_calls {self._where(where)}", params
+        ))
+        count = len(values)
+        return {
+            f"p{p}": values[max(0, -(-p * count // 100) - 1)] if count else None
+            for p in PERCENTILES
+        }
+
+    @staticmethod
+    def _filters(start, end, model, success):
+        where, params = [], []
+        if start is not None:
+            where.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("ts < ?")
+            params.append(end)
+        if model is not None:
+            where.append("model = ?")
+            params.append(model)
+        if success is not None:
+            where.append("success = ?")
+            params.append(int(success))
+        return where, params
+
+    @staticmethod
+    def _where(where: List[str]) -> str:
+        return f"WHERE {' AND '.join(where)}" if where else ""
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
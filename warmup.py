@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import config
+from llm_service import get_llm, get_http_async_client
+from spell_checker import spell_checker, correct_spelling_async
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# The default base URL of the Groq client
+GROQ_DEFAULT_BASE = "https://api.groq.com"
+
+class WarmUp:
+    """Work a worker does at startup, before it reports ready
+
+    Importing the app defers everything slow to first use, so a new worker
+    boots fast. This does that first use ahead of traffic, in the
+    background, while /ready answers 503:
+
+    - spell_checker: load the spell index and run a correction, which also
+      starts the worker pool with the index already loaded
+    - llm_client: import LangChain and create the default model's client
+    - http_pool: open WARMUP_CONNECTIONS connections to the API host
+
+    A failed step is logged and reported, but does not keep the worker from
+    becoming ready: it serves what it can, as it would without warm-up.
+    """
+
+    def __init__(self, connections: int = None, step_timeout: float = None):
+        """Initialize the warm-up
+
+        Args:
+            connections: Upstream connections to open
+            step_timeout: Seconds each step may take
+        """
+        self.connections = config.WARMUP_CONNECTIONS if connections is None else connections
+        self.step_timeout = step_timeout or config.WARMUP_STEP_TIMEOUT
+        self.ready = False
+        self.steps: Dict[str, Dict] = {}
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start warming up on the running event loop"""
+        if self._task is None:
+            self.started_at = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict:
+        """Get readiness and the duration and outcome of each step"""
+        return {
+            "ready": self.ready,
+            "seconds": (self.ready_at or time.monotonic()) - self.started_at if self.started_at else 0.0,
+            "steps": self.steps
+        }
+
+    async def _run(self):
+        await self._step("spell_checker", self._warm_spell_checker)
+        await self._step("llm_client", self._warm_llm_client)
+        await self._step("http_pool", self._warm_http_pool)
+        self.ready = True
+        self.ready_at = time.monotonic()
+        logger.info(f"Worker ready after {self.ready_at - self.started_at:.2f}s of warm-up")
+
+    async def _step(self, name: str, warm: Callable[[], Awaitable[None]]):
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(warm(), self.step_timeout)
+            self.steps[name] = {"ok": True, "seconds": time.monotonic() - start}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            self.steps[name] = {"ok": False, "seconds": time.monotonic() - start, "error": error}
+            logger.warning(f"Warm-up step {name} failed: {error}")
+
+    async def _warm_spell_checker(self):
+        # Off the event loop: /ready must keep answering while the index loads
+        await asyncio.to_thread(spell_checker.load)
+        await correct_spelling_async("Warm up teh spell checker")
+
+    async def _warm_llm_client(self):
+        await asyncio.to_thread(get_llm)
+
+    async def _warm_http_pool(self):
+        # Any response will do: the point is the DNS lookup and TCP/TLS handshakes,
+        # after which the connections stay in the pool for the first calls
+        client = get_http_async_client()
+        url = config.GROQ_API_BASE or GROQ_DEFAULT_BASE
+        await asyncio.gather(*(client.head(url) for _ in range(self.connections)))
+
+# Create a singleton instance
+warmup = WarmUp()
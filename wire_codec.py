@@ -0,0 +1,214 @@
+import logging
+import struct
+from typing import Any, Dict, Iterable, Optional, Union
+
+import config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# WebSocket subprotocols; clients offer them in order of preference
+BINARY_PROTOCOL = "suggest.bin.v1"
+JSON_PROTOCOL = "suggest.json"
+
+# Keys of the messages exchanged with clients, sent as their index in this table.
+# Shared with static/js/wire-codec.js: only ever append, or old clients misread frames
+KEYS = (
+    # Client messages
+    "text", "edits", "length", "request_id", "deadline_ms",
+    # Suggestion frames
+    "suggestion", "delta", "seq", "done", "source", "cached", "similarity", "confidence",
+    "fallback", "error", "resync", "rate_limited", "shed", "spelling_correction", "original",
+    "corrected", "usage",
+    # Usage of a suggestion
+    "model", "hedged", "input_tokens", "output_tokens", "token_count_source", "cost", "duration",
+    "time_to_first_token", "queue_wait", "queue_depth", "context_chars_omitted",
+    "input_tokens_saved", "bytes_received", "bytes_saved",
+    # Upstream circuit breaker
+    "circuit_open", "debounce_ms"
+)
+_KEY_CODES = {key: code for code, key in enumerate(KEYS, 1)}
+
+# Frame kinds, the first byte of a binary frame
+DELTA_FRAME = 0x01  # request id, seq, then the delta text to the end of the frame
+MESSAGE_FRAME = 0x02  # one encoded value, a dict for every message sent today
+
+# Value tags
+_NULL, _FALSE, _TRUE, _UINT, _NEGINT, _FLOAT, _STR, _LIST, _DICT = range(9)
+_FLOAT64 = struct.Struct("<d")
+
+def negotiate(offered: Iterable[str]) -> Optional[str]:
+    """Pick the subprotocol for a connection from those the client offered
+
+    The client's order of preference is kept. Clients that offer nothing get
+    JSON without a subprotocol, as before negotiation existed.
+
+    Returns:
+        The subprotocol to accept, or None
+    """
+    for protocol in offered:
+        if protocol == BINARY_PROTOCOL and config.ENABLE_BINARY_PROTOCOL:
+            return protocol
+        if protocol == JSON_PROTOCOL:
+            return protocol
+    return None
+
+def encode_frame(message: Dict) -> bytes:
+    """Encode a message sent to the client as a binary frame
+
+    Streamed deltas, the bulk of the frames, take the fixed DELTA_FRAME
+    layout: a few bytes of header before the text. Everything else is a
+    MESSAGE_FRAME holding the message as a tagged value.
+    """
+    if len(message) == 3 and "delta" in message:
+        request_id = message.get("request_id")
+        seq = message.get("seq")
+        delta = message["delta"]
+        if type(request_id) is int and type(seq) is int and request_id >= 0 and seq >= 0 and isinstance(delta, str):
+            out = bytearray((DELTA_FRAME,))
+            _write_uint(request_id, out)
+            _write_uint(seq, out)
+            out += delta.encode("utf-8")
+            return bytes(out)
+    out = bytearray((MESSAGE_FRAME,))
+    _write_value(message, out)
+    return bytes(out)
+
+def decode_frame(data: bytes) -> Any:
+    """Decode a binary frame from either side
+
+    Raises:
+        ValueError: If the frame is truncated or malformed
+    """
+    try:
+        kind = data[0]
+        if kind == DELTA_FRAME:
+            request_id, pos = _read_uint(data, 1)
+            seq, pos = _read_uint(data, pos)
+            return {"delta": data[pos:].decode("utf-8"), "seq": seq, "request_id": request_id}
+        if kind == MESSAGE_FRAME:
+            value, pos = _read_value(data, 1)
+            if pos != len(data):
+                raise ValueError(f"{len(data) - pos} trailing bytes")
+            return value
+        raise ValueError(f"Unknown frame kind {kind}")
+    except (IndexError, UnicodeDecodeError, struct.error, RecursionError) as e:
+        raise ValueError(f"Malformed frame: {str(e)}") from e
+
+def _write_uint(value: int, out: bytearray):
+    """Unsigned LEB128 varint: 7 bits per byte, high bit set on all but the last"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_uint(data: bytes, pos: int):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+def _write_str(value: str, out: bytearray):
+    encoded = value.encode("utf-8")
+    _write_uint(len(encoded), out)
+    out += encoded
+
+def _write_value(value: Any, out: bytearray):
+    # Exact type checks first: they cover nearly every value and bool is a subclass of int
+    kind = type(value)
+    if kind is str:
+        out.append(_STR)
+        _write_str(value, out)
+    elif kind is float:
+        out.append(_FLOAT)
+        out += _FLOAT64.pack(value)
+    elif kind is bool:
+        out.append(_TRUE if value else _FALSE)
+    elif kind is int:
+        if value >= 0:
+            out.append(_UINT)
+            _write_uint(value, out)
+        else:
+            out.append(_NEGINT)
+            _write_uint(-1 - value, out)
+    elif value is None:
+        out.append(_NULL)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _write_uint(len(value), out)
+        for key, item in value.items():
+            code = _KEY_CODES.get(key)
+            if code is None:
+                # Keys outside the table are sent by name after a zero code
+                out.append(0)
+                _write_str(str(key), out)
+            else:
+                _write_uint(code, out)
+            _write_value(item, out)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_uint(len(value), out)
+        for item in value:
+            _write_value(item, out)
+    else:
+        raise TypeError(f"Cannot encode {kind.__name__}")
+
+def _read_str(data: bytes, pos: int):
+    length, pos = _read_uint(data, pos)
+    end = pos + length
+    if end > len(data):
+        raise IndexError("string runs past the end of the frame")
+    return data[pos:end].decode("utf-8"), end
+
+def _read_value(data: bytes, pos: int):
+    tag = data[pos]
+    pos += 1
+    if tag == _STR:
+        return _read_str(data, pos)
+    if tag == _UINT:
+        return _read_uint(data, pos)
+    if tag == _FLOAT:
+        return _FLOAT64.unpack_from(data, pos)[0], pos + 8
+    if tag == _DICT:
+        count, pos = _read_uint(data, pos)
+        result = {}
+        for _ in range(count):
+            code, pos = _read_uint(data, pos)
+            if code == 0:
+                key, pos = _read_str(data, pos)
+            elif code <= len(KEYS):
+                key = KEYS[code - 1]
+            else:
+                raise ValueError(f"Unknown key code {code}")
+            result[key], pos = _read_value(data, pos)
+        return result, pos
+    if tag == _LIST:
+        count, pos = _read_uint(data, pos)
+        result = []
+        for _ in range(count):
+            item, pos = _read_value(data, pos)
+            result.append(item)
+        return result, pos
+    if tag == _NEGINT:
+        value, pos = _read_uint(data, pos)
+        return -1 - value, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _NULL:
+        return None, pos
+    raise ValueError(f"Unknown value tag {tag}")
+
+def frame_bytes(data: Union[str, bytes]) -> int:
+    """Size of a received frame in bytes"""
+    return len(data) if isinstance(data, bytes) else len(data.encode("utf-8"))